@@ -0,0 +1,97 @@
+"""
+Micro-benchmark de extracción de reseñas
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Compara, sobre los HTML guardados en benchmarks/fixtures, el análisis del body completo con BeautifulSoup
+(html.parser y lxml) frente a la extracción con XPath de lxml. Con --browser se mide además el camino real de
+Playwright: serializar el body con inner_html y analizarlo en Python frente a leer el texto de los nodos
+directamente en la página.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/bench_extraction.py --repeat 20 [--browser]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+# review_fixtures añade además la carpeta server a sys.path
+from review_fixtures import SITES, read_fixture
+from review_pagination import COLLECT_NEW_TEXTS_JS, SEEN_ATTRIBUTE, extract_reviews_from_html, lxml
+
+
+def measure(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def bench_parsers(html, selector, repeat):
+    parsers = ["html.parser"]
+    if lxml is not None:
+        parsers += ["bs4-lxml", "lxml"]
+    results = {}
+    for parser in parsers:
+        median_ms, reviews = measure(lambda: extract_reviews_from_html(html, selector, parser), repeat)
+        results[parser] = (median_ms, reviews)
+    return results
+
+
+async def bench_browser(html, selector, repeat):
+    from playwright.async_api import async_playwright
+
+    async with async_playwright() as pw:
+        browser = await pw.chromium.launch(headless=True)
+        page = await browser.new_page()
+        await page.set_content(html)
+        results = {}
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = await page.inner_html('body')
+            reviews = extract_reviews_from_html(body, selector, "html.parser")
+            timings.append((time.perf_counter() - start) * 1000)
+        results["inner_html + bs4"] = (statistics.median(timings), reviews)
+
+        timings = []
+        for _ in range(repeat):
+            await page.evaluate("(attribute) => document.querySelectorAll(`[${attribute}]`).forEach(n => n.removeAttribute(attribute))", SEEN_ATTRIBUTE)
+            start = time.perf_counter()
+            texts = await page.evaluate(COLLECT_NEW_TEXTS_JS, [selector, SEEN_ATTRIBUTE])
+            reviews = [text.strip() for text in texts]
+            timings.append((time.perf_counter() - start) * 1000)
+        results["dom textContent"] = (statistics.median(timings), reviews)
+
+        await browser.close()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark de extracción de reseñas")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--browser", action="store_true", help="Medir también la extracción con Playwright")
+    args = parser.parse_args()
+
+    for site, selector in SITES.items():
+        html = read_fixture(site)
+
+        results = bench_parsers(html, selector, args.repeat)
+        if args.browser:
+            results.update(asyncio.run(bench_browser(html, selector, args.repeat)))
+
+        baseline = results["html.parser"][1]
+        print(f"\n{site} ({len(html) / 1024:.0f} KB, {len(baseline)} reseñas)")
+        for method, (median_ms, reviews) in results.items():
+            same = "ok" if reviews == baseline else "DIFERENTE"
+            print(f"  {method:<20} {median_ms:8.2f} ms  [{same}]")
+
+
+if __name__ == "__main__":
+    main()
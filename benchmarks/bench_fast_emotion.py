@@ -0,0 +1,69 @@
+"""
+Benchmark del modo rápido de emociones
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Compara el modo exacto (zero-shot, una pasada por etiqueta) con el modo rápido (una pasada del codificador y la
+capa destilada de server/fast_emotion.py) sobre las reseñas de benchmarks/fixtures o de un fichero de texto:
+tiempo por reseña, aceleración, coincidencia de la emoción predominante y diferencia media de puntuaciones. Las
+reseñas deben ser distintas de las usadas para entrenar la capa. La caché de inferencia no interviene.
+
+Uso (desde la raíz del repositorio, con la capa ya entrenada):
+    python benchmarks/bench_fast_emotion.py [--input reseñas.txt] [--repeat 3] [--reduction weighted_mean]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+# review_fixtures añade además la carpeta server a sys.path
+from review_fixtures import load_texts
+from inference import (INFERENCE_BATCH_SIZE, _predict_emotion_fast_uncached, _predict_emotion_uncached,
+                       CHUNK_REDUCTIONS, emotion_labels, emotion_model_name, fast_emotion_head, model_registry,
+                       resolve_chunk_reduction)
+
+
+def measure(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modo exacto frente a modo rápido de emociones")
+    parser.add_argument("--input", help="Fichero de texto con una reseña por línea")
+    parser.add_argument("--limit", type=int, default=120)
+    parser.add_argument("--batch-size", type=int, default=INFERENCE_BATCH_SIZE)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--reduction", choices=CHUNK_REDUCTIONS, help="Combinación de fragmentos (por defecto la del servidor)")
+    args = parser.parse_args()
+
+    if not fast_emotion_head.available(emotion_labels, emotion_model_name):
+        sys.exit(f"No hay capa rápida entrenada en {fast_emotion_head.path}; ejecuta antes server/fast_emotion.py.")
+    texts = load_texts(args.input, args.limit)
+    model_registry.warm_up(["emotion"])
+    reduction = resolve_chunk_reduction(args.reduction)
+
+    exact, exact_time = measure(lambda: _predict_emotion_uncached(texts, args.batch_size, None, emotion_labels, reduction),
+                                args.repeat)
+    fast, fast_time = measure(lambda: _predict_emotion_fast_uncached(texts, args.batch_size, None, reduction), args.repeat)
+
+    pairs = [(e, f) for e, f in zip(exact, fast) if e is not None and f is not None]
+    agreement = sum(e["labels"][0] == f["labels"][0] for e, f in pairs) / len(pairs)
+    score_diffs = [abs(dict(zip(e["labels"], e["scores"]))[label] - dict(zip(f["labels"], f["scores"]))[label])
+                   for e, f in pairs for label in emotion_labels]
+
+    print(f"{len(texts)} reseñas, lote {args.batch_size}, mediana de {args.repeat} repeticiones")
+    print(f"  exacto  {exact_time / len(texts) * 1000:8.2f} ms/reseña")
+    print(f"  rápido  {fast_time / len(texts) * 1000:8.2f} ms/reseña  (x{exact_time / fast_time:.1f})")
+    print(f"  coincidencia de la emoción predominante  {agreement:.2%}")
+    print(f"  diferencia media de puntuación           {statistics.mean(score_diffs):.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Comprobación de paridad entre backends de inferencia
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Ejecuta los modelos de sentimiento y emociones con PyTorch (referencia) y con el backend candidato sobre las
+reseñas de benchmarks/fixtures (o un fichero de texto con una reseña por línea) y compara los resultados:
+coincidencia de etiquetas, diferencia máxima y media de puntuaciones y tiempo por reseña de cada backend.
+Termina con código de salida 1 si la coincidencia de etiquetas queda por debajo de --min-agreement.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/check_backend_parity.py --backend onnx [--model sentiment|emotion|all] [--input reseñas.txt]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+# review_fixtures añade además la carpeta server a sys.path
+from review_fixtures import load_texts
+from inference import emotion_labels, emotion_model_name, model_name
+from inference_backends import BACKENDS, build_pipeline
+
+MODELS = {
+    "sentiment": ("text-classification", model_name),
+    "emotion": ("zero-shot-classification", emotion_model_name),
+}
+
+
+def run(pipe, key, texts, batch_size):
+    start = time.perf_counter()
+    if key == "sentiment":
+        outputs = pipe(texts, batch_size=batch_size, truncation=True)
+        results = [(output["label"], {output["label"]: output["score"]}) for output in outputs]
+    else:
+        outputs = pipe(texts, candidate_labels=emotion_labels, batch_size=batch_size * len(emotion_labels))
+        results = [(output["labels"][0], dict(zip(output["labels"], output["scores"]))) for output in outputs]
+    return results, (time.perf_counter() - start) / len(texts)
+
+
+def compare(key, texts, backend, batch_size):
+    task, model = MODELS[key]
+    reference, reference_time = run(build_pipeline(task, model, "pytorch"), key, texts, batch_size)
+    candidate, candidate_time = run(build_pipeline(task, model, backend), key, texts, batch_size)
+
+    agreement = sum(ref[0] == cand[0] for ref, cand in zip(reference, candidate)) / len(texts)
+    # La diferencia de puntuación se mide sobre las etiquetas presentes en ambos resultados
+    diffs = [abs(ref[1][label] - cand[1][label])
+             for ref, cand in zip(reference, candidate) for label in ref[1] if label in cand[1]]
+    return {
+        "label_agreement": agreement,
+        "max_score_diff": max(diffs) if diffs else None,
+        "mean_score_diff": statistics.mean(diffs) if diffs else None,
+        "pytorch_ms_per_review": reference_time * 1000,
+        f"{backend}_ms_per_review": candidate_time * 1000,
+        "speedup": reference_time / candidate_time if candidate_time else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paridad de resultados entre PyTorch y otro backend")
+    parser.add_argument("--backend", choices=[b for b in BACKENDS if b != "pytorch"], required=True)
+    parser.add_argument("--model", choices=["sentiment", "emotion", "all"], default="all")
+    parser.add_argument("--input", help="Fichero de texto con una reseña por línea")
+    parser.add_argument("--limit", type=int, default=120)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--min-agreement", type=float, default=0.98)
+    args = parser.parse_args()
+
+    texts = load_texts(args.input, args.limit)
+    print(f"{len(texts)} reseñas, backend candidato: {args.backend}")
+    ok = True
+    for key in (MODELS if args.model == "all" else [args.model]):
+        report = compare(key, texts, args.backend, args.batch_size)
+        print(f"\n[{key}]")
+        for name, value in report.items():
+            print(f"  {name:<28} {value:.4f}" if isinstance(value, float) else f"  {name:<28} {value}")
+        ok = ok and report["label_agreement"] >= args.min_agreement
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Comprobación de la supresión de reseñas duplicadas
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Pasa por server/text_preprocessing.py pares de reseñas que deben tratarse como la misma (espacios, mayúsculas, el
+botón "More", la traducción de Google, erratas) y pares que, aunque se parezcan mucho, deben analizarse por separado
+(una negación añadida, un adjetivo de polaridad opuesta, otro emoji u otra puntuación), y comprueba el resultado de cada par. Con --fixtures
+informa además de cuántas reseñas de benchmarks/fixtures se descartan como duplicadas. Termina con código de salida
+1 si algún par no da el resultado esperado.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/check_deduplication.py [--fixtures]
+"""
+
+import argparse
+import sys
+
+# review_fixtures añade además la carpeta server a sys.path
+from review_fixtures import fixture_reviews
+from text_preprocessing import drop_duplicates, prepare_reviews
+
+GREAT = "The food was great and the staff was really friendly, we will come back soon"
+LONG = ("We booked a table for six on a Saturday night and the waiter kept checking on us all evening. The grilled "
+        "octopus was tender, the rice was perfectly cooked and the desserts were generous. Prices are fair for the "
+        "area and the terrace has a lovely view of the harbour, so we will definitely come back next summer.")
+
+# (descripción, reseña, reseña, si deben ser la misma)
+CASES = [
+    ("espacios y mayúsculas", GREAT, "  the FOOD was great and the staff   was really friendly we will come back soon!", True),
+    ("botón More", GREAT, GREAT + "… More", True),
+    ("traducción de Google", GREAT, f"(Translated by Google) {GREAT}\n\n(Original)\nLa comida estaba genial", True),
+    ("errata en una reseña larga", LONG, LONG.replace("generous", "generus"), True),
+    ("palabra añadida en una reseña larga", LONG, LONG.replace("lovely view", "really lovely view"), True),
+    ("negación añadida", GREAT, GREAT.replace("was great", "was not great"), False),
+    ("negación contraída", GREAT, GREAT.replace("we will come back", "we won't come back"), False),
+    ("negación en una reseña larga", LONG, LONG.replace("we will definitely", "we will never"), False),
+    ("negación en español", "La comida estaba muy buena y el personal fue muy amable, volveremos pronto sin duda",
+     "La comida no estaba muy buena y el personal fue muy amable, volveremos pronto sin duda", False),
+    ("adjetivo opuesto", GREAT, GREAT.replace("friendly", "rude"), False),
+    ("mismo emoji", "Great 👍", "  great 👍 ", True),
+    ("emoji distinto", "Great 👍", "Great 👎", False),
+    ("puntuación distinta", "10/10", "1/10", False),
+    ("emoji distinto en una reseña larga", f"{LONG} 👍", f"{LONG} 👎", False),
+    ("puntuación distinta en una reseña larga", f"{LONG} 10/10", f"{LONG} 1/10", False),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comprobación de la supresión de reseñas duplicadas")
+    parser.add_argument("--fixtures", action="store_true", help="Informar de los duplicados de benchmarks/fixtures")
+    args = parser.parse_args()
+
+    failures = 0
+    for description, review, other, expected in CASES:
+        _, owners = prepare_reviews([review, other])
+        same = owners[0] == owners[1]
+        failures += same != expected
+        print(f"{'ok' if same == expected else 'FALLO':<6} {description:<40} {'duplicadas' if same else 'distintas'}")
+
+    if args.fixtures:
+        reviews = fixture_reviews()
+        kept, duplicates = drop_duplicates(reviews)
+        print(f"\nfixtures: {len(reviews)} reseñas, {duplicates} duplicadas, {len(kept)} a analizar")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
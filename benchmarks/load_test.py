@@ -0,0 +1,387 @@
+"""
+Pruebas de carga de la API con modelos y sitios simulados
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Ejecuta la aplicación FastAPI en el mismo proceso (httpx + ASGITransport, con los eventos de arranque y parada) y
+la somete a carga con distintos niveles de concurrencia, sin red ni modelos reales:
+    - Modelos: "stub" (pipelines en Python puro con la interfaz de transformers.pipeline y un coste simulado por
+      lote y por texto), "random" (modelos BERT diminutos con pesos aleatorios, requiere torch y transformers) o
+      "real" (los modelos configurados en server/inference.py).
+    - Sitios: los HTML de benchmarks/fixtures servidos por un servidor HTTP local, en rutas como
+      /google.com/maps/place/... para que la validación de URLs los acepte. Los escenarios de scraping necesitan
+      Chromium de Playwright y se omiten si el navegador no arranca.
+Para cada escenario y concurrencia se informa del rendimiento (peticiones por segundo), las latencias p50/p95/p99 y
+la memoria residente, y el resultado se guarda en JSON. Con --baseline se compara con una ejecución anterior y se
+termina con código 1 si alguna métrica empeora más de la tolerancia.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/load_test.py --concurrency 1,4,16 --requests 200 [--models stub|random|real]
+        [--scenarios raw_text,url_google,urls] [--baseline benchmarks/results/anterior.json]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# review_fixtures añade además la carpeta server a sys.path
+from review_fixtures import BENCHMARKS_DIR, fixture_path, fixture_reviews
+
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+# Dominio servido -> (fixture de review_fixtures.SITES, opción de la API, ruta que acepta la validación de URLs)
+SITE_FIXTURES = {
+    "google.com": ("google", "GoogleReview", "/google.com/maps/place/Restaurante"),
+    "tripadvisor.com": ("tripadvisor", "TripAdvisor", "/tripadvisor.com/Restaurant_Review-g1-d1"),
+    "yelp.com": ("yelp", "Yelp", "/yelp.com/biz/restaurante"),
+}
+SCENARIOS = ("raw_text", "url_google", "url_tripadvisor", "url_yelp", "urls", "stream", "counts")
+BROWSER_SCENARIOS = {"url_google", "url_tripadvisor", "url_yelp", "urls", "stream"}
+PROJECT_NAME = "LoadTest"
+
+
+# --------------------- Modelos simulados --------------------- #
+class StubTokenizer:
+    model_max_length = 512
+
+    def __call__(self, text, add_special_tokens=True, **kwargs):
+        return {"input_ids": text.split()}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return " ".join(ids)
+
+
+class StubPipeline:
+    # Salida determinista a partir del hash del texto y coste simulado: fijo por lote más uno por texto
+    def __init__(self, batch_ms, item_ms):
+        self.tokenizer = StubTokenizer()
+        self.batch_ms = batch_ms
+        self.item_ms = item_ms
+
+    @staticmethod
+    def _hash(text):
+        return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+
+    def _simulate(self, items):
+        time.sleep((self.batch_ms + self.item_ms * items) / 1000)
+
+
+class StubTextClassification(StubPipeline):
+    def __call__(self, inputs, **kwargs):
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        self._simulate(len(texts))
+        outputs = [{"label": f"LABEL_{self._hash(text) % 3}", "score": 0.5 + (self._hash(text) % 500) / 1000} for text in texts]
+        return outputs if not isinstance(inputs, str) else outputs[:1]
+
+
+class StubZeroShotClassification(StubPipeline):
+    def __call__(self, inputs, candidate_labels, **kwargs):
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        # Como el modelo real, una pasada por cada par (texto, etiqueta)
+        self._simulate(len(texts) * len(candidate_labels))
+        outputs = []
+        for text in texts:
+            weights = [(self._hash(f"{label}:{text}") % 1000) + 1 for label in candidate_labels]
+            ranked = sorted(zip(candidate_labels, (w / sum(weights) for w in weights)), key=lambda pair: pair[1], reverse=True)
+            outputs.append({"sequence": text, "labels": [label for label, _ in ranked], "scores": [score for _, score in ranked]})
+        return outputs if not isinstance(inputs, str) else outputs[0]
+
+
+def build_random_pipelines(workdir, texts):
+    # Modelos BERT diminutos con pesos aleatorios y un vocabulario construido con las reseñas de los fixtures
+    import torch
+    from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast, pipeline
+
+    words = sorted({word for text in texts for word in re.findall(r"\w+|[^\w\s]", text.lower())})
+    vocab_path = os.path.join(workdir, "vocab.txt")
+    with open(vocab_path, "w", encoding="utf-8") as vocab_file:
+        vocab_file.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words))
+    tokenizer = BertTokenizerFast(vocab_file=vocab_path)
+
+    def model(label2id):
+        torch.manual_seed(0)
+        config = BertConfig(vocab_size=tokenizer.vocab_size, hidden_size=64, num_hidden_layers=2, num_attention_heads=2,
+                            intermediate_size=128, num_labels=3, label2id=label2id,
+                            id2label={index: label for label, index in label2id.items()})
+        return BertForSequenceClassification(config).eval()
+
+    sentiment = model({"LABEL_0": 0, "LABEL_1": 1, "LABEL_2": 2})
+    emotion = model({"contradiction": 0, "neutral": 1, "entailment": 2})
+    return (lambda task, name: pipeline(task, model=sentiment, tokenizer=tokenizer),
+            lambda task, name: pipeline(task, model=emotion, tokenizer=tokenizer))
+
+
+# --------------------- Sitios simulados --------------------- #
+class FixtureHandler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        site = self.path.strip("/").split("/", 1)[0]
+        if site not in SITE_FIXTURES:
+            self.send_error(404)
+            return
+        with open(fixture_path(SITE_FIXTURES[site][0]), "rb") as fixture:
+            body = fixture.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fixture_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# --------------------- Escenarios --------------------- #
+def build_request(scenario, index, base_url, reviews, args):
+    project = {"ProjectName": PROJECT_NAME}
+    params = {"max_reviews": args.max_reviews, "cache_mode": "auto" if args.scrape_cache else "refresh"}
+    listing = lambda site: {"Url": f"{base_url}{SITE_FIXTURES[site][2]}?listing={index}", "OpcionEnum": SITE_FIXTURES[site][1]}
+
+    if scenario == "raw_text":
+        return "POST", "/predict_reviews_from_raw_text", {"json": {"item": {"Review": reviews[index % len(reviews)]}, "project_name": project}}
+    if scenario.startswith("url_"):
+        site = {"url_google": "google.com", "url_tripadvisor": "tripadvisor.com", "url_yelp": "yelp.com"}[scenario]
+        target = listing(site)
+        return "POST", "/predict_reviews_from_url", {"params": params, "json": {
+            "url": {"Url": target["Url"]}, "opcion": {"OpcionEnum": target["OpcionEnum"]}, "project_name": project}}
+    if scenario == "urls":
+        return "POST", "/predict_reviews_from_urls", {"params": params, "json": {
+            "listings": {"Listings": [listing(site) for site in SITE_FIXTURES]}, "project_name": project}}
+    if scenario == "stream":
+        target = listing("google.com")
+        return "POST", "/predict_reviews_from_url/stream", {"params": {"max_reviews": args.max_reviews}, "json": {
+            "url": {"Url": target["Url"]}, "opcion": {"OpcionEnum": target["OpcionEnum"]}, "project_name": project}}
+    return "GET", "/sentiment_counts", {}
+
+
+def is_error(response):
+    if response.status_code != 200:
+        return True
+    if response.headers.get("content-type", "").startswith("application/x-ndjson"):
+        return any(json.loads(line).get("type") == "error" for line in response.text.splitlines() if line.strip())
+    body = response.json()
+    return isinstance(body, dict) and "error" in body
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+async def run_scenario(client, scenario, concurrency, total, base_url, reviews, args):
+    from model_registry import memoria_residente_bytes
+
+    latencies = []
+    errors = 0
+    next_index = 0
+    rss_start = memoria_residente_bytes()
+    rss_peak = rss_start or 0
+    done = asyncio.Event()
+
+    async def sample_memory():
+        nonlocal rss_peak
+        while not done.is_set():
+            rss_peak = max(rss_peak, memoria_residente_bytes() or 0)
+            await asyncio.sleep(0.02)
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < total:
+            index = next_index
+            next_index += 1
+            method, path, kwargs = build_request(scenario, index, base_url, reviews, args)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                failed = is_error(response)
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Petición fallida en {scenario}: {e}")
+                failed = True
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += failed
+
+    sampler = asyncio.create_task(sample_memory())
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    done.set()
+    await sampler
+
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(total / wall, 3) if wall else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "mean": round(sum(latencies) / len(latencies), 2),
+            "max": round(max(latencies), 2),
+        },
+        "rss_start_bytes": rss_start,
+        "rss_end_bytes": memoria_residente_bytes(),
+        "rss_peak_bytes": rss_peak,
+    }
+
+
+# --------------------- Comparación con una ejecución anterior --------------------- #
+def compare_with_baseline(results, baseline_path, tolerance):
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(baseline_file)["results"]}
+    regressions = []
+    print(f"\nComparación con {baseline_path} (tolerancia {tolerance:.0%}):")
+    for result in results:
+        previous = baseline.get((result["scenario"], result["concurrency"]))
+        if previous is None:
+            continue
+        p95_change = result["latency_ms"]["p95"] / previous["latency_ms"]["p95"] - 1 if previous["latency_ms"]["p95"] else 0
+        rps_change = result["throughput_rps"] / previous["throughput_rps"] - 1 if previous["throughput_rps"] else 0
+        regressed = p95_change > tolerance or rps_change < -tolerance
+        print(f"  {result['scenario']:<16} c={result['concurrency']:<4} p95 {p95_change:+7.1%}  rps {rps_change:+7.1%}"
+              f"{'  <-- REGRESIÓN' if regressed else ''}")
+        if regressed:
+            regressions.append(result)
+    return regressions
+
+
+# --------------------- Programa principal --------------------- #
+def configure_environment(args, workdir):
+    # La configuración se fija antes de importar la aplicación, que la lee al cargarse
+    os.environ.setdefault("SENTIMENT_WARM_UP_MODELS", "1")
+    os.environ["SENTIMENT_CACHE_SIZE"] = "10000" if args.inference_cache else "0"
+    os.environ["SENTIMENT_CACHE_DB"] = ""
+    os.environ["SENTIMENT_DOMAIN_RATE"] = "1000"
+    os.environ["SENTIMENT_DOMAIN_BURST"] = "1000"
+    os.environ["SENTIMENT_BULK_JOBS_DIR"] = os.path.join(workdir, "bulk_jobs")
+    os.environ.setdefault("SENTIMENT_REVIEW_LOG_MODE", "debug")
+    os.chdir(workdir)
+
+
+async def run(args):
+    import httpx
+
+    workdir = tempfile.mkdtemp(prefix="sentiment_load_")
+    configure_environment(args, workdir)
+    reviews = fixture_reviews()
+
+    import inference
+    if args.models == "stub":
+        inference.model_registry.register("sentiment", "text-classification", "stub",
+                                          factory=lambda task, name: StubTextClassification(args.stub_batch_ms, args.stub_item_ms))
+        inference.model_registry.register("emotion", "zero-shot-classification", "stub",
+                                          factory=lambda task, name: StubZeroShotClassification(args.stub_batch_ms, args.stub_item_ms * 4))
+    elif args.models == "random":
+        sentiment_factory, emotion_factory = build_random_pipelines(workdir, reviews)
+        inference.model_registry.register("sentiment", "text-classification", "random-bert", factory=sentiment_factory)
+        inference.model_registry.register("emotion", "zero-shot-classification", "random-bert", factory=emotion_factory)
+
+    import sentimentAnalysisApp
+    app = sentimentAnalysisApp.app
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    server, base_url = start_fixture_server()
+    await app.router.startup()
+    # Los modelos se cargan en segundo plano: se espera a que estén listos para no medir la carga
+    while not inference.model_registry.ready():
+        await asyncio.sleep(0.1)
+    results = []
+    try:
+        scenarios = args.scenarios.split(",")
+        if BROWSER_SCENARIOS & set(scenarios) and not sentimentAnalysisApp.browser_pool.stats()["launches"]:
+            print("Chromium de Playwright no disponible: se omiten los escenarios de scraping.")
+            scenarios = [scenario for scenario in scenarios if scenario not in BROWSER_SCENARIOS]
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+            await client.post("/workspace/projects", json={"project_name": PROJECT_NAME})
+            for scenario in scenarios:
+                for concurrency in (int(value) for value in args.concurrency.split(",")):
+                    total = args.scrape_requests if scenario in BROWSER_SCENARIOS else args.requests
+                    if args.warmup:
+                        await run_scenario(client, scenario, concurrency, min(args.warmup, total), base_url, reviews, args)
+                    result = await run_scenario(client, scenario, concurrency, total, base_url, reviews, args)
+                    results.append(result)
+                    latency = result["latency_ms"]
+                    print(f"{scenario:<16} c={concurrency:<4} {result['throughput_rps']:8.2f} req/s  "
+                          f"p50 {latency['p50']:8.1f} ms  p95 {latency['p95']:8.1f} ms  p99 {latency['p99']:8.1f} ms  "
+                          f"errores {result['errors']:<4} RSS pico {result['rss_peak_bytes'] / 2 ** 20:7.1f} MiB")
+    finally:
+        await app.router.shutdown()
+        server.shutdown()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BENCHMARKS_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pruebas de carga de la API con modelos y sitios simulados")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Lista separada por comas de: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,4,16", help="Niveles de concurrencia separados por comas")
+    parser.add_argument("--requests", type=int, default=200, help="Peticiones por escenario sin navegador")
+    parser.add_argument("--scrape-requests", type=int, default=20, help="Peticiones por escenario de scraping")
+    parser.add_argument("--warmup", type=int, default=5, help="Peticiones de calentamiento no medidas")
+    parser.add_argument("--max-reviews", type=int, default=40)
+    parser.add_argument("--models", choices=["stub", "random", "real"], default="stub")
+    parser.add_argument("--stub-batch-ms", type=float, default=2.0, help="Coste simulado por lote de los modelos stub")
+    parser.add_argument("--stub-item-ms", type=float, default=1.0, help="Coste simulado por texto de los modelos stub")
+    parser.add_argument("--inference-cache", action="store_true", help="Activar la caché de inferencia")
+    parser.add_argument("--scrape-cache", action="store_true", help="Permitir respuestas desde la caché de scraping")
+    parser.add_argument("--output", help="Fichero JSON de resultados (por defecto en benchmarks/results/)")
+    parser.add_argument("--baseline", help="Resultados anteriores con los que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Empeoramiento admitido frente a la referencia")
+    parser.add_argument("--verbose", action="store_true", help="Mantener las trazas INFO de la aplicación")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output or os.path.join(RESULTS_DIR, f"load_test_{time.strftime('%Y%m%d_%H%M%S')}.json"))
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    results = asyncio.run(run(args))
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as output_file:
+        json.dump({
+            "meta": {
+                "timestamp": time.time(),
+                "git_commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "arguments": {name: value for name, value in vars(args).items() if name not in ("output", "baseline")},
+            },
+            "results": results,
+        }, output_file, indent=2)
+    print(f"\nResultados guardados en {output}")
+
+    if baseline and compare_with_baseline(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
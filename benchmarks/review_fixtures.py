@@ -0,0 +1,54 @@
+"""
+Fixtures de reseñas compartidas por los benchmarks
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Rutas de los benchmarks y de la carpeta server, selector de las reseñas de cada HTML guardado en benchmarks/fixtures
+(el mismo que usa el extractor del sitio en la aplicación) y funciones para leer esos HTML y sus reseñas o un
+fichero de texto con una reseña por línea. Al importarlo se añade la carpeta server a sys.path para que los
+benchmarks puedan importar los módulos de la aplicación.
+"""
+
+import os
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.join(BENCHMARKS_DIR, "..", "server")
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, "fixtures")
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+SITES = {
+    "google": ".MyEned",
+    "tripadvisor": ".JguWG",
+    "yelp": ".comment__09f24__D0cxf.y-css-h9c2fl",
+}
+
+
+def fixture_path(site):
+    return os.path.join(FIXTURES_DIR, f"{site}.html")
+
+
+def read_fixture(site):
+    with open(fixture_path(site), encoding="utf-8") as fixture:
+        return fixture.read()
+
+
+def fixture_reviews(sites=None):
+    # Reseñas extraídas de los HTML guardados, en el orden de SITES
+    from review_pagination import extract_reviews_from_html
+
+    reviews = []
+    for site in sites or SITES:
+        reviews.extend(extract_reviews_from_html(read_fixture(site), SITES[site]))
+    return reviews
+
+
+def load_texts(path=None, limit=None):
+    # Reseñas de un fichero de texto (una por línea) o, si no se indica, de las fixtures
+    if path:
+        with open(path, encoding="utf-8") as input_file:
+            texts = [line.strip() for line in input_file if line.strip()]
+    else:
+        texts = fixture_reviews()
+    return texts[:limit]
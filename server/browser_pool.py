@@ -0,0 +1,154 @@
+"""
+Pool persistente de navegadores Playwright
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo contiene la definición de la clase BrowserPool. Se mantiene un navegador Chromium de larga duración,
+creado al arrancar la aplicación, que entrega un contexto nuevo (sesión aislada) para cada scraping. El número de
+páginas simultáneas está limitado, el navegador se recicla tras N usos o si se cae, y todos los recursos se liberan
+aunque el scraping falle.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from playwright.async_api import async_playwright
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.150 Safari/537.36'
+
+
+class BrowserPool:
+    def __init__(self, max_pages=4, max_uses=50, headless=True, user_agent=DEFAULT_USER_AGENT):
+        self.max_pages = max_pages
+        self.max_uses = max_uses
+        self.headless = headless
+        self.user_agent = user_agent
+        self._playwright = None
+        self._browser = None
+        self._uses = 0
+        self._active = {}
+        self._retired = set()
+        # Las primitivas de asyncio se crean dentro del bucle de eventos (en Python 3.9 se ligan al bucle al crearse)
+        self._semaphore = None
+        self._lock = None
+        self._launches = 0
+        self._crashes = 0
+
+
+    # --------------------- Arranque y parada --------------------- #
+    def _ensure_primitives(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._semaphore = asyncio.Semaphore(self.max_pages)
+
+    async def start(self):
+        self._ensure_primitives()
+        async with self._lock:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            if self._browser is None:
+                await self._launch()
+
+    async def shutdown(self):
+        self._ensure_primitives()
+        async with self._lock:
+            browsers = set(self._active) | self._retired
+            if self._browser is not None:
+                browsers.add(self._browser)
+            for browser in browsers:
+                await self._close_browser(browser)
+            self._browser = None
+            self._active.clear()
+            self._retired.clear()
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+        logger.info("Pool de navegadores cerrado.")
+
+
+    # --------------------- Gestión del navegador --------------------- #
+    async def _launch(self):
+        logger.info("Lanzando navegador Chromium para el pool...")
+        self._browser = await self._playwright.chromium.launch(headless=self.headless)
+        self._active[self._browser] = 0
+        self._uses = 0
+        self._launches += 1
+
+    async def _close_browser(self, browser):
+        try:
+            await browser.close()
+        except Exception as e:
+            logger.error(f"Error al cerrar el navegador: {e}")
+
+    async def _retire(self, browser):
+        # El navegador retirado se cierra cuando terminan las páginas que todavía lo usan
+        if browser is self._browser:
+            self._browser = None
+        self._retired.add(browser)
+        if self._active.get(browser, 0) == 0:
+            self._active.pop(browser, None)
+            self._retired.discard(browser)
+            await self._close_browser(browser)
+
+    async def _acquire_browser(self):
+        async with self._lock:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            if self._browser is not None and not self._browser.is_connected():
+                logger.error("El navegador del pool se ha caído, relanzando...")
+                self._crashes += 1
+                await self._retire(self._browser)
+            elif self._browser is not None and self._uses >= self.max_uses:
+                logger.info(f"Reciclando el navegador tras {self._uses} usos...")
+                await self._retire(self._browser)
+            if self._browser is None:
+                await self._launch()
+            self._uses += 1
+            self._active[self._browser] += 1
+            return self._browser
+
+    async def _release_browser(self, browser):
+        async with self._lock:
+            self._active[browser] -= 1
+            if browser in self._retired and self._active[browser] == 0:
+                await self._retire(browser)
+
+
+    # --------------------- Entrega de páginas --------------------- #
+    @asynccontextmanager
+    async def page(self):
+        self._ensure_primitives()
+        async with self._semaphore:
+            browser = await self._acquire_browser()
+            context = None
+            try:
+                context = await browser.new_context(user_agent=self.user_agent)
+                yield await context.new_page()
+            finally:
+                if context is not None:
+                    try:
+                        await context.close()
+                    except Exception as e:
+                        logger.error(f"Error al cerrar el contexto del navegador: {e}")
+                if not browser.is_connected():
+                    async with self._lock:
+                        if browser is self._browser:
+                            self._crashes += 1
+                            await self._retire(browser)
+                await self._release_browser(browser)
+
+
+    # --------------------- Estadísticas --------------------- #
+    def stats(self):
+        return {
+            "max_pages": self.max_pages,
+            "max_uses": self.max_uses,
+            "active_pages": sum(self._active.values()),
+            "uses_current_browser": self._uses,
+            "launches": self._launches,
+            "crashes": self._crashes,
+            "retired_pending_close": len(self._retired),
+        }
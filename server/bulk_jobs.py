@@ -0,0 +1,201 @@
+"""
+Trabajos de análisis masivo de reseñas
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo contiene la definición de la clase BulkJobRunner, que procesa en segundo plano ficheros CSV o JSONL
+con miles de reseñas. El fichero subido se guarda en disco por bloques y se lee fila a fila, sin cargarlo entero en
+memoria. Las reseñas pasan por la inferencia por lotes y los resultados se añaden a un fichero JSONL descargable.
+El progreso (filas procesadas y posición en el fichero de resultados) se guarda en la base de datos tras cada lote,
+de modo que un trabajo interrumpido se reanuda desde el último lote confirmado.
+"""
+
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+import uuid
+
+from inference_executor import ExecutorSaturado
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+TEXT_FIELD_CANDIDATES = ("Review", "review", "text", "Text", "review_text")
+
+
+# --------------------- Lectura del fichero de entrada --------------------- #
+def detect_format(filename):
+    return "jsonl" if filename.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def iter_input_rows(path, file_format, text_field=None):
+    # Generador de textos fila a fila; None si la fila no tiene texto
+    with open(path, encoding="utf-8", newline="") as input_file:
+        if file_format == "jsonl":
+            for line in input_file:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    yield None
+                    continue
+                yield record if isinstance(record, str) else _pick_text(record, text_field)
+        else:
+            for record in csv.DictReader(input_file):
+                yield _pick_text(record, text_field)
+
+
+def _pick_text(record, text_field):
+    fields = (text_field,) if text_field else TEXT_FIELD_CANDIDATES
+    for field in fields:
+        value = record.get(field)
+        if isinstance(value, str) and value.strip():
+            return value
+    return None
+
+
+# --------------------- Ejecución de trabajos --------------------- #
+class BulkJobRunner:
+    def __init__(self, db_manager, jobs_dir, analyze_batch, executor, store_results=None, batch_size=64):
+        self.db_manager = db_manager
+        self.jobs_dir = jobs_dir
+        self.analyze_batch = analyze_batch
+        self.executor = executor
+        self.store_results = store_results
+        self.batch_size = batch_size
+        self._queue = None
+        self._worker = None
+
+    async def start(self):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        # Reanudar los trabajos que quedaron pendientes o a medias en la ejecución anterior
+        with self.db_manager.session() as db:
+            unfinished = db.get_bulk_jobs(statuses=("queued", "running"))
+        for job in unfinished:
+            logger.info(f"Reanudando trabajo masivo {job['job_id']} desde la fila {job['processed_rows']}.")
+            self._queue.put_nowait(job["job_id"])
+
+    async def shutdown(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+
+    # --------------------- Alta de trabajos --------------------- #
+    async def submit(self, upload, project_name=None, text_field=None):
+        job_id = uuid.uuid4().hex
+        file_format = detect_format(upload.filename or "")
+        input_path = os.path.join(self.jobs_dir, f"{job_id}.{file_format}")
+        results_path = os.path.join(self.jobs_dir, f"{job_id}.results.jsonl")
+
+        # El fichero se copia a disco por bloques, sin cargarlo completo en memoria
+        with open(input_path, "wb") as input_file:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                input_file.write(chunk)
+        open(results_path, "wb").close()
+
+        with self.db_manager.session() as db:
+            db.create_bulk_job(job_id, upload.filename, input_path, results_path, file_format, text_field, project_name)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+
+    # --------------------- Bucle de procesamiento --------------------- #
+    async def _run(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._process(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en el trabajo masivo {job_id}: {e}")
+                with self.db_manager.session() as db:
+                    db.update_bulk_job(job_id, status="failed", error=str(e), finished_at=time.time())
+
+    async def _process(self, job_id):
+        with self.db_manager.session() as db:
+            job = db.get_bulk_job(job_id)
+            db.update_bulk_job(job_id, status="running", started_at=job["started_at"] or time.time())
+        processed_rows = job["processed_rows"]
+        failed_rows = job["failed_rows"]
+        rows = iter_input_rows(job["input_path"], job["format"], job["text_field"])
+
+        # Descartar lo escrito después del último lote confirmado (por ejemplo, tras una caída)
+        with open(job["results_path"], "ab") as results_file:
+            results_file.truncate(job["results_offset"])
+        for _ in range(processed_rows):
+            next(rows, None)
+
+        with open(job["results_path"], "a", encoding="utf-8") as results_file:
+            while True:
+                batch = [text for _, text in zip(range(self.batch_size), rows)]
+                if not batch:
+                    break
+                texts = [text for text in batch if text is not None]
+                analyzed = await self._analyze(texts) if texts else []
+                by_text = iter(analyzed)
+                for text in batch:
+                    result = next(by_text, None) if text is not None else None
+                    if result is None:
+                        failed_rows += 1
+                        result = {"Review Text": text, "error": "No se ha podido analizar la fila."}
+                    results_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+                results_file.flush()
+                os.fsync(results_file.fileno())
+
+                processed_rows += len(batch)
+                if self.store_results is not None and job["project_name"]:
+                    await asyncio.to_thread(self.store_results, job["project_name"], "Bulk", job["filename"],
+                                            [result for result in analyzed if result is not None])
+                with self.db_manager.session() as db:
+                    db.update_bulk_job(job_id, processed_rows=processed_rows, failed_rows=failed_rows,
+                                       results_offset=results_file.tell())
+
+        with self.db_manager.session() as db:
+            db.update_bulk_job(job_id, status="completed", finished_at=time.time())
+        logger.info(f"Trabajo masivo {job_id} completado: {processed_rows} filas.")
+
+    async def _analyze(self, texts):
+        # Los lotes compiten con el tráfico interactivo: si el pool está lleno se espera en lugar de fallar
+        while True:
+            try:
+                return await self.executor.run(self.analyze_batch, texts, keep_failed=True)
+            except ExecutorSaturado:
+                await asyncio.sleep(0.5)
+
+
+    # --------------------- Estado de los trabajos --------------------- #
+    def status(self, job_id):
+        with self.db_manager.session() as db:
+            job = db.get_bulk_job(job_id)
+        if job is None:
+            return None
+        elapsed_end = job["finished_at"] or time.time()
+        elapsed = elapsed_end - job["started_at"] if job["started_at"] else 0
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "filename": job["filename"],
+            "project_name": job["project_name"],
+            "processed_rows": job["processed_rows"],
+            "failed_rows": job["failed_rows"],
+            "rows_per_second": round(job["processed_rows"] / elapsed, 2) if elapsed > 0 else 0,
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "error": job["error"],
+        }
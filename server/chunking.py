@@ -0,0 +1,99 @@
+"""
+División de reseñas largas en ventanas solapadas
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Las reseñas que superan la longitud máxima del modelo se dividen en ventanas de tokens que se solapan, en lugar de
+recortarse en silencio. Cada ventana se analiza como un texto más dentro de los mismos mini-lotes que las reseñas
+cortas, de modo que ningún lote supera la ventana y su coste queda acotado. Después se combinan las puntuaciones de
+todas las etiquetas de las ventanas de cada reseña en un único resultado, con una media ponderada por el número de
+tokens de cada ventana (weighted_mean) o con el máximo por etiqueta (max). Las reseñas que caben en una ventana se
+analizan enteras y su resultado no cambia.
+"""
+
+CHUNK_REDUCTIONS = ("weighted_mean", "max")
+
+# Límite para tokenizadores sin longitud máxima configurada (model_max_length muy grande)
+FALLBACK_MAX_LENGTH = 512
+
+
+# --------------------- División en ventanas --------------------- #
+def chunk_window(tokenizer, max_length=None, window_tokens=None, reserved_tokens=0):
+    # Tokens de la reseña que caben en una pasada, descontando los tokens especiales y los reservados (hipótesis)
+    limit = max_length or getattr(tokenizer, "model_max_length", None) or FALLBACK_MAX_LENGTH
+    limit = min(limit, FALLBACK_MAX_LENGTH) if limit > 100000 else limit
+    special = tokenizer.num_special_tokens_to_add() if hasattr(tokenizer, "num_special_tokens_to_add") else 2
+    window = limit - special - reserved_tokens
+    if window_tokens:
+        window = min(window, window_tokens)
+    return max(window, 1)
+
+
+def split_text(tokenizer, text, window, overlap):
+    # Lista de (ventana, peso); un texto con menos caracteres que la ventana tiene también menos tokens
+    if len(text) <= window:
+        return [(text, None)]
+    input_ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+    if len(input_ids) <= window:
+        return [(text, None)]
+    step = max(window - overlap, 1)
+    chunks = []
+    for start in range(0, len(input_ids), step):
+        ids = input_ids[start:start + window]
+        chunks.append((tokenizer.decode(ids, skip_special_tokens=True), len(ids)))
+        if start + window >= len(input_ids):
+            break
+    return chunks
+
+
+def split_texts(tokenizer, texts, window, overlap):
+    # Lista plana de ventanas con la reseña de origen y el peso de cada una
+    chunks, owners, weights = [], [], []
+    for index, text in enumerate(texts):
+        for chunk, weight in split_text(tokenizer, text, window, overlap):
+            chunks.append(chunk)
+            owners.append(index)
+            weights.append(weight)
+    return chunks, owners, weights
+
+
+# --------------------- Combinación de puntuaciones --------------------- #
+def reduce_scores(label_scores, weights, reduction):
+    # label_scores: un diccionario {etiqueta: puntuación} por ventana
+    if reduction not in CHUNK_REDUCTIONS:
+        raise ValueError(f"Reducción no válida: '{reduction}'. Opciones: {', '.join(CHUNK_REDUCTIONS)}.")
+    labels = {label for scores in label_scores for label in scores}
+    if reduction == "max":
+        return {label: max(scores.get(label, 0.0) for scores in label_scores) for label in labels}
+    total = sum(weights)
+    return {label: sum(weight * scores.get(label, 0.0) for weight, scores in zip(weights, label_scores)) / total
+            for label in labels}
+
+
+def ranked(scores):
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+
+def merge_sentiment(outputs, weights, reduction):
+    # Salidas de text-classification con todas las etiquetas; se devuelve la mejor, como la llamada individual
+    scores = reduce_scores([{p["label"]: p["score"] for p in output} for output in outputs], weights, reduction)
+    return [{"label": label, "score": score} for label, score in ranked(scores)[:1]]
+
+
+def merge_zero_shot(outputs, weights, reduction, sequence):
+    if len(outputs) == 1:
+        return dict(outputs[0], sequence=sequence)
+    scores = reduce_scores([dict(zip(output["labels"], output["scores"])) for output in outputs], weights, reduction)
+    ranking = ranked(scores)
+    return {"sequence": sequence, "labels": [label for label, _ in ranking], "scores": [score for _, score in ranking]}
+
+
+def merge_chunks(texts, outputs, owners, weights, merge):
+    # Agrupa las salidas por reseña; las ventanas fallidas se ignoran y la reseña falla solo si fallan todas
+    grouped = [([], []) for _ in texts]
+    for output, owner, weight in zip(outputs, owners, weights):
+        if output is not None:
+            grouped[owner][0].append(output)
+            grouped[owner][1].append(weight or 1)
+    return [merge(text, chunk_outputs, chunk_weights) if chunk_outputs else None
+            for text, (chunk_outputs, chunk_weights) in zip(texts, grouped)]
@@ -0,0 +1,192 @@
+"""
+Recuentos de emociones materializados para los paneles
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo contiene la definición de la clase DashboardStore, que mantiene en memoria los recuentos de emociones
+globales y de cada proyecto. Se carga desde la base de datos al arrancar y después se actualiza de forma incremental
+con cada incremento registrado en el acumulador de recuentos, de modo que las lecturas de los paneles no abren
+conexiones ni recorren tablas. Cada ámbito (global o proyecto) tiene un número de versión que sirve de ETag para las
+peticiones condicionales, y los clientes suscritos reciben solo las diferencias, agrupadas si llegan muy seguidas.
+Una resincronización periódica con la base de datos recoge los incrementos de otros procesos (varios workers).
+"""
+
+import asyncio
+import logging
+import threading
+import uuid
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Ámbito de los recuentos globales (todas las emociones, con o sin proyecto)
+GLOBAL_SCOPE = None
+
+
+class DashboardSubscription:
+    # Diferencias pendientes de enviar a un cliente; los incrementos seguidos se suman en una sola entrega
+    def __init__(self, scope, loop):
+        self.scope = scope
+        self.loop = loop
+        self.version = 0
+        self._deltas = Counter()
+        self._lock = threading.Lock()
+        self._ready = asyncio.Event()
+
+    def push(self, deltas, version):
+        with self._lock:
+            self._deltas.update(deltas)
+            self.version = version
+        try:
+            self.loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # El bucle de eventos del cliente ya se ha cerrado
+            pass
+
+    async def next(self, timeout):
+        # Devuelve (diferencias, versión) o None si no hay cambios antes del tiempo de espera
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._ready.clear()
+        with self._lock:
+            deltas, self._deltas = self._deltas, Counter()
+            version = self.version
+        return {emotion: count for emotion, count in deltas.items() if count}, version
+
+
+class DashboardStore:
+    def __init__(self, emotion_counter, db_manager, resync_seconds=5.0):
+        self.emotion_counter = emotion_counter
+        self.db_manager = db_manager
+        self.resync_seconds = resync_seconds
+        self.epoch = uuid.uuid4().hex[:8]
+        self._counts = {GLOBAL_SCOPE: Counter()}
+        self._versions = {GLOBAL_SCOPE: 0}
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._resyncs = 0
+        self._corrections = 0
+        emotion_counter.add_listener(self.apply)
+
+
+    # --------------------- Arranque y parada --------------------- #
+    def start(self):
+        self.resync()
+        if self.resync_seconds and (self._thread is None or not self._thread.is_alive()):
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._worker, name="dashboard-resync", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def _worker(self):
+        while not self._stopping.wait(self.resync_seconds):
+            try:
+                self.resync()
+            except Exception as e:
+                logger.error(f"Error al resincronizar los recuentos de los paneles: {e}")
+
+
+    # --------------------- Actualización incremental --------------------- #
+    def _apply_locked(self, scope, deltas):
+        counts = self._counts.setdefault(scope, Counter())
+        counts.update(deltas)
+        self._versions[scope] = self._versions.get(scope, 0) + 1
+        for subscription in self._subscribers.get(scope, ()):
+            subscription.push(deltas, self._versions[scope])
+
+    def apply(self, project_name, emotion, count=1):
+        # Se llama desde el acumulador con cada incremento ya validado
+        with self._lock:
+            self._apply_locked(GLOBAL_SCOPE, {emotion: count})
+            if project_name is not None:
+                self._apply_locked(project_name, {emotion: count})
+
+    def add_project(self, project_name):
+        with self._lock:
+            if project_name not in self._counts:
+                self._counts[project_name] = Counter()
+                self._versions[project_name] = 0
+
+    def _copy(self):
+        with self._lock:
+            return {scope: Counter(counts) for scope, counts in self._counts.items()}
+
+    def resync(self):
+        # Recuentos esperados = base de datos + incrementos propios sin volcar; las diferencias se aplican como deltas
+        def read_flushed():
+            with self.db_manager.session() as db:
+                return db.get_all_emotion_counts()
+
+        (global_counts, project_counts), unflushed, local = self.emotion_counter.consistent_snapshot(read_flushed, self._copy)
+        expected = {GLOBAL_SCOPE: Counter(global_counts)}
+        expected.update({project: Counter(counts) for project, counts in project_counts.items()})
+        for (project, emotion), count in unflushed.items():
+            expected[GLOBAL_SCOPE][emotion] += count
+            if project is not None:
+                expected.setdefault(project, Counter())[emotion] += count
+
+        corrections = 0
+        with self._lock:
+            for scope, counts in expected.items():
+                current = local.get(scope, Counter())
+                deltas = {emotion: counts[emotion] - current[emotion]
+                          for emotion in set(counts) | set(current) if counts[emotion] != current[emotion]}
+                if scope not in self._counts:
+                    self._counts[scope] = Counter()
+                    self._versions[scope] = 0
+                if deltas:
+                    self._apply_locked(scope, deltas)
+                    corrections += 1
+            self._resyncs += 1
+            self._corrections += corrections
+        return corrections
+
+
+    # --------------------- Lecturas y suscripciones --------------------- #
+    def etag(self, version):
+        return f'"{self.epoch}-{version}"'
+
+    def snapshot(self, scope):
+        # (recuentos, ETag) o None si el ámbito no existe
+        with self._lock:
+            if scope not in self._counts:
+                return None
+            return {emotion: count for emotion, count in self._counts[scope].items() if count}, self.etag(self._versions[scope])
+
+    def subscribe(self, scope, loop=None):
+        # La suscripción y la foto inicial se toman a la vez para no perder ni duplicar incrementos
+        subscription = DashboardSubscription(scope, loop or asyncio.get_running_loop())
+        with self._lock:
+            if scope not in self._counts:
+                return None, None
+            subscription.version = self._versions[scope]
+            self._subscribers.setdefault(scope, set()).add(subscription)
+            counts = {emotion: count for emotion, count in self._counts[scope].items() if count}
+        return subscription, counts
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.scope)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.scope]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "scopes": len(self._counts),
+                "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+                "resyncs": self._resyncs,
+                "corrections": self._corrections,
+                "resync_seconds": self.resync_seconds,
+            }
@@ -1,20 +1,122 @@
 """
 Gestor de base de datos SQLite
 Autor: Jaime Sánchez Cotta
-Última actualización: 29/04/2024
+Última actualización: 18/10/2026
 
 Este archivo contiene la definición de la clase SqliteDatabaseManager, que proporciona métodos para gestionar la base de datos SQLite
 de la aplicación web creada Sentimen Analysis, incluyendo la creación de tablas, inserción de datos, 
 actualización de recuentos de emociones y obtencón de información.
+
+Las conexiones se reparten desde un pool: cada petición obtiene su propia conexión mediante session(), de modo que
+las peticiones concurrentes no comparten cursor. La base de datos trabaja en modo WAL, con lo que las lecturas no
+esperan a las escrituras, y el esquema se crea una única vez al arrancar.
 """
 
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import DB_SESSION_SECONDS
+
+# Pragmas aplicados a cada conexión nueva del pool
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Tamaño de los agregados precalculados (una hora) y número de intervalos del histograma de puntuaciones
+ROLLUP_BUCKET_SECONDS = 3600
+HISTOGRAM_BINS = 10
+
+
+def score_bin(score):
+    return min(int(score * HISTOGRAM_BINS), HISTOGRAM_BINS - 1)
+
 
 class SqliteDatabaseManager:
-    def __init__(self, db_name):
+    def __init__(self, db_name, pool_size=8):
         self.db_name = db_name
-        self.conn = None
-        self.cursor = None
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+
+    # --------------------- Pool de conexiones --------------------- #
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, timeout=30)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.pool_size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        # Pool agotado: esperar a que otra petición devuelva su conexión
+        return self._pool.get(timeout=30)
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._pool.put(conn)
+
+    @contextmanager
+    def session(self):
+        if not self._initialized:
+            self.initialize()
+        conn = self._acquire()
+        start = time.perf_counter()
+        try:
+            yield SqliteDatabaseSession(conn)
+        finally:
+            DB_SESSION_SECONDS.observe(time.perf_counter() - start)
+            self._release(conn)
+
+    def initialize(self):
+        # Creación del esquema una sola vez por proceso
+        with self._init_lock:
+            if self._initialized:
+                return
+            conn = self._acquire()
+            try:
+                SqliteDatabaseSession(conn).create_tables()
+                self._initialized = True
+            finally:
+                self._release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+        print("Conexiones a la base de datos cerradas correctamente.")
+
+
+class SqliteDatabaseSession:
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = conn.cursor()
 
 
     # --------------------- Creación de tablas --------------------- #
@@ -42,6 +144,84 @@ class SqliteDatabaseManager:
                                 PRIMARY KEY (project_name, emotion))''')
             print("Tabla 'project_emotion_counts' creada correctamente o ya existe.")
 
+            print("Creando tabla 'review_results' si no existe...")
+            self.cursor.execute('''CREATE TABLE IF NOT EXISTS review_results
+                                (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                project_name TEXT,
+                                source TEXT,
+                                source_url TEXT,
+                                review_text TEXT,
+                                sentiment_label TEXT,
+                                sentiment_score REAL,
+                                emotion_label TEXT,
+                                emotion_score REAL,
+                                created_at REAL)''')
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_review_results_project_time ON review_results (project_name, created_at)")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_review_results_source_time ON review_results (source, created_at)")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_review_results_source_url ON review_results (source_url)")
+            print("Tabla 'review_results' creada correctamente o ya existe.")
+
+            # Agregados precalculados por hora y histograma de puntuaciones, actualizados en cada inserción
+            print("Creando tablas de agregados 'review_rollups' y 'review_score_histogram' si no existen...")
+            self.cursor.execute('''CREATE TABLE IF NOT EXISTS review_rollups
+                                (project_name TEXT,
+                                bucket_start INTEGER,
+                                sentiment_label TEXT,
+                                emotion_label TEXT,
+                                reviews INTEGER,
+                                sentiment_score_sum REAL,
+                                emotion_score_sum REAL,
+                                PRIMARY KEY (project_name, bucket_start, sentiment_label, emotion_label))''')
+            self.cursor.execute('''CREATE TABLE IF NOT EXISTS review_score_histogram
+                                (project_name TEXT,
+                                model TEXT,
+                                bin INTEGER,
+                                reviews INTEGER,
+                                PRIMARY KEY (project_name, model, bin))''')
+            print("Tablas de agregados creadas correctamente o ya existen.")
+
+            print("Creando tabla 'bulk_jobs' si no existe...")
+            self.cursor.execute('''CREATE TABLE IF NOT EXISTS bulk_jobs
+                                (job_id TEXT PRIMARY KEY,
+                                status TEXT,
+                                filename TEXT,
+                                input_path TEXT,
+                                results_path TEXT,
+                                format TEXT,
+                                text_field TEXT,
+                                project_name TEXT,
+                                processed_rows INTEGER DEFAULT 0,
+                                failed_rows INTEGER DEFAULT 0,
+                                results_offset INTEGER DEFAULT 0,
+                                created_at REAL,
+                                started_at REAL,
+                                updated_at REAL,
+                                finished_at REAL,
+                                error TEXT)''')
+            print("Tabla 'bulk_jobs' creada correctamente o ya existe.")
+
+            print("Creando tablas de la caché de scraping 'scraped_listings' y 'scraped_reviews' si no existen...")
+            self.cursor.execute('''CREATE TABLE IF NOT EXISTS scraped_listings
+                                (listing_key TEXT PRIMARY KEY,
+                                url TEXT,
+                                opcion TEXT,
+                                max_reviews INTEGER,
+                                reviews INTEGER,
+                                scraped_at REAL)''')
+            self.cursor.execute('''CREATE TABLE IF NOT EXISTS scraped_reviews
+                                (listing_key TEXT,
+                                review_hash TEXT,
+                                review_text TEXT,
+                                sentiment_label TEXT,
+                                sentiment_score REAL,
+                                emotion_label TEXT,
+                                emotion_score REAL,
+                                position INTEGER,
+                                first_seen REAL,
+                                last_seen REAL,
+                                PRIMARY KEY (listing_key, review_hash))''')
+            print("Tablas de la caché de scraping creadas correctamente o ya existen.")
+
             # Verificar si la tabla de proyectos está vacía
             self.cursor.execute("SELECT COUNT(*) FROM project_emotions")
             project_count = self.cursor.fetchone()[0]
@@ -107,6 +287,33 @@ class SqliteDatabaseManager:
             raise
 
 
+    # --------------------- Volcado agrupado de recuentos de emociones --------------------- #
+    def apply_emotion_deltas(self, deltas):
+        # deltas: {(project_name, emotion): incremento}; todo se aplica en una sola transacción
+        global_deltas = {}
+        for (project_name, emotion), count in deltas.items():
+            global_deltas[emotion] = global_deltas.get(emotion, 0) + count
+        project_deltas = [(project_name, emotion, count) for (project_name, emotion), count in deltas.items() if project_name is not None]
+        try:
+            self.conn.execute("BEGIN TRANSACTION")
+            self.cursor.executemany('''INSERT INTO emotions (emotion, count) VALUES (?, ?)
+                                    ON CONFLICT(emotion) DO UPDATE SET count = count + excluded.count''',
+                                    list(global_deltas.items()))
+            self.cursor.executemany('''INSERT INTO project_emotion_counts (project_name, emotion, count) VALUES (?, ?, ?)
+                                    ON CONFLICT(project_name, emotion) DO UPDATE SET count = count + excluded.count''',
+                                    project_deltas)
+            self.conn.commit()
+        except Exception as e:
+            print(f"Error al volcar los recuentos de emociones: {e}")
+            self.conn.rollback()
+            raise
+
+
+    def project_exists(self, project_name):
+        self.cursor.execute("SELECT COUNT(*) FROM project_emotions WHERE project_name = ?", (project_name,))
+        return self.cursor.fetchone()[0] > 0
+
+
     # --------------------- Obtención de recuentos de emociones para un proyecto --------------------- #
     def get_emotion_counts_for_project(self, project_name):
         try:
@@ -138,20 +345,179 @@ class SqliteDatabaseManager:
             raise
 
 
-    # --------------------- Inicio y cierre de conexión a la base de datos --------------------- #
-    def close(self):
+    def get_all_emotion_counts(self):
+        # Recuentos globales y de todos los proyectos (también los que aún no tienen emociones) en una sola lectura
+        try:
+            self.cursor.execute("SELECT emotion, count FROM emotions")
+            global_emotion_counts = {row[0]: row[1] for row in self.cursor.fetchall()}
+            self.cursor.execute("SELECT project_name FROM project_emotions")
+            project_counts = {row[0]: {} for row in self.cursor.fetchall()}
+            self.cursor.execute("SELECT project_name, emotion, count FROM project_emotion_counts")
+            for project_name, emotion, count in self.cursor.fetchall():
+                project_counts.setdefault(project_name, {})[emotion] = count
+            return global_emotion_counts, project_counts
+        except Exception as e:
+            print(f"Error al obtener los recuentos de emociones: {e}")
+            raise
+
+
+    # --------------------- Almacenamiento de resultados por reseña --------------------- #
+    def insert_review_results(self, project_name, source, source_url, results, created_at=None):
+        # results: lista de diccionarios con las claves de la respuesta de la API (una entrada por reseña)
+        created_at = created_at if created_at is not None else time.time()
+        bucket_start = int(created_at // ROLLUP_BUCKET_SECONDS * ROLLUP_BUCKET_SECONDS)
+        rollups = {}
+        histogram = {}
+        rows = []
+        for result in results:
+            rows.append((project_name, source, source_url, result["Review Text"], result["Analisis Label"], result["Score"],
+                         result["Emotion Label"], result["Emotion Score"], created_at))
+            rollup = rollups.setdefault((result["Analisis Label"], result["Emotion Label"]), [0, 0.0, 0.0])
+            rollup[0] += 1
+            rollup[1] += result["Score"]
+            rollup[2] += result["Emotion Score"]
+            for model, score in (("sentiment", result["Score"]), ("emotion", result["Emotion Score"])):
+                key = (model, score_bin(score))
+                histogram[key] = histogram.get(key, 0) + 1
         try:
-            self.conn.close()
-            print("Conexión a la base de datos cerrada correctamente.")
+            self.conn.execute("BEGIN TRANSACTION")
+            self.cursor.executemany('''INSERT INTO review_results (project_name, source, source_url, review_text, sentiment_label,
+                                    sentiment_score, emotion_label, emotion_score, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+            self.cursor.executemany('''INSERT INTO review_rollups (project_name, bucket_start, sentiment_label, emotion_label, reviews,
+                                    sentiment_score_sum, emotion_score_sum) VALUES (?, ?, ?, ?, ?, ?, ?)
+                                    ON CONFLICT(project_name, bucket_start, sentiment_label, emotion_label) DO UPDATE SET
+                                    reviews = reviews + excluded.reviews,
+                                    sentiment_score_sum = sentiment_score_sum + excluded.sentiment_score_sum,
+                                    emotion_score_sum = emotion_score_sum + excluded.emotion_score_sum''',
+                                    [(project_name, bucket_start, sentiment_label, emotion_label, *values)
+                                     for (sentiment_label, emotion_label), values in rollups.items()])
+            self.cursor.executemany('''INSERT INTO review_score_histogram (project_name, model, bin, reviews) VALUES (?, ?, ?, ?)
+                                    ON CONFLICT(project_name, model, bin) DO UPDATE SET reviews = reviews + excluded.reviews''',
+                                    [(project_name, model, bin_index, count) for (model, bin_index), count in histogram.items()])
+            self.conn.commit()
+            return len(rows)
         except Exception as e:
-            print(f"Error al cerrar la conexión a la base de datos: {e}")
+            print(f"Error al guardar los resultados de las reseñas: {e}")
+            self.conn.rollback()
+            raise
+
+
+    # --------------------- Consultas de tendencias y distribuciones --------------------- #
+    def get_review_trends(self, project_name, bucket="day", since=None, until=None):
+        # Tendencias a partir de los agregados por hora, reagrupados por hora o por día
+        bucket_seconds = 86400 if bucket == "day" else ROLLUP_BUCKET_SECONDS
+        self.cursor.execute('''SELECT (bucket_start / ?) * ? AS bucket, sentiment_label, emotion_label,
+                            SUM(reviews), SUM(sentiment_score_sum), SUM(emotion_score_sum)
+                            FROM review_rollups
+                            WHERE project_name = ? AND bucket_start >= ? AND bucket_start < ?
+                            GROUP BY bucket, sentiment_label, emotion_label
+                            ORDER BY bucket''',
+                            (bucket_seconds, bucket_seconds, project_name, since or 0, until or 2 ** 62))
+        trends = {}
+        for bucket_start, sentiment_label, emotion_label, reviews, sentiment_sum, emotion_sum in self.cursor.fetchall():
+            entry = trends.setdefault(bucket_start, {"bucket_start": bucket_start, "reviews": 0, "sentiment": {}, "emotions": {},
+                                                     "sentiment_score_sum": 0.0, "emotion_score_sum": 0.0})
+            entry["reviews"] += reviews
+            entry["sentiment"][sentiment_label] = entry["sentiment"].get(sentiment_label, 0) + reviews
+            entry["emotions"][emotion_label] = entry["emotions"].get(emotion_label, 0) + reviews
+            entry["sentiment_score_sum"] += sentiment_sum
+            entry["emotion_score_sum"] += emotion_sum
+        for entry in trends.values():
+            entry["average_score"] = entry.pop("sentiment_score_sum") / entry["reviews"]
+            entry["average_emotion_score"] = entry.pop("emotion_score_sum") / entry["reviews"]
+        return list(trends.values())
+
+    def get_score_distribution(self, project_name, model="sentiment"):
+        self.cursor.execute("SELECT bin, reviews FROM review_score_histogram WHERE project_name = ? AND model = ?", (project_name, model))
+        counts = dict(self.cursor.fetchall())
+        return [{"min": i / HISTOGRAM_BINS, "max": (i + 1) / HISTOGRAM_BINS, "reviews": counts.get(i, 0)} for i in range(HISTOGRAM_BINS)]
+
+    def get_review_results(self, project_name, since=None, limit=100):
+        self.cursor.execute('''SELECT source, source_url, review_text, sentiment_label, sentiment_score, emotion_label, emotion_score, created_at
+                            FROM review_results WHERE project_name = ? AND created_at >= ?
+                            ORDER BY created_at DESC LIMIT ?''', (project_name, since or 0, limit))
+        columns = ["source", "source_url", "review_text", "sentiment_label", "sentiment_score", "emotion_label", "emotion_score", "created_at"]
+        return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
 
-    
-    def __enter__(self):
-        self.conn = sqlite3.connect(self.db_name)
-        self.cursor = self.conn.cursor()
-        self.create_tables()
-        return self
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.close()
\ No newline at end of file
+    # --------------------- Trabajos de análisis masivo --------------------- #
+    def create_bulk_job(self, job_id, filename, input_path, results_path, file_format, text_field, project_name):
+        now = time.time()
+        self.cursor.execute('''INSERT INTO bulk_jobs (job_id, status, filename, input_path, results_path, format, text_field,
+                            project_name, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?)''',
+                            (job_id, filename, input_path, results_path, file_format, text_field, project_name, now, now))
+        self.conn.commit()
+
+    def update_bulk_job(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self.cursor.execute(f"UPDATE bulk_jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+        self.conn.commit()
+
+    def get_bulk_job(self, job_id):
+        self.cursor.execute("SELECT * FROM bulk_jobs WHERE job_id = ?", (job_id,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in self.cursor.description], row))
+
+    def get_bulk_jobs(self, statuses=None):
+        if statuses:
+            placeholders = ", ".join("?" for _ in statuses)
+            self.cursor.execute(f"SELECT * FROM bulk_jobs WHERE status IN ({placeholders}) ORDER BY created_at", tuple(statuses))
+        else:
+            self.cursor.execute("SELECT * FROM bulk_jobs ORDER BY created_at DESC")
+        columns = [column[0] for column in self.cursor.description]
+        return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
+
+
+    # --------------------- Caché de reseñas extraídas por listado --------------------- #
+    def get_scraped_listing(self, listing_key):
+        self.cursor.execute("SELECT url, opcion, max_reviews, reviews, scraped_at FROM scraped_listings WHERE listing_key = ?", (listing_key,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        listing = dict(zip(["url", "opcion", "max_reviews", "reviews", "scraped_at"], row))
+        # Reseñas de la última extracción en su orden, y todas las conocidas para reutilizar su análisis
+        self.cursor.execute('''SELECT review_hash, review_text, sentiment_label, sentiment_score, emotion_label, emotion_score, last_seen
+                            FROM scraped_reviews WHERE listing_key = ? ORDER BY position''', (listing_key,))
+        listing["latest"] = []
+        listing["known"] = {}
+        for review_hash, text, sentiment_label, sentiment_score, emotion_label, emotion_score, last_seen in self.cursor.fetchall():
+            result = {"Review Text": text, "Analisis Label": sentiment_label, "Score": sentiment_score,
+                      "Emotion Label": emotion_label, "Emotion Score": emotion_score}
+            listing["known"][review_hash] = result
+            if last_seen == listing["scraped_at"]:
+                listing["latest"].append(result)
+        return listing
+
+    def store_scraped_listing(self, listing_key, url, opcion, max_reviews, hashed_results, replace=False, scraped_at=None):
+        # hashed_results: lista ordenada de (hash, resultado) de la extracción actual
+        scraped_at = scraped_at if scraped_at is not None else time.time()
+        try:
+            self.conn.execute("BEGIN TRANSACTION")
+            if replace:
+                self.cursor.execute("DELETE FROM scraped_reviews WHERE listing_key = ?", (listing_key,))
+            self.cursor.execute('''INSERT INTO scraped_listings (listing_key, url, opcion, max_reviews, reviews, scraped_at)
+                                VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(listing_key) DO UPDATE SET
+                                url = excluded.url, max_reviews = excluded.max_reviews,
+                                reviews = excluded.reviews, scraped_at = excluded.scraped_at''',
+                                (listing_key, url, opcion, max_reviews, len(hashed_results), scraped_at))
+            self.cursor.executemany('''INSERT INTO scraped_reviews (listing_key, review_hash, review_text, sentiment_label,
+                                    sentiment_score, emotion_label, emotion_score, position, first_seen, last_seen)
+                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(listing_key, review_hash) DO UPDATE SET
+                                    position = excluded.position, last_seen = excluded.last_seen''',
+                                    [(listing_key, review_hash, result["Review Text"], result["Analisis Label"], result["Score"],
+                                      result["Emotion Label"], result["Emotion Score"], position, scraped_at, scraped_at)
+                                     for position, (review_hash, result) in enumerate(hashed_results)])
+            self.conn.commit()
+        except Exception as e:
+            print(f"Error al guardar la caché de scraping: {e}")
+            self.conn.rollback()
+            raise
+
+    def delete_scraped_listing(self, listing_key):
+        self.cursor.execute("DELETE FROM scraped_reviews WHERE listing_key = ?", (listing_key,))
+        self.cursor.execute("DELETE FROM scraped_listings WHERE listing_key = ?", (listing_key,))
+        self.conn.commit()
+        return self.cursor.rowcount > 0
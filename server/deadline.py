@@ -0,0 +1,138 @@
+"""
+Plazo máximo por petición
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo contiene la definición de la clase Deadline, que representa el plazo de una petición: el que indica el
+cliente (cabecera X-Request-Timeout o parámetro timeout_s) o uno por defecto. El plazo se guarda en una variable de
+contexto, de modo que la validación, el scraping, la inferencia por lotes y la escritura en la base de datos lo
+consultan sin pasarlo como argumento, también desde los hilos del pool de inferencia. Si el cliente se desconecta,
+el plazo se cancela y el trabajo pendiente se abandona en el siguiente punto de comprobación; si vence, se
+devuelve el resultado parcial con las reseñas ya analizadas.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_TIMEOUT_S = float(os.getenv("SENTIMENT_REQUEST_TIMEOUT_S", "120"))
+MAX_TIMEOUT_S = float(os.getenv("SENTIMENT_MAX_REQUEST_TIMEOUT_S", "600"))
+TIMEOUT_HEADER = "X-Request-Timeout"
+
+_current_deadline = contextvars.ContextVar("sentiment_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    def __init__(self, timeout_s=DEFAULT_TIMEOUT_S):
+        self.timeout_s = timeout_s
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + timeout_s
+        self.reason = None
+        self._cancelled = threading.Event()
+
+    def remaining(self, reserve=0.0):
+        # Segundos que quedan, descontando los reservados para las fases siguientes
+        if self._cancelled.is_set():
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic() - reserve)
+
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def expired(self):
+        return self._cancelled.is_set() or time.monotonic() >= self.expires_at
+
+    def cancel(self, reason="client_disconnected"):
+        self.reason = reason
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        if self.expired():
+            raise DeadlineExceeded(self.describe())
+
+    def describe(self):
+        if self.cancelled and self.reason == "client_disconnected":
+            return "El cliente se ha desconectado."
+        return f"Se ha superado el plazo de la petición ({self.timeout_s:g} s)."
+
+    def info(self):
+        return {"timeout_s": self.timeout_s, "elapsed_s": round(self.elapsed(), 3), "expired": self.expired()}
+
+
+# --------------------- Plazo de la petición en curso --------------------- #
+def parse_timeout(header_value=None, query_value=None):
+    # El parámetro de la URL tiene prioridad sobre la cabecera; el valor se acota a MAX_TIMEOUT_S
+    value = query_value if query_value is not None else header_value
+    if value is None or value == "":
+        return DEFAULT_TIMEOUT_S
+    try:
+        timeout_s = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Plazo no válido: '{value}'. Debe ser un número de segundos.")
+    if timeout_s <= 0:
+        raise ValueError("El plazo debe ser mayor que cero.")
+    return min(timeout_s, MAX_TIMEOUT_S)
+
+
+def current_deadline():
+    return _current_deadline.get()
+
+
+def check_deadline():
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def deadline_expired():
+    deadline = _current_deadline.get()
+    return deadline is not None and deadline.expired()
+
+
+def remaining_seconds(reserve=0.0):
+    # None si no hay plazo, para usarlo directamente como timeout
+    deadline = _current_deadline.get()
+    return None if deadline is None else deadline.remaining(reserve)
+
+
+@contextmanager
+def deadline_scope(deadline):
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+async def watch_disconnect(request, deadline, task, poll_seconds=0.5, grace_seconds=2.0):
+    # Cancela el plazo y la tarea si el cliente se desconecta o si el plazo vence sin que la tarea haya terminado.
+    # Con el cuerpo ya leído, el siguiente mensaje de la conexión solo llega cuando el cliente la cierra
+    async def listen():
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+
+    listener = asyncio.ensure_future(listen())
+    try:
+        while not task.done():
+            done, _ = await asyncio.wait({listener, task}, timeout=poll_seconds, return_when=asyncio.FIRST_COMPLETED)
+            if listener in done and not task.done():
+                deadline.cancel("client_disconnected")
+                task.cancel()
+                return
+            if deadline.remaining() == 0 and time.monotonic() - deadline.expires_at > grace_seconds:
+                deadline.cancel("deadline")
+                task.cancel()
+                return
+    finally:
+        listener.cancel()
@@ -0,0 +1,154 @@
+"""
+Acumulador de recuentos de emociones con escritura diferida
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo contiene la definición de la clase EmotionCountAccumulator. En lugar de abrir una transacción por cada
+texto analizado, los incrementos (proyecto, emoción) se acumulan en memoria y un hilo los vuelca a la base de datos
+en una única transacción cada N milisegundos o cada N eventos. Los incrementos pendientes se vuelcan también al
+cerrar la aplicación y, opcionalmente, se suman a las lecturas para que cada cliente vea sus propias escrituras.
+Los oyentes registrados (los recuentos materializados de los paneles) reciben cada incremento al registrarse.
+"""
+
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class EmotionCountAccumulator:
+    def __init__(self, db_manager, flush_interval_ms=500, flush_max_events=100, read_your_writes=True):
+        self.db_manager = db_manager
+        self.flush_interval_ms = flush_interval_ms
+        self.flush_max_events = flush_max_events
+        self.read_your_writes = read_your_writes
+        self._pending = Counter()
+        self._in_flight = Counter()
+        self._pending_events = 0
+        self._known_projects = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._flushes = 0
+
+
+    # --------------------- Arranque y parada --------------------- #
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._worker, name="emotion-counter", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        # Al cerrar se vuelcan los incrementos pendientes para no perder recuentos
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval_ms / 1000)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error al volcar los recuentos de emociones: {e}")
+
+
+    # --------------------- Registro de incrementos --------------------- #
+    def _check_project(self, project_name):
+        if project_name is None or project_name in self._known_projects:
+            return
+        with self.db_manager.session() as db:
+            if not db.project_exists(project_name):
+                raise ValueError(f"No existe un proyecto con el nombre '{project_name}'.")
+        self._known_projects.add(project_name)
+
+    def add_listener(self, listener):
+        # listener(project_name, emotion, count) se llama con el bloqueo tomado, junto con el incremento pendiente
+        self._listeners.append(listener)
+
+    def add(self, project_name, emotion, count=1):
+        self._check_project(project_name)
+        with self._lock:
+            self._pending[(project_name, emotion)] += count
+            self._pending_events += 1
+            full = self._pending_events >= self.flush_max_events
+            for listener in self._listeners:
+                listener(project_name, emotion, count)
+        if full:
+            self._wake.set()
+
+
+    # --------------------- Volcado a la base de datos --------------------- #
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                deltas = self._pending
+                self._pending = Counter()
+                self._pending_events = 0
+                self._in_flight = deltas
+            try:
+                with self.db_manager.session() as db:
+                    db.apply_emotion_deltas(deltas)
+            except Exception:
+                # Los incrementos vuelven a la cola para el siguiente volcado
+                with self._lock:
+                    self._pending.update(deltas)
+                    self._in_flight = Counter()
+                raise
+            with self._lock:
+                self._in_flight = Counter()
+                self._flushes += 1
+            return sum(deltas.values())
+
+
+    # --------------------- Lecturas con las escrituras propias --------------------- #
+    def _unflushed(self):
+        with self._lock:
+            return self._pending + self._in_flight
+
+    def consistent_snapshot(self, read_flushed, read_local):
+        # Lectura de la base de datos, de los incrementos sin volcar y del estado de los oyentes sin que un volcado
+        # o un incremento se cuele entre medias
+        with self._flush_lock:
+            flushed = read_flushed()
+            with self._lock:
+                return flushed, self._pending + self._in_flight, read_local()
+
+    def merge_project(self, project_name, counts):
+        if not self.read_your_writes:
+            return counts
+        merged = Counter(counts)
+        for (project, emotion), count in self._unflushed().items():
+            if project == project_name:
+                merged[emotion] += count
+        return dict(merged)
+
+    def merge_global(self, counts):
+        if not self.read_your_writes:
+            return counts
+        merged = Counter(counts)
+        for (_, emotion), count in self._unflushed().items():
+            merged[emotion] += count
+        return dict(merged)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending_events": self._pending_events,
+                "pending_keys": len(self._pending),
+                "flushes": self._flushes,
+                "flush_interval_ms": self.flush_interval_ms,
+                "flush_max_events": self.flush_max_events,
+                "read_your_writes": self.read_your_writes,
+            }
@@ -0,0 +1,175 @@
+"""
+Modo rápido de clasificación de emociones
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+El clasificador zero-shot (BART-MNLI) evalúa cada reseña una vez por etiqueta candidata: con las etiquetas fijas
+happy/sad/angry cada reseña cuesta tres pasadas completas de codificador y decodificador. Como la premisa y la
+hipótesis se codifican juntas, la codificación de la reseña no se puede reutilizar entre hipótesis; en su lugar,
+este archivo define un modo rápido que pasa cada reseña una sola vez por el codificador de BART y aplica una capa
+lineal pequeña, entrenada (destilada) sobre las salidas del clasificador zero-shot para el conjunto fijo de etiquetas.
+
+La capa se entrena a partir de un fichero de reseñas (una por línea, CSV o JSONL) con:
+    python fast_emotion.py --input reseñas.csv [--output fast_emotion_head.pt]
+Si no hay una capa entrenada para las etiquetas pedidas, la inferencia vuelve al modo exacto.
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+EMOTION_MODES = ("exact", "fast")
+FAST_EMOTION_HEAD_PATH = os.getenv("SENTIMENT_FAST_EMOTION_HEAD", "fast_emotion_head.pt")
+# Backends que exponen el codificador de BART (los modelos ONNX exportados no)
+FAST_MODE_BACKENDS = ("pytorch", "quantized")
+
+
+# --------------------- Codificación de las reseñas --------------------- #
+def encoder_of(model):
+    # BartForSequenceClassification -> BartModel -> codificador
+    base = getattr(model, "model", model)
+    get_encoder = getattr(base, "get_encoder", None)
+    if get_encoder is None:
+        raise RuntimeError(f"El modelo de emociones no expone su codificador; el modo rápido necesita el backend {' o '.join(FAST_MODE_BACKENDS)}.")
+    return get_encoder()
+
+
+def encode_reviews(pipe, texts, max_length=None):
+    # Media de los estados ocultos del codificador sobre los tokens reales (sin relleno)
+    import torch
+
+    inputs = pipe.tokenizer(texts, padding=True, truncation=True, return_tensors="pt",
+                            max_length=max_length or pipe.tokenizer.model_max_length)
+    inputs = {name: tensor.to(pipe.device) for name, tensor in inputs.items()}
+    with torch.inference_mode():
+        hidden = encoder_of(pipe.model)(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]).last_hidden_state
+    mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+    return ((hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)).float().cpu()
+
+
+# --------------------- Capa de clasificación destilada --------------------- #
+class FastEmotionHead:
+    def __init__(self, path=FAST_EMOTION_HEAD_PATH):
+        self.path = path
+        self.weight = None
+        self.bias = None
+        self.labels = None
+        self.model = None
+        self.version = None
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return self.weight is not None
+            self._loaded = True
+            if not os.path.exists(self.path):
+                logger.info(f"No hay capa de emociones rápida en {self.path}; se usará el modo exacto.")
+                return False
+            import torch
+            state = torch.load(self.path, map_location="cpu")
+            self.weight, self.bias = state["weight"], state["bias"]
+            self.labels, self.model = list(state["labels"]), state["model"]
+            self.version = int(os.path.getmtime(self.path))
+            logger.info(f"Capa de emociones rápida cargada ({self.model}, etiquetas {self.labels}).")
+            return True
+
+    def available(self, candidate_labels, model=None):
+        # Solo sirve para el conjunto de etiquetas y el modelo con los que se entrenó
+        if not self.load():
+            return False
+        return list(candidate_labels) == self.labels and (model is None or model == self.model)
+
+    def predict(self, pipe, texts, max_length=None):
+        import torch
+
+        features = encode_reviews(pipe, texts, max_length)
+        probabilities = torch.softmax(features @ self.weight.T + self.bias, dim=-1)
+        results = []
+        for text, row in zip(texts, probabilities.tolist()):
+            ranked = sorted(zip(self.labels, row), key=lambda pair: pair[1], reverse=True)
+            results.append({"sequence": text, "labels": [label for label, _ in ranked], "scores": [score for _, score in ranked]})
+        return results
+
+
+    # --------------------- Entrenamiento --------------------- #
+    def fit(self, features, targets, labels, model, epochs=300, learning_rate=0.01, weight_decay=1e-4):
+        # Regresión softmax sobre las distribuciones del modelo zero-shot (objetivos blandos)
+        import torch
+
+        torch.manual_seed(0)
+        layer = torch.nn.Linear(features.shape[1], len(labels))
+        optimizer = torch.optim.Adam(layer.parameters(), lr=learning_rate, weight_decay=weight_decay)
+        for _ in range(epochs):
+            optimizer.zero_grad()
+            loss = -(targets * torch.log_softmax(layer(features), dim=-1)).sum(dim=-1).mean()
+            loss.backward()
+            optimizer.step()
+        with self._lock:
+            self.weight = layer.weight.detach().clone()
+            self.bias = layer.bias.detach().clone()
+            self.labels, self.model = list(labels), model
+            self.version = int(time.time())
+            self._loaded = True
+        return float(loss)
+
+    def save(self):
+        import torch
+        torch.save({"weight": self.weight, "bias": self.bias, "labels": self.labels, "model": self.model}, self.path)
+
+
+# --------------------- Entrenamiento desde la línea de comandos --------------------- #
+def load_training_texts(path, limit):
+    from bulk_jobs import detect_format, iter_input_rows
+
+    if path.lower().endswith(".txt"):
+        with open(path, encoding="utf-8") as input_file:
+            texts = [line.strip() for line in input_file if line.strip()]
+    else:
+        texts = [text for text in iter_input_rows(path, detect_format(path)) if text]
+    return texts[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrena la capa de emociones rápida a partir del modelo zero-shot")
+    parser.add_argument("--input", required=True, help="Reseñas de entrenamiento (TXT con una por línea, CSV o JSONL)")
+    parser.add_argument("--output", default=FAST_EMOTION_HEAD_PATH)
+    parser.add_argument("--limit", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--validation", type=float, default=0.1, help="Fracción de reseñas reservada para validar")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    import torch
+    from inference import emotion_labels, emotion_model_name, model_registry, predict_emotion_batch
+
+    texts = load_training_texts(args.input, args.limit)
+    if len(texts) < 10:
+        parser.error("Se necesitan al menos 10 reseñas para entrenar la capa.")
+    pipe = model_registry.get("emotion")
+
+    # Objetivos: la distribución exacta del clasificador zero-shot para cada reseña
+    exact = predict_emotion_batch(texts, batch_size=args.batch_size, mode="exact")
+    pairs = [(text, result) for text, result in zip(texts, exact) if result is not None]
+    targets = torch.tensor([[dict(zip(r["labels"], r["scores"]))[label] for label in emotion_labels] for _, r in pairs])
+    features = torch.cat([encode_reviews(pipe, [text for text, _ in pairs[i:i + args.batch_size]])
+                          for i in range(0, len(pairs), args.batch_size)])
+
+    split = len(pairs) - max(1, int(len(pairs) * args.validation))
+    head = FastEmotionHead(args.output)
+    loss = head.fit(features[:split], targets[:split], emotion_labels, emotion_model_name, epochs=args.epochs)
+    predicted = torch.softmax(features[split:] @ head.weight.T + head.bias, dim=-1).argmax(dim=-1)
+    agreement = (predicted == targets[split:].argmax(dim=-1)).float().mean().item()
+    head.save()
+    print(f"Capa guardada en {args.output}: {split} reseñas de entrenamiento, pérdida {loss:.4f}, "
+          f"coincidencia con el modo exacto en validación {agreement:.2%} ({len(pairs) - split} reseñas).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Configuración de gunicorn con varios workers
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Los modelos se cargan una sola vez en el proceso padre (preload_app) y los workers de uvicorn se crean con fork,
+de modo que comparten las páginas de memoria de los pesos en copia en escritura en lugar de cargar cada uno su
+propia copia. En el padre solo se cargan los pesos, sin ejecutar inferencia, para no arrancar los hilos de
+PyTorch/OpenMP antes del fork. Cada worker arranca después sus propios hilos, conexiones y navegador.
+
+Con SENTIMENT_MODEL_SERVERS=N se arrancan en su lugar N servidores de modelos dedicados (ver model_server.py) y los
+workers HTTP no cargan modelos: les envían la inferencia por sockets Unix, y la memoria no crece al añadir workers.
+
+Uso (desde la carpeta server, con gunicorn instalado):
+    gunicorn -c gunicorn.conf.py sentimentAnalysisApp:app
+"""
+
+import gc
+import os
+import secrets
+import subprocess
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SERVER_DIR)
+from model_server import private_socket_dir
+
+MODEL_SERVERS = int(os.getenv("SENTIMENT_MODEL_SERVERS", "0"))
+model_server_processes = []
+
+# Se fija antes de importar la aplicación, y los servidores de modelos heredan las variables de entorno (la clave es
+# aleatoria en cada arranque y los sockets se crean en una carpeta privada del usuario)
+if MODEL_SERVERS:
+    os.environ.setdefault("SENTIMENT_MODEL_SERVER_AUTHKEY", secrets.token_hex(16))
+    os.environ.setdefault("SENTIMENT_MODEL_SERVER_ADDRESS", ",".join(
+        os.path.join(private_socket_dir(), f"models-{os.getpid()}-{index}.sock") for index in range(MODEL_SERVERS)))
+else:
+    # El padre carga los modelos y /readyz responde listo en cada worker
+    os.environ.setdefault("SENTIMENT_PRELOAD_MODELS", "1")
+
+bind = os.getenv("SENTIMENT_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("SENTIMENT_WORKERS", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("SENTIMENT_WORKER_TIMEOUT", "120"))
+
+
+def on_starting(server):
+    for address in os.environ["SENTIMENT_MODEL_SERVER_ADDRESS"].split(",") if MODEL_SERVERS else []:
+        model_server_processes.append(subprocess.Popen(
+            [sys.executable, os.path.join(SERVER_DIR, "model_server.py"), "--address", address], cwd=SERVER_DIR))
+        server.log.info(f"Servidor de modelos arrancado en {address}")
+
+
+def on_exit(server):
+    for process in model_server_processes:
+        process.terminate()
+    for process in model_server_processes:
+        process.wait(timeout=30)
+
+
+def when_ready(server):
+    # Congelar los objetos ya creados para que el recolector de basura no escriba en sus páginas tras el fork
+    gc.freeze()
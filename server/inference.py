@@ -0,0 +1,290 @@
+"""
+Inferencia por lotes de los modelos de NLP
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo centraliza el registro de los modelos de sentimiento y emoción y define las funciones de inferencia
+por lotes. Las reseñas se ordenan por longitud y se agrupan en mini-lotes con relleno (padding), de forma que cada
+lote contiene textos de tamaño parecido y se desperdicia el mínimo cómputo en tokens de relleno. La salida de cada
+reseña es la misma que devolvería la llamada individual al pipeline. Las reseñas que no caben en la longitud máxima
+del modelo se dividen en ventanas solapadas que se analizan en los mismos lotes (ver chunking.py).
+"""
+
+import logging
+import os
+
+from chunking import CHUNK_REDUCTIONS, chunk_window, merge_chunks, merge_sentiment, merge_zero_shot, split_texts
+from fast_emotion import EMOTION_MODES, FAST_MODE_BACKENDS, FastEmotionHead
+from inference_backends import backend_for, pipeline_factory
+from inference_cache import InferenceCache, cache_key
+from metrics import CHUNKED_REVIEWS, INFERENCE_BATCH_ITEMS, INFERENCE_BATCH_SECONDS, INFERENCE_ERRORS
+from micro_batcher import MicroBatcher
+from model_server import RemoteModelClient
+from model_registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------- Configuración de los modelos --------------------- #
+model_name = "mrcaelumn/yelp_restaurant_review_sentiment_analysis"
+emotion_model_name = "facebook/bart-large-mnli"
+emotion_labels = ["happy", "sad", "angry"]
+
+# Tamaño de mini-lote y longitud máxima en tokens (None = la longitud máxima del modelo)
+INFERENCE_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "16"))
+INFERENCE_MAX_LENGTH = int(os.getenv("SENTIMENT_MAX_LENGTH", "0")) or None
+
+# Reseñas largas: ventanas de CHUNK_TOKENS tokens (0 = la longitud máxima del modelo) solapadas CHUNK_OVERLAP tokens
+# y combinadas con weighted_mean o max (ver chunking.py); SENTIMENT_CHUNKING=0 vuelve a recortar el texto
+CHUNKING = os.getenv("SENTIMENT_CHUNKING", "1") == "1"
+CHUNK_TOKENS = int(os.getenv("SENTIMENT_CHUNK_TOKENS", "0")) or None
+CHUNK_OVERLAP = int(os.getenv("SENTIMENT_CHUNK_OVERLAP", "64"))
+CHUNK_REDUCTION = os.getenv("SENTIMENT_CHUNK_REDUCTION", "weighted_mean")
+ZERO_SHOT_HYPOTHESIS = "This example is {}."
+
+# Backend de cada modelo: pytorch, quantized, onnx u onnx-int8 (ver inference_backends.py)
+sentiment_backend = backend_for("sentiment")
+emotion_backend = backend_for("emotion")
+
+model_registry = ModelRegistry()
+model_registry.register("sentiment", "text-classification", model_name,
+                        factory=pipeline_factory(sentiment_backend), metadata={"backend": sentiment_backend})
+model_registry.register("emotion", "zero-shot-classification", emotion_model_name,
+                        factory=pipeline_factory(emotion_backend), metadata={"backend": emotion_backend})
+
+# Modo de emociones por defecto: exact (zero-shot completo) o fast (codificador + capa destilada, ver fast_emotion.py)
+EMOTION_MODE = os.getenv("SENTIMENT_EMOTION_MODE", "exact")
+fast_emotion_head = FastEmotionHead()
+_fast_mode_backend_warned = False
+
+# Caché de resultados: LRU en memoria (SENTIMENT_CACHE_SIZE=0 la desactiva) y nivel SQLite opcional
+CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("SENTIMENT_CACHE_TTL", "0")) or None
+CACHE_DB_PATH = os.getenv("SENTIMENT_CACHE_DB", "inference_cache.db")
+
+# Con servidores de modelos (ver model_server.py) este proceso no carga modelos: la inferencia, la caché incluida, se
+# delega en ellos
+MODEL_SERVER_ADDRESS = os.getenv("SENTIMENT_MODEL_SERVER_ADDRESS", "")
+model_server_client = RemoteModelClient(MODEL_SERVER_ADDRESS) if MODEL_SERVER_ADDRESS else None
+
+inference_cache = (InferenceCache(CACHE_SIZE, CACHE_TTL_SECONDS, CACHE_DB_PATH or None)
+                   if CACHE_SIZE > 0 and model_server_client is None else None)
+
+
+# --------------------- Funciones auxiliares --------------------- #
+def length_sorted_batches(texts, batch_size):
+    # Índices de los textos agrupados en lotes de longitud similar
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    for start in range(0, len(order), batch_size):
+        yield order[start:start + batch_size]
+
+
+def truncate_to_tokens(tokenizer, text, max_length):
+    # Recortar el texto solo si supera la longitud máxima, para no alterar la salida de los textos cortos
+    if max_length is None or tokenizer is None:
+        return text
+    input_ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+    if len(input_ids) <= max_length:
+        return text
+    return tokenizer.decode(input_ids[:max_length], skip_special_tokens=True)
+
+
+def _run_batched(texts, run_batch, run_single, batch_size, model="unknown"):
+    results = [None] * len(texts)
+    for indices in length_sorted_batches(texts, batch_size):
+        batch = [texts[i] for i in indices]
+        INFERENCE_BATCH_ITEMS.observe(len(batch), model=model)
+        try:
+            with INFERENCE_BATCH_SECONDS.time(model=model):
+                outputs = run_batch(batch)
+        except Exception as e:
+            # Si falla el lote completo, se reintenta reseña a reseña para no perder las válidas
+            INFERENCE_ERRORS.inc(model=model)
+            logger.error(f"Error en la inferencia por lotes, reintentando individualmente: {e}")
+            outputs = []
+            for text in batch:
+                try:
+                    outputs.append(run_single(text))
+                except Exception as e:
+                    logger.error(f"Error al analizar la reseña: {e}")
+                    outputs.append(None)
+        for index, output in zip(indices, outputs):
+            results[index] = output
+    return results
+
+
+def chunk_signature(reduction):
+    # Parte de la clave de caché: el resultado de una reseña larga depende de la división y la reducción
+    if not CHUNKING:
+        return "truncate"
+    return f"chunk-{CHUNK_TOKENS or 'auto'}-{CHUNK_OVERLAP}-{reduction}"
+
+
+def resolve_chunk_reduction(reduction):
+    reduction = reduction or CHUNK_REDUCTION
+    if reduction not in CHUNK_REDUCTIONS:
+        raise ValueError(f"Reducción no válida: '{reduction}'. Opciones: {', '.join(CHUNK_REDUCTIONS)}.")
+    return reduction
+
+
+def _run_chunked(texts, tokenizer, window, run, merge, model="unknown"):
+    # Las ventanas de las reseñas largas se analizan en los mismos lotes que las reseñas cortas
+    chunks, owners, weights = split_texts(tokenizer, texts, window, CHUNK_OVERLAP)
+    if len(chunks) > len(texts):
+        CHUNKED_REVIEWS.inc(len({owner for owner, weight in zip(owners, weights) if weight is not None}), model=model)
+    return merge_chunks(texts, run(chunks), owners, weights, merge)
+
+
+def hypothesis_tokens(tokenizer, candidate_labels):
+    # Tokens que ocupa la hipótesis más larga del zero-shot junto a la reseña, incluidos los especiales del par
+    longest = max(len(tokenizer(ZERO_SHOT_HYPOTHESIS.format(label), add_special_tokens=False)["input_ids"])
+                  for label in candidate_labels)
+    if hasattr(tokenizer, "num_special_tokens_to_add"):
+        longest += tokenizer.num_special_tokens_to_add(pair=True) - tokenizer.num_special_tokens_to_add()
+    return longest
+
+
+def _with_cache(model, texts, candidate_labels, compute):
+    # Solo los textos sin resultado en caché llegan al modelo; los repetidos dentro del lote se calculan una vez
+    if inference_cache is None:
+        return compute(texts)
+    keys = [cache_key(model, text, candidate_labels) for text in texts]
+    cached = inference_cache.get_many(set(keys))
+    pending = {}
+    for text, key in zip(texts, keys):
+        if key not in cached and key not in pending:
+            pending[key] = text
+    if pending:
+        computed = compute(list(pending.values()))
+        fresh = {key: result for key, result in zip(pending, computed) if result is not None}
+        inference_cache.set_many(fresh)
+        cached.update(fresh)
+    return [cached.get(key) for key in keys]
+
+
+# --------------------- Inferencia por lotes --------------------- #
+def predict_sentiment_batch(texts, batch_size=None, max_length=None, reduction=None):
+    # Devuelve, para cada texto, la lista de predicciones [{'label', 'score'}] igual que la llamada individual
+    if model_server_client is not None:
+        return model_server_client.call("predict_sentiment_batch", list(texts), batch_size, max_length, reduction)
+    batch_size = batch_size or INFERENCE_BATCH_SIZE
+    max_length = max_length or INFERENCE_MAX_LENGTH
+    reduction = resolve_chunk_reduction(reduction)
+    return _with_cache(f"{model_name}@{sentiment_backend}@{max_length}@{chunk_signature(reduction)}", list(texts), None,
+                       lambda pending: _predict_sentiment_uncached(pending, batch_size, max_length, reduction))
+
+
+def resolve_emotion_mode(mode, candidate_labels=None):
+    # El modo rápido solo se usa si el backend expone el codificador y hay una capa entrenada para estas etiquetas;
+    # si no, se vuelve al exacto
+    global _fast_mode_backend_warned
+    mode = mode or EMOTION_MODE
+    if mode not in EMOTION_MODES:
+        raise ValueError(f"Modo de emociones no válido: '{mode}'. Opciones: {', '.join(EMOTION_MODES)}.")
+    # Con servidores de modelos la capa rápida está en ellos, que vuelven al modo exacto si no la tienen
+    if model_server_client is not None:
+        return mode
+    if mode == "fast" and emotion_backend not in FAST_MODE_BACKENDS:
+        if not _fast_mode_backend_warned:
+            _fast_mode_backend_warned = True
+            logger.warning(f"El modo rápido de emociones no está disponible con el backend '{emotion_backend}' "
+                           f"(necesita {' o '.join(FAST_MODE_BACKENDS)}); se usa el modo exacto.")
+        return "exact"
+    if mode == "fast" and not fast_emotion_head.available(candidate_labels or emotion_labels, emotion_model_name):
+        return "exact"
+    return mode
+
+
+def predict_emotion_batch(texts, batch_size=None, max_length=None, candidate_labels=None, mode=None, reduction=None):
+    # Devuelve, para cada texto, el diccionario {'sequence', 'labels', 'scores'} del clasificador zero-shot
+    if model_server_client is not None:
+        return model_server_client.call("predict_emotion_batch", list(texts), batch_size, max_length, candidate_labels, mode, reduction)
+    batch_size = batch_size or INFERENCE_BATCH_SIZE
+    max_length = max_length or INFERENCE_MAX_LENGTH
+    candidate_labels = candidate_labels or emotion_labels
+    reduction = resolve_chunk_reduction(reduction)
+    texts = list(texts)
+    if resolve_emotion_mode(mode, candidate_labels) == "fast":
+        # La versión de la capa forma parte de la clave: al reentrenarla no se reutilizan resultados antiguos
+        results = _with_cache(f"{emotion_model_name}@{emotion_backend}@fast-{fast_emotion_head.version}@{max_length}@{chunk_signature(reduction)}",
+                              texts, candidate_labels,
+                              lambda pending: _predict_emotion_fast_uncached(pending, batch_size, max_length, reduction))
+    else:
+        results = _with_cache(f"{emotion_model_name}@{emotion_backend}@{max_length}@{chunk_signature(reduction)}", texts, candidate_labels,
+                              lambda pending: _predict_emotion_uncached(pending, batch_size, max_length, candidate_labels, reduction))
+    # La clave usa el texto normalizado: se devuelve la secuencia original de cada petición
+    return [dict(result, sequence=text) if result is not None else None for text, result in zip(texts, results)]
+
+
+def _predict_sentiment_uncached(texts, batch_size, max_length, reduction):
+    pipe = model_registry.get("sentiment")
+    tokenizer_kwargs = {"truncation": True}
+    if max_length is not None:
+        tokenizer_kwargs["max_length"] = max_length
+    if CHUNKING:
+        # Todas las etiquetas de cada ventana para poder combinarlas; merge_sentiment se queda con la mejor
+        tokenizer_kwargs["top_k"] = None
+
+    def run_batch(batch):
+        outputs = pipe(batch, batch_size=len(batch), **tokenizer_kwargs)
+        return [output if isinstance(output, list) else [output] for output in outputs]
+
+    def run_single(text):
+        output = pipe(text, **tokenizer_kwargs)
+        return output[0] if output and isinstance(output[0], list) else output
+
+    run = lambda batch_texts: _run_batched(batch_texts, run_batch, run_single, batch_size, model="sentiment")
+    if not CHUNKING:
+        return run(texts)
+    window = chunk_window(pipe.tokenizer, max_length, CHUNK_TOKENS)
+    return _run_chunked(texts, pipe.tokenizer, window, run,
+                        lambda text, outputs, weights: merge_sentiment(outputs, weights, reduction), model="sentiment")
+
+
+def _predict_emotion_uncached(texts, batch_size, max_length, candidate_labels, reduction):
+    pipe = model_registry.get("emotion")
+
+    def run_batch(batch):
+        # Cada reseña genera un par (premisa, hipótesis) por etiqueta: el lote real es reseñas x etiquetas
+        outputs = pipe(batch, candidate_labels=candidate_labels, batch_size=len(batch) * len(candidate_labels))
+        return outputs if isinstance(outputs, list) else [outputs]
+
+    def run_single(text):
+        return pipe(text, candidate_labels=candidate_labels)
+
+    run = lambda batch_texts: _run_batched(batch_texts, run_batch, run_single, batch_size, model="emotion")
+    if not CHUNKING:
+        return run([truncate_to_tokens(pipe.tokenizer, text, max_length) for text in texts])
+    window = chunk_window(pipe.tokenizer, max_length, CHUNK_TOKENS, hypothesis_tokens(pipe.tokenizer, candidate_labels))
+    return _run_chunked(texts, pipe.tokenizer, window, run,
+                        lambda text, outputs, weights: merge_zero_shot(outputs, weights, reduction, text), model="emotion")
+
+
+def _predict_emotion_fast_uncached(texts, batch_size, max_length, reduction):
+    pipe = model_registry.get("emotion")
+
+    # Una sola pasada del codificador por reseña, sin el multiplicador por etiqueta
+    def run_batch(batch):
+        return fast_emotion_head.predict(pipe, batch, max_length)
+
+    def run_single(text):
+        return fast_emotion_head.predict(pipe, [text], max_length)[0]
+
+    run = lambda batch_texts: _run_batched(batch_texts, run_batch, run_single, batch_size, model="emotion-fast")
+    if not CHUNKING:
+        return run(texts)
+    window = chunk_window(pipe.tokenizer, max_length, CHUNK_TOKENS)
+    return _run_chunked(texts, pipe.tokenizer, window, run,
+                        lambda text, outputs, weights: merge_zero_shot(outputs, weights, reduction, text), model="emotion-fast")
+
+
+# --------------------- Agrupación de peticiones concurrentes --------------------- #
+# Las peticiones de una sola reseña se agrupan entre clientes antes de llegar a los modelos
+MICROBATCH_MAX_SIZE = int(os.getenv("SENTIMENT_MICROBATCH_MAX_SIZE", "16"))
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("SENTIMENT_MICROBATCH_MAX_WAIT_MS", "10"))
+
+sentiment_batcher = MicroBatcher("sentiment", predict_sentiment_batch, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS)
+emotion_batcher = MicroBatcher("emotion", lambda texts: predict_emotion_batch(texts, mode="exact"),
+                               MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS)
+fast_emotion_batcher = MicroBatcher("emotion-fast", lambda texts: predict_emotion_batch(texts, mode="fast"),
+                                    MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS)
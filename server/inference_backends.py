@@ -0,0 +1,81 @@
+"""
+Backends de inferencia para CPU
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo construye los pipelines de transformers con el backend de inferencia elegido, manteniendo la misma
+interfaz para analyze_sentiment y analyze_emotions:
+    - pytorch:   PyTorch en fp32 (comportamiento original).
+    - quantized: PyTorch con cuantización dinámica int8 de las capas lineales.
+    - onnx:      exportación a ONNX y ejecución con ONNX Runtime (requiere optimum[onnxruntime]).
+    - onnx-int8: como onnx, con cuantización dinámica int8 de ONNX Runtime.
+Los modelos exportados se guardan en disco y se reutilizan en los siguientes arranques. La paridad de resultados
+con PyTorch se comprueba con benchmarks/check_backend_parity.py.
+"""
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("pytorch", "quantized", "onnx", "onnx-int8")
+INFERENCE_BACKEND = os.getenv("SENTIMENT_INFERENCE_BACKEND", "pytorch")
+ONNX_EXPORT_DIR = os.getenv("SENTIMENT_ONNX_DIR", "onnx_models")
+
+
+def backend_for(model_key):
+    # Cada modelo puede tener su propio backend (SENTIMENT_SENTIMENT_BACKEND, SENTIMENT_EMOTION_BACKEND)
+    backend = os.getenv(f"SENTIMENT_{model_key.upper()}_BACKEND", INFERENCE_BACKEND)
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de inferencia no válido: '{backend}'. Opciones: {', '.join(BACKENDS)}.")
+    return backend
+
+
+# --------------------- Construcción de pipelines --------------------- #
+def build_pipeline(task, model, backend="pytorch"):
+    from transformers import pipeline
+
+    if backend == "pytorch":
+        return pipeline(task, model=model)
+    if backend == "quantized":
+        import torch
+        pipe = pipeline(task, model=model)
+        pipe.model = torch.quantization.quantize_dynamic(pipe.model, {torch.nn.Linear}, dtype=torch.qint8)
+        return pipe
+    if backend in ("onnx", "onnx-int8"):
+        return _build_onnx_pipeline(task, model, quantize=backend == "onnx-int8")
+    raise ValueError(f"Backend de inferencia no válido: '{backend}'.")
+
+
+def pipeline_factory(backend):
+    return lambda task, model: build_pipeline(task, model, backend)
+
+
+# --------------------- Exportación a ONNX --------------------- #
+def _build_onnx_pipeline(task, model, quantize=False):
+    try:
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+    except ImportError:
+        raise RuntimeError("El backend ONNX necesita el paquete opcional optimum[onnxruntime].")
+    from transformers import AutoTokenizer, pipeline
+
+    export_dir = os.path.join(ONNX_EXPORT_DIR, model.replace("/", "__"))
+    if not os.path.isdir(export_dir):
+        logger.info(f"Exportando '{model}' a ONNX en {export_dir}...")
+        ort_model = ORTModelForSequenceClassification.from_pretrained(model, export=True)
+        ort_model.save_pretrained(export_dir)
+        AutoTokenizer.from_pretrained(model).save_pretrained(export_dir)
+
+    file_name = "model.onnx"
+    if quantize:
+        file_name = "model_quantized.onnx"
+        if not os.path.exists(os.path.join(export_dir, file_name)):
+            from optimum.onnxruntime import ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+            logger.info(f"Cuantizando '{model}' a int8 con ONNX Runtime...")
+            quantizer = ORTQuantizer.from_pretrained(export_dir)
+            quantizer.quantize(save_dir=export_dir, quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False))
+
+    ort_model = ORTModelForSequenceClassification.from_pretrained(export_dir, file_name=file_name)
+    tokenizer = AutoTokenizer.from_pretrained(export_dir)
+    return pipeline(task, model=ort_model, tokenizer=tokenizer)
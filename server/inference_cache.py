@@ -0,0 +1,157 @@
+"""
+Caché de resultados de inferencia
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo contiene la definición de la clase InferenceCache, una caché direccionada por contenido para las
+salidas de los modelos. La clave es un hash de (modelo, texto normalizado, etiquetas candidatas). Tiene un nivel en
+memoria acotado con desalojo LRU, un nivel opcional en disco (tabla SQLite) que sobrevive a los reinicios y
+caducidad por TTL. Lleva contadores de aciertos, fallos y desalojos.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------- Claves de la caché --------------------- #
+def normalize_text(text):
+    # Los espacios redundantes no cambian el resultado del modelo, así que no deben cambiar la clave
+    return " ".join(text.split())
+
+
+def cache_key(model, text, candidate_labels=None):
+    payload = json.dumps([model, normalize_text(text), list(candidate_labels or [])], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# --------------------- Caché de inferencia --------------------- #
+class InferenceCache:
+    def __init__(self, max_entries=10000, ttl_seconds=None, db_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        if db_path:
+            self._open_disk_tier()
+            # Un proceso hijo (workers con el modelo precargado) no puede reutilizar la conexión SQLite del padre
+            os.register_at_fork(after_in_child=self._reopen_after_fork)
+
+
+    # --------------------- Nivel persistente en disco --------------------- #
+    def _open_disk_tier(self):
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS inference_cache
+                            (key TEXT PRIMARY KEY,
+                            value TEXT,
+                            created_at REAL)''')
+        self._conn.commit()
+
+    def _reopen_after_fork(self):
+        self._lock = threading.Lock()
+        self._open_disk_tier()
+
+    def _disk_get(self, key):
+        row = self._conn.execute("SELECT value, created_at FROM inference_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        if self._expired(created_at):
+            self._conn.execute("DELETE FROM inference_cache WHERE key = ?", (key,))
+            self._conn.commit()
+            self._counters["expirations"] += 1
+            return None
+        return json.loads(value), created_at
+
+    def _disk_set_many(self, items, created_at):
+        self._conn.executemany("INSERT OR REPLACE INTO inference_cache (key, value, created_at) VALUES (?, ?, ?)",
+                               [(key, json.dumps(value), created_at) for key, value in items.items()])
+        self._conn.commit()
+
+
+    # --------------------- Lectura y escritura --------------------- #
+    def _expired(self, created_at):
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def _remember(self, key, value, created_at):
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and self._expired(entry[1]):
+                    del self._entries[key]
+                    self._counters["expirations"] += 1
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    found[key] = entry[0]
+                    continue
+                if self._conn is not None:
+                    entry = self._disk_get(key)
+                    if entry is not None:
+                        # Promoción al nivel en memoria
+                        self._remember(key, entry[0], entry[1])
+                        self._counters["disk_hits"] += 1
+                        found[key] = entry[0]
+                        continue
+                self._counters["misses"] += 1
+        return found
+
+    def set_many(self, items):
+        if not items:
+            return
+        created_at = time.time()
+        with self._lock:
+            for key, value in items.items():
+                self._remember(key, value, created_at)
+            if self._conn is not None:
+                try:
+                    self._disk_set_many(items, created_at)
+                except sqlite3.Error as e:
+                    logger.error(f"Error al escribir en la caché persistente: {e}")
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM inference_cache")
+                self._conn.commit()
+
+
+    # --------------------- Estadísticas --------------------- #
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["disk_hits"] + self._counters["misses"]
+            return dict(
+                self._counters,
+                entries=len(self._entries),
+                max_entries=self.max_entries,
+                ttl_seconds=self.ttl_seconds,
+                persistent=self._conn is not None,
+                hit_rate=round((self._counters["hits"] + self._counters["disk_hits"]) / lookups, 4) if lookups else 0,
+            )
@@ -0,0 +1,98 @@
+"""
+Ejecutor acotado para la inferencia de los modelos
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo contiene la definición de la clase InferenceExecutor, que ejecuta las llamadas bloqueantes de PyTorch
+en un pool de hilos dedicado de tamaño configurable, fuera del bucle de eventos de asyncio. El número de hilos
+intra-op de torch se reparte entre los hilos del pool para no sobresuscribir la CPU. Cuando el pool y su cola de
+espera están llenos se rechaza la tarea con ExecutorSaturado, que los endpoints traducen a un 429.
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturado(Exception):
+    pass
+
+
+# --------------------- Configuración de hilos de torch --------------------- #
+def configure_torch_threads(pool_size):
+    # Cada hilo del pool recibe una parte proporcional de los núcleos para las operaciones intra-op
+    try:
+        import torch
+    except ImportError:
+        return None
+    threads = max(1, (os.cpu_count() or 1) // max(1, pool_size))
+    torch.set_num_threads(threads)
+    logger.info(f"Hilos intra-op de torch: {threads} (pool de inferencia de {pool_size} hilos).")
+    return threads
+
+
+# --------------------- Ejecutor de inferencia --------------------- #
+class InferenceExecutor:
+    def __init__(self, max_workers=2, max_queue=8):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+
+    def start(self):
+        if self._executor is None:
+            configure_torch_threads(self.max_workers)
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    async def run(self, fn, *args, **kwargs):
+        if self._executor is None:
+            self.start()
+        # Contrapresión: no se acepta más trabajo del que cabe en el pool más su cola de espera
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ExecutorSaturado("El servicio de inferencia está saturado, inténtelo de nuevo más tarde.")
+
+        with self._lock:
+            self._in_flight += 1
+        # El hueco se libera cuando termina el hilo, no cuando se cancela la corrutina que espera (cliente desconectado
+        # o plazo vencido): la tarea sigue ocupando el pool hasta acabar y el límite debe contarla
+        # (el futuro de asyncio se da por terminado al cancelarlo; el de concurrent.futures, solo al acabar el hilo o si
+        # se cancela antes de empezar)
+        try:
+            # El hilo ejecuta la tarea con el contexto de la petición (plazo incluido), como asyncio.to_thread
+            context = contextvars.copy_context()
+            future = self._executor.submit(functools.partial(context.run, fn, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "rejected": self._rejected,
+            }
@@ -0,0 +1,204 @@
+"""
+Métricas de la aplicación en formato Prometheus
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo define contadores, indicadores (gauges) e histogramas con etiquetas y un registro que los expone en el
+formato de texto de Prometheus a través del endpoint /metrics. También declara las métricas de los puntos calientes
+de la aplicación (scraping, inferencia, base de datos y peticiones HTTP) para que cada módulo solo tenga que
+importarlas y observar los tiempos. Los valores que ya mantienen otras clases (cachés, colas) se exponen mediante
+funciones de lectura, sin duplicar contadores.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# --------------------- Tipos de métricas --------------------- #
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"La métrica '{self.name}' espera las etiquetas {self.labelnames}.")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, upper in enumerate(self.buckets):
+                if value <= upper:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self._lock:
+            values = {key: (list(state[0]), state[1], state[2]) for key, state in self._values.items()}
+        lines = self.header()
+        for key, (bucket_counts, total, count) in values.items():
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(upper))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    # Métrica cuyo valor se lee en el momento de exponerla: fn devuelve {tupla de etiquetas: valor}
+    def __init__(self, name, documentation, fn, labelnames=(), kind="gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self):
+        try:
+            values = self.fn()
+        except Exception:
+            return []
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                                for key, value in values.items() if value is not None]
+
+
+# --------------------- Registro de métricas --------------------- #
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, fn, labelnames=(), kind="gauge"):
+        return self.register(CallbackMetric(name, documentation, fn, labelnames, kind))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# --------------------- Métricas de los puntos calientes --------------------- #
+SCRAPE_SECONDS = registry.histogram(
+    "sentiment_scrape_seconds", "Duración de cada intento de scraping por sitio", ("site", "attempt", "outcome"))
+SCRAPED_REVIEWS = registry.counter(
+    "sentiment_scraped_reviews_total", "Reseñas extraídas por sitio", ("site",))
+INFERENCE_BATCH_SECONDS = registry.histogram(
+    "sentiment_inference_batch_seconds", "Latencia de cada lote de inferencia por modelo", ("model",))
+INFERENCE_BATCH_ITEMS = registry.histogram(
+    "sentiment_inference_batch_size", "Número de textos por lote de inferencia", ("model",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+INFERENCE_ERRORS = registry.counter(
+    "sentiment_inference_batch_errors_total", "Lotes de inferencia fallidos (reintentados por reseña)", ("model",))
+CHUNKED_REVIEWS = registry.counter(
+    "sentiment_chunked_reviews_total", "Reseñas largas divididas en ventanas por modelo", ("model",))
+DUPLICATE_REVIEWS = registry.counter(
+    "sentiment_duplicate_reviews_total", "Reseñas repetidas o casi idénticas que no se envían a los modelos",
+    ("kind", "stage"))
+DB_SESSION_SECONDS = registry.histogram(
+    "sentiment_db_session_seconds", "Duración de cada sesión (transacciones) con la base de datos")
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "sentiment_http_request_seconds", "Duración de las peticiones HTTP", ("method", "route", "status"))
+HTTP_IN_FLIGHT = registry.gauge(
+    "sentiment_http_requests_in_flight", "Peticiones HTTP en curso")
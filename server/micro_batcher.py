@@ -0,0 +1,132 @@
+"""
+Agrupación dinámica de peticiones de inferencia (micro-batching)
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo contiene la definición de la clase MicroBatcher. Las peticiones individuales de distintos clientes
+HTTP se encolan y un hilo trabajador las envía juntas al modelo cuando el lote alcanza el tamaño máximo o cuando
+vence el tiempo máximo de espera del primer elemento. Cada resultado se devuelve al llamante a través de un Future.
+Se exponen la profundidad de la cola, el histograma de tamaños de lote y los tiempos de espera.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _PendingItem:
+    __slots__ = ("payload", "future", "enqueued_at")
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    def __init__(self, name, batch_fn, max_batch_size=16, max_wait_ms=10):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = {}
+        self._wait_ms = deque(maxlen=1000)
+        self._batches = 0
+        self._items = 0
+
+
+    # --------------------- Arranque y parada del trabajador --------------------- #
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name=f"micro-batcher-{self.name}", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=5):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+
+    # --------------------- Envío de peticiones --------------------- #
+    def submit(self, payload):
+        # Se arranca el trabajador con la primera petición para no crear hilos al importar el módulo
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        item = _PendingItem(payload)
+        self._queue.put(item)
+        return item.future
+
+
+    # --------------------- Bucle del trabajador --------------------- #
+    def _collect_batch(self, first):
+        batch = [first]
+        flush_at = first.enqueued_at + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = flush_at - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _worker(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+
+            batch = self._collect_batch(first)
+            flushed_at = time.perf_counter()
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+                self._wait_ms.extend((flushed_at - item.enqueued_at) * 1000 for item in batch)
+
+            try:
+                results = self.batch_fn([item.payload for item in batch])
+            except Exception as e:
+                logger.error(f"Error en el lote de '{self.name}': {e}")
+                for item in batch:
+                    item.future.set_exception(e)
+                continue
+
+            for item, result in zip(batch, results):
+                item.future.set_result(result)
+
+
+    # --------------------- Estadísticas --------------------- #
+    def stats(self):
+        with self._stats_lock:
+            waits = sorted(self._wait_ms)
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "batches": self._batches,
+                "items": self._items,
+                "average_batch_size": round(self._items / self._batches, 2) if self._batches else 0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "wait_ms": {
+                    "average": round(sum(waits) / len(waits), 3) if waits else 0,
+                    "p50": round(waits[len(waits) // 2], 3) if waits else 0,
+                    "p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0,
+                    "max": round(waits[-1], 3) if waits else 0,
+                },
+            }
@@ -0,0 +1,178 @@
+"""
+Registro de modelos de NLP
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo contiene la definición de la clase ModelRegistry, que mantiene una única instancia por proceso de cada
+pipeline de transformers utilizado por la aplicación. Los modelos se cargan una sola vez y se comparten entre todos
+los endpoints, pudiendo precargarse al arrancar, descargarse o recargarse de forma explícita. Para cada modelo se
+registra el tiempo de carga y la memoria residente que ocupa.
+"""
+
+import gc
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------- Medición de memoria --------------------- #
+def memoria_residente_bytes():
+    # Memoria residente (RSS) actual del proceso, leída de /proc cuando está disponible
+    try:
+        with open("/proc/self/statm") as statm:
+            paginas_residentes = int(statm.read().split()[1])
+        return paginas_residentes * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def tamano_parametros_bytes(pipe):
+    # Tamaño de los pesos del modelo, independiente de lo que el sistema operativo haya paginado
+    model = getattr(pipe, "model", None)
+    if model is None or not hasattr(model, "parameters"):
+        return None
+    try:
+        return sum(p.numel() * p.element_size() for p in model.parameters())
+    except Exception:
+        return None
+
+
+# --------------------- Registro de modelos --------------------- #
+class ModelRegistry:
+    def __init__(self):
+        self._specs = {}
+        self._pipelines = {}
+        self._stats = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+        self._warm_up_thread = None
+        self._warm_up_error = None
+
+
+    # --------------------- Registro de modelos disponibles --------------------- #
+    def register(self, name, task, model, factory=None, metadata=None):
+        # Por defecto se construye con transformers.pipeline; factory permite sustituir la construcción
+        with self._registry_lock:
+            self._specs[name] = {"task": task, "model": model, "factory": factory}
+            self._locks.setdefault(name, threading.Lock())
+            self._stats.setdefault(name, {"task": task, "model": model, "loaded": False, "load_count": 0})
+            self._stats[name].update(metadata or {})
+
+    def names(self):
+        return list(self._specs)
+
+
+    # --------------------- Carga y obtención de modelos --------------------- #
+    def _build(self, spec):
+        if spec["factory"] is not None:
+            return spec["factory"](spec["task"], spec["model"])
+        from transformers import pipeline
+        return pipeline(spec["task"], model=spec["model"])
+
+    def get(self, name):
+        pipe = self._pipelines.get(name)
+        if pipe is not None:
+            return pipe
+
+        if name not in self._specs:
+            raise KeyError(f"Modelo no registrado: '{name}'.")
+
+        # Un cerrojo por modelo: dos peticiones simultáneas no cargan el mismo modelo dos veces
+        with self._locks[name]:
+            pipe = self._pipelines.get(name)
+            if pipe is not None:
+                return pipe
+
+            spec = self._specs[name]
+            logger.info(f"Cargando modelo '{name}' ({spec['model']})...")
+            rss_before = memoria_residente_bytes()
+            start = time.perf_counter()
+            pipe = self._build(spec)
+            load_seconds = time.perf_counter() - start
+            rss_after = memoria_residente_bytes()
+
+            stats = self._stats[name]
+            stats.update({
+                "loaded": True,
+                "load_count": stats["load_count"] + 1,
+                "load_seconds": round(load_seconds, 3),
+                "loaded_at": time.time(),
+                "rss_delta_bytes": (rss_after - rss_before) if rss_before is not None and rss_after is not None else None,
+                "parameter_bytes": tamano_parametros_bytes(pipe),
+            })
+            self._pipelines[name] = pipe
+            logger.info(f"Modelo '{name}' cargado en {load_seconds:.2f} s.")
+            return pipe
+
+    def is_loaded(self, name):
+        return name in self._pipelines
+
+    def warm_up(self, names=None):
+        for name in names or self.names():
+            self.get(name)
+
+
+    # --------------------- Precarga en segundo plano y disponibilidad --------------------- #
+    def warm_up_in_background(self, names=None):
+        # La aplicación acepta conexiones mientras los modelos se cargan en un hilo aparte
+        if self._warm_up_thread is not None and self._warm_up_thread.is_alive():
+            return self._warm_up_thread
+
+        def run():
+            try:
+                self.warm_up(names)
+                self._warm_up_error = None
+            except Exception as e:
+                self._warm_up_error = str(e)
+                logger.error(f"Error al precargar los modelos: {e}")
+
+        self._warm_up_thread = threading.Thread(target=run, name="model-warm-up", daemon=True)
+        self._warm_up_thread.start()
+        return self._warm_up_thread
+
+    def ready(self, names=None):
+        return all(self.is_loaded(name) for name in (self.names() if names is None else names))
+
+    def readiness(self, names=None):
+        names = self.names() if names is None else names
+        return {
+            "ready": self.ready(names),
+            "loading": self._warm_up_thread is not None and self._warm_up_thread.is_alive(),
+            "error": self._warm_up_error,
+            "models": {name: self.is_loaded(name) for name in self.names()},
+        }
+
+
+    # --------------------- Descarga y recarga de modelos --------------------- #
+    def unload(self, name):
+        if name not in self._specs:
+            raise KeyError(f"Modelo no registrado: '{name}'.")
+        with self._locks[name]:
+            pipe = self._pipelines.pop(name, None)
+            self._stats[name]["loaded"] = False
+        if pipe is not None:
+            del pipe
+            gc.collect()
+            logger.info(f"Modelo '{name}' descargado.")
+            return True
+        return False
+
+    def reload(self, name):
+        self.unload(name)
+        return self.get(name)
+
+
+    # --------------------- Estadísticas --------------------- #
+    def stats(self):
+        return {
+            "process_rss_bytes": memoria_residente_bytes(),
+            "models": {name: dict(stats) for name, stats in self._stats.items()},
+        }
@@ -0,0 +1,362 @@
+"""
+Servidor de modelos para el despliegue con varios workers
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Con varios workers HTTP cada proceso cargaba su propia copia de los modelos. En este modo los modelos se cargan solo
+en uno o varios procesos servidores de modelos dedicados, y los workers HTTP (ligeros, sin PyTorch en memoria) les
+envían las llamadas de inferencia por IPC local con multiprocessing.connection (socket Unix o TCP, con clave de
+autenticación). Por la conexión viajan solo los textos y los resultados: la tokenización, los tensores, la división
+en ventanas y la caché de inferencia viven en el servidor, de modo que la caché se comparte entre todos los workers.
+Los workers se activan en este modo con SENTIMENT_MODEL_SERVER_ADDRESS (varias direcciones separadas por comas para
+varias réplicas) y el número de workers es independiente del número de réplicas.
+
+Por la conexión viajan objetos serializados con pickle, así que quien pueda conectarse podría ejecutar código en el
+servidor: nunca se usa una clave conocida. Con TCP la clave SENTIMENT_MODEL_SERVER_AUTHKEY es obligatoria en el
+servidor y en los workers; con un socket Unix, si no se indica, el servidor genera una aleatoria y la guarda junto al
+socket (fichero .key legible solo por el usuario), de donde la leen los workers. El socket por defecto se crea en una
+carpeta privada del usuario, no directamente en /tmp.
+
+Uso (desde la carpeta server):
+    python model_server.py --address /run/user/1000/sentiment-models-1000/models.sock
+    SENTIMENT_MODEL_SERVER_ADDRESS=/run/user/1000/sentiment-models-1000/models.sock uvicorn sentimentAnalysisApp:app --workers 4
+Con gunicorn, SENTIMENT_MODEL_SERVERS=N arranca N réplicas automáticamente (ver gunicorn.conf.py).
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import secrets
+import stat
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from model_registry import memoria_residente_bytes
+
+logger = logging.getLogger(__name__)
+
+MODEL_SERVER_AUTHKEY = os.getenv("SENTIMENT_MODEL_SERVER_AUTHKEY", "")
+MODEL_SERVER_TIMEOUT_S = float(os.getenv("SENTIMENT_MODEL_SERVER_TIMEOUT_S", "300"))
+# Tiempo durante el que no se envían llamadas a una réplica que ha fallado
+MODEL_SERVER_RETRY_S = float(os.getenv("SENTIMENT_MODEL_SERVER_RETRY_S", "5"))
+
+# Excepciones que se vuelven a lanzar con su tipo en el worker (errores de la petición, no del servidor)
+REMOTE_EXCEPTIONS = {"ValueError": ValueError, "KeyError": KeyError}
+
+
+class RemoteInferenceError(RuntimeError):
+    pass
+
+
+def parse_address(address):
+    # "host:puerto" para TCP; cualquier otra cosa es la ruta de un socket Unix (o una tubería con nombre en Windows)
+    address = address.strip()
+    if address.startswith("unix:"):
+        return address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def parse_addresses(addresses):
+    return [parse_address(address) for address in addresses.split(",") if address.strip()]
+
+
+# --------------------- Sockets y claves de autenticación --------------------- #
+def private_socket_dir():
+    # Carpeta del usuario actual (0700) para los sockets Unix y sus claves; se rechaza si otro usuario la controla
+    uid = os.getuid() if hasattr(os, "getuid") else None
+    base = os.getenv("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    path = os.path.join(base, f"sentiment-models-{uid if uid is not None else 'user'}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if uid is not None and (not stat.S_ISDIR(info.st_mode) or info.st_uid != uid or info.st_mode & 0o077):
+        raise RuntimeError(f"La carpeta de sockets {path} no es privada del usuario actual.")
+    return path
+
+
+def default_address():
+    return os.path.join(private_socket_dir(), "models.sock")
+
+
+def authkey_path(address):
+    # Solo los sockets Unix tienen fichero de clave; con TCP la clave se indica siempre de forma explícita
+    return None if isinstance(address, tuple) else f"{address}.key"
+
+
+def server_authkey(address):
+    if MODEL_SERVER_AUTHKEY:
+        return MODEL_SERVER_AUTHKEY
+    path = authkey_path(address)
+    if path is None:
+        raise RuntimeError("Un servidor de modelos en TCP necesita SENTIMENT_MODEL_SERVER_AUTHKEY: sin ella cualquiera "
+                           "que alcance el puerto podría ejecutar código en el servidor.")
+    authkey = secrets.token_hex(16)
+    if os.path.exists(path):
+        os.unlink(path)
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as key_file:
+        key_file.write(authkey)
+    return authkey
+
+
+def client_authkey(address):
+    # Si el fichero aún no existe (servidor sin arrancar) el OSError se trata como una réplica no disponible
+    if MODEL_SERVER_AUTHKEY:
+        return MODEL_SERVER_AUTHKEY
+    with open(authkey_path(address)) as key_file:
+        return key_file.read().strip()
+
+
+# --------------------- Servidor de modelos --------------------- #
+def inference_methods():
+    # Llamadas que puede hacer un worker; se importan aquí para que los workers no carguen nada de esto
+    import inference
+
+    def stats():
+        cache = inference.inference_cache.stats() if inference.inference_cache is not None else None
+        return dict(inference.model_registry.stats(), inference_cache=cache)
+
+    def reload(name):
+        inference.model_registry.reload(name)
+        return inference.model_registry.stats()["models"][name]
+
+    return {
+        "predict_sentiment_batch": inference.predict_sentiment_batch,
+        "predict_emotion_batch": inference.predict_emotion_batch,
+        "readiness": inference.model_registry.readiness,
+        "stats": stats,
+        "unload": inference.model_registry.unload,
+        "reload": reload,
+    }
+
+
+class ModelServer:
+    def __init__(self, address, methods, authkey=None):
+        self.address = address
+        self.methods = methods
+        self.authkey = (authkey or server_authkey(address)).encode("utf-8")
+        self._listener = None
+        self._stopping = threading.Event()
+        self._connections = 0
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def _remove_stale_socket(self):
+        # Un socket Unix de una ejecución anterior impediría escuchar en la misma ruta
+        if isinstance(self.address, str) and os.path.exists(self.address) and stat.S_ISSOCK(os.stat(self.address).st_mode):
+            os.unlink(self.address)
+
+    def serve_forever(self):
+        self._remove_stale_socket()
+        self._listener = Listener(self.address, authkey=self.authkey, backlog=64)
+        if not isinstance(self.address, tuple):
+            os.chmod(self.address, 0o600)
+        logger.info(f"Servidor de modelos escuchando en {self.address}.")
+        try:
+            while not self._stopping.is_set():
+                try:
+                    connection = self._listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    if self._stopping.is_set():
+                        break
+                    logger.error(f"Conexión rechazada en el servidor de modelos: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(connection,), name="model-server-connection", daemon=True).start()
+        finally:
+            self._listener.close()
+
+    def stop(self):
+        self._stopping.set()
+        if self._listener is not None:
+            self._listener.close()
+
+    def _serve_connection(self, connection):
+        # Cada conexión de un worker atiende sus llamadas en orden; varias conexiones se atienden en paralelo
+        with self._lock:
+            self._connections += 1
+        try:
+            while True:
+                try:
+                    method, args, kwargs = connection.recv()
+                except (EOFError, OSError):
+                    return
+                function = self.methods.get(method)
+                try:
+                    if function is None:
+                        raise ValueError(f"Llamada no permitida en el servidor de modelos: '{method}'.")
+                    response = ("ok", function(*args, **kwargs))
+                except Exception as e:
+                    logger.error(f"Error en la llamada '{method}' del servidor de modelos: {e}")
+                    response = ("error", type(e).__name__, str(e))
+                with self._lock:
+                    self._calls += 1
+                connection.send(response)
+        finally:
+            with self._lock:
+                self._connections -= 1
+            connection.close()
+
+
+# --------------------- Cliente de los workers HTTP --------------------- #
+class _Replica:
+    def __init__(self, address):
+        self.address = address
+        self.authkey = None
+        self.idle = []
+        self.in_flight = 0
+        self.failed_until = 0.0
+
+
+class RemoteModelClient:
+    # Misma interfaz que ModelRegistry para la aplicación (readiness, stats, unload, reload) más call()
+    def __init__(self, addresses, authkey=None, timeout=MODEL_SERVER_TIMEOUT_S):
+        self.replicas = [_Replica(address) for address in parse_addresses(addresses)]
+        if not self.replicas:
+            raise ValueError("No se ha indicado ninguna dirección de servidor de modelos.")
+        self.authkey = (authkey or MODEL_SERVER_AUTHKEY).encode("utf-8") or None
+        if self.authkey is None and any(isinstance(replica.address, tuple) for replica in self.replicas):
+            raise ValueError("Los servidores de modelos en TCP necesitan SENTIMENT_MODEL_SERVER_AUTHKEY.")
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._order = itertools.count()
+
+    def _pick(self):
+        # La réplica disponible con menos llamadas en curso (en turno rotatorio si empatan)
+        with self._lock:
+            now = time.monotonic()
+            available = [replica for replica in self.replicas if replica.failed_until <= now] or self.replicas
+            offset = next(self._order)
+            ordered = available[offset % len(available):] + available[:offset % len(available)]
+            replica = min(ordered, key=lambda candidate: candidate.in_flight)
+            replica.in_flight += 1
+            connection = replica.idle.pop() if replica.idle else None
+        return replica, connection
+
+    def _call_replica(self, replica, connection, method, args, kwargs):
+        try:
+            if connection is None:
+                # La clave de cada réplica se lee al conectar: el servidor la crea al arrancar
+                if replica.authkey is None:
+                    replica.authkey = self.authkey or client_authkey(replica.address).encode("utf-8")
+                connection = Client(replica.address, authkey=replica.authkey)
+            connection.send((method, args, kwargs))
+            if not connection.poll(self.timeout):
+                raise TimeoutError(f"El servidor de modelos {replica.address} no ha respondido en {self.timeout} s.")
+            response = connection.recv()
+        except BaseException as e:
+            if isinstance(e, AuthenticationError):
+                # El servidor se ha reiniciado con otra clave: se vuelve a leer en la siguiente conexión
+                replica.authkey = None
+            if connection is not None:
+                connection.close()
+            with self._lock:
+                replica.in_flight -= 1
+            raise
+        with self._lock:
+            replica.in_flight -= 1
+            replica.idle.append(connection)
+        if response[0] == "ok":
+            return response[1]
+        _, error_type, message = response
+        raise REMOTE_EXCEPTIONS.get(error_type, RemoteInferenceError)(message)
+
+    def call(self, method, *args, **kwargs):
+        # Si la réplica no responde se marca como caída un tiempo y se reintenta una vez en otra
+        last_error = None
+        for _ in range(2 if len(self.replicas) > 1 else 1):
+            replica, connection = self._pick()
+            try:
+                return self._call_replica(replica, connection, method, args, kwargs)
+            except (OSError, EOFError, AuthenticationError) as e:
+                last_error = e
+                replica.failed_until = time.monotonic() + MODEL_SERVER_RETRY_S
+                logger.error(f"Error de comunicación con el servidor de modelos {replica.address}: {e}")
+        raise RemoteInferenceError(f"Servidor de modelos no disponible: {last_error}")
+
+    def call_all(self, method, *args, **kwargs):
+        # {dirección: resultado o excepción} de todas las réplicas
+        results = {}
+        for replica in self.replicas:
+            with self._lock:
+                replica.in_flight += 1
+                connection = replica.idle.pop() if replica.idle else None
+            try:
+                results[str(replica.address)] = self._call_replica(replica, connection, method, args, kwargs)
+            except Exception as e:
+                results[str(replica.address)] = e
+        return results
+
+
+    # --------------------- Interfaz de ModelRegistry --------------------- #
+    def warm_up(self, names=None):
+        # Cada servidor de modelos carga sus modelos al arrancar
+        return None
+
+    def warm_up_in_background(self, names=None):
+        return None
+
+    def readiness(self, names=None):
+        replicas = {address: ({"ready": False, "error": str(result)} if isinstance(result, Exception) else result)
+                    for address, result in self.call_all("readiness", names).items()}
+        states = list(replicas.values())
+        return {
+            "ready": any(state["ready"] for state in states),
+            "loading": any(state.get("loading") for state in states),
+            "error": next((state["error"] for state in states if state.get("error")), None),
+            "models": next((state["models"] for state in states if "models" in state), {}),
+            "model_servers": replicas,
+        }
+
+    def stats(self):
+        replicas = {address: ({"error": str(result)} if isinstance(result, Exception) else result)
+                    for address, result in self.call_all("stats").items()}
+        return {
+            "process_rss_bytes": memoria_residente_bytes(),
+            "models": next((state["models"] for state in replicas.values() if "models" in state), {}),
+            "model_servers": replicas,
+        }
+
+    def unload(self, name):
+        results = self.call_all("unload", name)
+        errors = [result for result in results.values() if isinstance(result, Exception)]
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        return any(result is True for result in results.values())
+
+    def reload(self, name):
+        results = self.call_all("reload", name)
+        errors = [result for result in results.values() if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+        return results
+
+
+# --------------------- Arranque desde la línea de comandos --------------------- #
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de modelos para los workers HTTP")
+    parser.add_argument("--address", default=os.getenv("SENTIMENT_MODEL_SERVER_LISTEN"),
+                        help="Ruta del socket Unix o host:puerto (por defecto, un socket en una carpeta privada)")
+    args = parser.parse_args()
+    address = parse_address(args.address) if args.address else default_address()
+    logging.basicConfig(level=logging.INFO)
+
+    # El servidor ejecuta la inferencia localmente aunque herede la dirección de los workers
+    os.environ.pop("SENTIMENT_MODEL_SERVER_ADDRESS", None)
+    methods = inference_methods()
+    import inference
+    inference.model_registry.warm_up_in_background()
+
+    server = ModelServer(address, methods)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Limitador de peticiones por dominio
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo contiene las clases TokenBucket y DomainRateLimiter. Antes de cada navegación el scraping reserva un
+token del cubo del dominio de destino: mientras haya tokens la navegación es inmediata y, cuando se agotan, se
+espera justo el tiempo necesario para que se repongan. Así se respeta un ritmo máximo por sitio sin las esperas
+aleatorias fijas de antes, y las navegaciones a dominios distintos no se retrasan entre sí.
+"""
+
+import asyncio
+import random
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second, burst):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.acquired = 0
+        self.waited_seconds = 0.0
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate_per_second)
+        self.updated = now
+
+    def reserve(self):
+        # Se reserva el token al momento (el saldo puede quedar negativo) y se devuelve la espera necesaria;
+        # como no hay await entre la lectura y la reserva, las esperas quedan en orden de llegada
+        self.refill()
+        self.tokens -= 1
+        self.acquired += 1
+        wait = max(0.0, -self.tokens / self.rate_per_second)
+        self.waited_seconds += wait
+        return wait
+
+
+class DomainRateLimiter:
+    def __init__(self, rate_per_second=0.5, burst=2, jitter_seconds=0.0):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.jitter_seconds = jitter_seconds
+        self._buckets = {}
+
+    @staticmethod
+    def domain(url):
+        host = (urlparse(url).hostname or url).lower()
+        return host[4:] if host.startswith("www.") else host
+
+    async def acquire(self, url):
+        domain = self.domain(url)
+        bucket = self._buckets.get(domain)
+        if bucket is None:
+            bucket = self._buckets[domain] = TokenBucket(self.rate_per_second, self.burst)
+        wait = bucket.reserve()
+        if self.jitter_seconds:
+            wait += random.uniform(0, self.jitter_seconds)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def stats(self):
+        for bucket in self._buckets.values():
+            bucket.refill()
+        return {
+            "rate_per_second": self.rate_per_second,
+            "burst": self.burst,
+            "domains": {
+                domain: {
+                    "tokens": round(bucket.tokens, 3),
+                    "acquired": bucket.acquired,
+                    "waited_seconds": round(bucket.waited_seconds, 3),
+                }
+                for domain, bucket in self._buckets.items()
+            },
+        }
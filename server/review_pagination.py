@@ -0,0 +1,156 @@
+"""
+Paginación y scroll infinito para la extracción de reseñas
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo contiene el controlador que carga más reseñas de una página hasta alcanzar el número pedido. Cada sitio
+avanza de una forma distinta: Google Reviews carga más reseñas al desplazar su panel lateral, mientras que
+TripAdvisor y Yelp paginan con un botón "siguiente". La extracción es incremental: solo se leen los nodos de reseña
+añadidos desde la ronda anterior (se marcan en el DOM), las reseñas repetidas se descartan y la paginación se
+detiene antes de tiempo cuando ya no aparece nada nuevo.
+"""
+
+import asyncio
+import logging
+import os
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+logger = logging.getLogger(__name__)
+
+SEEN_ATTRIBUTE = "data-sa-seen"
+
+# "dom": el texto se lee directamente en la página; "html": se transfiere el HTML de los nodos y se analiza en Python
+EXTRACTION_MODE = os.getenv("SENTIMENT_EXTRACTION_MODE", "dom")
+# Tiempo máximo de espera a que aparezcan las reseñas de la página siguiente
+NEXT_PAGE_TIMEOUT_MS = int(os.getenv("SENTIMENT_NEXT_PAGE_TIMEOUT_MS", "10000"))
+
+# Devuelve el HTML de los nodos de reseña que aún no se habían leído y los marca como leídos
+COLLECT_NEW_NODES_JS = """
+([selector, attribute]) => {
+    const nodes = Array.from(document.querySelectorAll(selector)).filter(node => !node.hasAttribute(attribute));
+    nodes.forEach(node => node.setAttribute(attribute, "1"));
+    return nodes.map(node => node.outerHTML);
+}
+"""
+
+# Igual que el anterior, pero devuelve directamente el texto de cada nodo sin serializar su HTML
+COLLECT_NEW_TEXTS_JS = """
+([selector, attribute]) => {
+    const nodes = Array.from(document.querySelectorAll(selector)).filter(node => !node.hasAttribute(attribute));
+    nodes.forEach(node => node.setAttribute(attribute, "1"));
+    return nodes.map(node => node.textContent);
+}
+"""
+
+# Indica si hay nodos de reseña sin leer: tras pulsar "siguiente", la página nueva (o la lista actualizada) ya está cargada
+NEW_REVIEWS_PRESENT_JS = """
+([selector, attribute]) => Array.from(document.querySelectorAll(selector)).some(node => !node.hasAttribute(attribute))
+"""
+
+# Desplaza hasta el final el contenedor con scroll más cercano a la última reseña (o la ventana si no existe)
+SCROLL_REVIEWS_JS = """
+(selector) => {
+    const nodes = document.querySelectorAll(selector);
+    let container = nodes.length ? nodes[nodes.length - 1].parentElement : null;
+    while (container && container.scrollHeight <= container.clientHeight) {
+        container = container.parentElement;
+    }
+    container = container || document.scrollingElement;
+    container.scrollTop = container.scrollHeight;
+}
+"""
+
+
+# --------------------- Estrategias de avance por sitio --------------------- #
+async def scroll_reviews(page, selector, **_):
+    await page.evaluate(SCROLL_REVIEWS_JS, selector)
+    return True
+
+
+async def click_next_page(page, selector, next_selector=None, **_):
+    if not next_selector or not await page.is_visible(next_selector):
+        return False
+    await page.click(next_selector)
+    # El documento actual ya está en "domcontentloaded": se espera a que la lista de reseñas cambie, tanto si el clic
+    # navega a otra página como si la actualiza en el sitio (la espera se repite en el documento nuevo)
+    try:
+        await page.wait_for_function(NEW_REVIEWS_PRESENT_JS, arg=[selector, SEEN_ATTRIBUTE], timeout=NEXT_PAGE_TIMEOUT_MS)
+    except Exception as e:
+        # Sin reseñas nuevas la siguiente ronda cuenta como vacía y el controlador termina por inactividad
+        logger.warning(f"No han aparecido reseñas nuevas tras pasar de página: {e}")
+    return True
+
+
+# --------------------- Análisis de HTML en Python --------------------- #
+def class_selector_to_xpath(selector):
+    # Traduce selectores de clase simples ('.a.b') a XPath para no depender de cssselect
+    classes = [name for name in selector.split('.') if name]
+    conditions = " and ".join(f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')" for name in classes)
+    return f"//*[{conditions}]"
+
+
+def parse_review_fragments(fragments):
+    # Se usa lxml si está instalado; BeautifulSoup con html.parser queda como alternativa
+    if lxml is not None:
+        return [lxml.html.fragment_fromstring(fragment).text_content().strip() for fragment in fragments]
+    return [BeautifulSoup(fragment, 'html.parser').get_text().strip() for fragment in fragments]
+
+
+def extract_reviews_from_html(html, selector, parser="lxml"):
+    # Extracción sobre un documento completo (HTML guardado o el body de la página)
+    if parser == "lxml" and lxml is not None:
+        return [node.text_content().strip() for node in lxml.html.fromstring(html).xpath(class_selector_to_xpath(selector))]
+    bs4_parser = "lxml" if parser == "bs4-lxml" else "html.parser"
+    return [node.get_text().strip() for node in BeautifulSoup(html, bs4_parser).select(selector)]
+
+
+# --------------------- Lectura incremental de nodos --------------------- #
+async def collect_new_reviews(page, selector, mode=None):
+    if (mode or EXTRACTION_MODE) == "dom":
+        try:
+            texts = await page.evaluate(COLLECT_NEW_TEXTS_JS, [selector, SEEN_ATTRIBUTE])
+            return [text.strip() for text in texts]
+        except Exception as e:
+            logger.error(f"Error al leer el texto de las reseñas en la página, se analiza el HTML: {e}")
+    fragments = await page.evaluate(COLLECT_NEW_NODES_JS, [selector, SEEN_ATTRIBUTE])
+    return parse_review_fragments(fragments)
+
+
+# --------------------- Controlador de paginación --------------------- #
+async def paginate_reviews(page, selector, advance, max_reviews, next_selector=None, wait_ms=1500, max_idle_rounds=2):
+    # Generador asíncrono: entrega las reseñas nuevas y sin repetir de cada ronda hasta llegar a max_reviews
+    seen = set()
+    total = 0
+    idle_rounds = 0
+    while total < max_reviews:
+        new_reviews = []
+        for review in await collect_new_reviews(page, selector):
+            key = " ".join(review.split())
+            if review and key not in seen:
+                seen.add(key)
+                new_reviews.append(review)
+        new_reviews = new_reviews[:max_reviews - total]
+
+        if new_reviews:
+            idle_rounds = 0
+            total += len(new_reviews)
+            logger.info(f"Se han extraído {len(new_reviews)} reseñas nuevas ({total} en total).")
+            yield new_reviews
+        else:
+            idle_rounds += 1
+            if idle_rounds >= max_idle_rounds:
+                logger.info("No aparecen reseñas nuevas, se detiene la paginación.")
+                break
+
+        if total >= max_reviews:
+            break
+        if not await advance(page, selector, next_selector=next_selector):
+            logger.info("No hay más páginas de reseñas.")
+            break
+        await asyncio.sleep(wait_ms / 1000)
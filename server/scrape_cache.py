@@ -0,0 +1,89 @@
+"""
+Caché de reseñas extraídas por listado
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo contiene la definición de la clase ScrapeCache, que guarda en la base de datos las reseñas extraídas de
+cada listado junto con su análisis, con la URL normalizada y la opción (GoogleReview, TripAdvisor o Yelp) como clave.
+Dentro de la ventana de frescura la respuesta se sirve directamente desde la caché, sin abrir el navegador; fuera de
+ella se vuelve a extraer el listado y solo se analizan las reseñas que no se habían visto antes.
+"""
+
+import hashlib
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+from inference_cache import normalize_text
+
+CACHE_MODES = ("auto", "incremental", "refresh")
+TRACKING_PARAMETERS = {"fbclid", "gclid", "ref", "entry", "g_ep"}
+
+
+# --------------------- Claves de la caché --------------------- #
+def normalize_listing_url(url):
+    # Misma clave para variaciones de la URL que apuntan al mismo listado
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or "").lower()
+    host = host[4:] if host.startswith("www.") else host
+    query = sorted((name, value) for name, value in parse_qsl(parsed.query)
+                   if not name.lower().startswith("utm_") and name.lower() not in TRACKING_PARAMETERS)
+    return urlunparse(("https", host, parsed.path.rstrip("/"), "", urlencode(query), ""))
+
+
+def listing_key(url, opcion):
+    return f"{opcion}|{normalize_listing_url(url)}"
+
+
+def review_hash(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+# --------------------- Caché de scraping --------------------- #
+class ScrapeCache:
+    def __init__(self, db_manager, freshness_seconds=3600):
+        self.db_manager = db_manager
+        self.freshness_seconds = freshness_seconds
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "incremental": 0, "refreshes": 0, "misses": 0, "reused_reviews": 0, "new_reviews": 0}
+
+    def lookup(self, url, opcion):
+        with self.db_manager.session() as db:
+            listing = db.get_scraped_listing(listing_key(url, opcion))
+        if listing is not None:
+            listing["age_seconds"] = time.time() - listing["scraped_at"]
+        return listing
+
+    def is_fresh(self, listing, max_reviews, max_age=None):
+        # Fresca si está dentro de la ventana y cubre las reseñas pedidas (o el listado no tenía más)
+        max_age = self.freshness_seconds if max_age is None else max_age
+        if listing is None or listing["age_seconds"] > max_age:
+            return False
+        return listing["max_reviews"] >= max_reviews or listing["reviews"] < listing["max_reviews"]
+
+    def store(self, url, opcion, max_reviews, results, replace=False):
+        hashed_results = [(review_hash(result["Review Text"]), result) for result in results]
+        with self.db_manager.session() as db:
+            db.store_scraped_listing(listing_key(url, opcion), url, opcion, max_reviews, hashed_results, replace=replace)
+
+    def invalidate(self, url, opcion):
+        with self.db_manager.session() as db:
+            return db.delete_scraped_listing(listing_key(url, opcion))
+
+
+    # --------------------- Estadísticas --------------------- #
+    def record(self, outcome, reused_reviews=0, new_reviews=0):
+        with self._lock:
+            self._counters[outcome] += 1
+            self._counters["reused_reviews"] += reused_reviews
+            self._counters["new_reviews"] += new_reviews
+
+    def hit_rate(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["incremental"] + self._counters["refreshes"] + self._counters["misses"]
+            return self._counters["hits"] / lookups if lookups else 0.0
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        return dict(counters, freshness_seconds=self.freshness_seconds, hit_rate=round(self.hit_rate(), 4))
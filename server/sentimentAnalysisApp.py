@@ -1,24 +1,38 @@
 """
 Archivo principal de la aplicación FastAPI para análisis de sentimientos de reseñas
 Autor: Jaime Sánchez Cotta
-Última actualización: 25/06/2024
+Última actualización: 18/10/2026
 
 Este archivo define las rutas y funciones principales para el análisis de sentimientos de reseñas.
 """
 
 import os
+import json
 import logging
 import asyncio
-from fastapi import FastAPI, Depends, HTTPException, Request
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
-from transformers import pipeline
+from fastapi import FastAPI, Depends, HTTPException, Request, UploadFile, File, Form
+from review_pagination import paginate_reviews, scroll_reviews, click_next_page
 from pydantic import BaseModel
-import random
+from typing import List
+import time
 from fastapi.middleware.cors import CORSMiddleware
 from database import SqliteDatabaseManager
-from fastapi.responses import JSONResponse
+from emotion_counter import EmotionCountAccumulator
+from dashboard_store import DashboardStore, GLOBAL_SCOPE
+from browser_pool import BrowserPool
+from scrape_cache import ScrapeCache, CACHE_MODES, review_hash
+from rate_limiter import DomainRateLimiter
+from bulk_jobs import BulkJobRunner
+from inference_executor import InferenceExecutor, ExecutorSaturado
+from text_preprocessing import ReviewDeduplicator, drop_duplicates, normalize_review, prepare_reviews
+from deadline import (Deadline, DeadlineExceeded, TIMEOUT_HEADER, current_deadline, deadline_expired, deadline_scope,
+                      parse_timeout, remaining_seconds, watch_disconnect)
+from inference import model_registry as local_model_registry, model_server_client, predict_sentiment_batch, predict_emotion_batch, sentiment_batcher, emotion_batcher, inference_cache
+from inference import fast_emotion_batcher, resolve_emotion_mode, EMOTION_MODES
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, PlainTextResponse, Response
+from metrics import registry as metrics_registry, SCRAPE_SECONDS, SCRAPED_REVIEWS, HTTP_REQUEST_SECONDS, HTTP_IN_FLIGHT
 from random import randint
+import random
 from fastapi.staticfiles import StaticFiles
 
 
@@ -35,8 +49,18 @@ class Url(BaseModel):
 class OpcionEnum(BaseModel):
     OpcionEnum: str
 
+class Listing(BaseModel):
+    Url: str
+    OpcionEnum: str
+
+class Listings(BaseModel):
+    Listings: List[Listing]
+
 app = FastAPI()
 
+# Con servidores de modelos (SENTIMENT_MODEL_SERVER_ADDRESS) los modelos se consultan y gestionan a través de ellos
+model_registry = model_server_client or local_model_registry
+
 static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "user_interface")
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
@@ -54,13 +78,189 @@ app.add_middleware(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Conexión a la base de datos SQLite
-db_manager = SqliteDatabaseManager('sentiment_database.db')
+# Trazas por reseña: full (todas en INFO), sampled (una muestra en INFO, el resto en DEBUG) o debug (solo en DEBUG)
+REVIEW_LOG_MODE = os.getenv("SENTIMENT_REVIEW_LOG_MODE", "sampled")
+REVIEW_LOG_SAMPLE_RATE = float(os.getenv("SENTIMENT_REVIEW_LOG_SAMPLE_RATE", "0.01"))
+
+
+def log_review(message, *args):
+    # Los argumentos se formatean solo si la traza se emite
+    if REVIEW_LOG_MODE == "full" or (REVIEW_LOG_MODE == "sampled" and random.random() < REVIEW_LOG_SAMPLE_RATE):
+        logger.info(message, *args)
+    else:
+        logger.debug(message, *args)
+
+
+# Duración y peticiones en curso por ruta (la plantilla de la ruta, no la URL, para acotar las etiquetas)
+@app.middleware("http")
+async def track_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = "500"
+    HTTP_IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        HTTP_IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                                     route=getattr(route, "path", "unmatched"), status=status)
+
+
+# Plazo de cada petición: cabecera X-Request-Timeout, parámetro timeout_s o SENTIMENT_REQUEST_TIMEOUT_S por defecto
+DEADLINE_INFERENCE_RESERVE_S = float(os.getenv("SENTIMENT_DEADLINE_INFERENCE_RESERVE_S", "10"))
+DEADLINE_MIN_REVIEWS = int(os.getenv("SENTIMENT_DEADLINE_MIN_REVIEWS", "1"))
+DEADLINE_GRACE_S = float(os.getenv("SENTIMENT_DEADLINE_GRACE_S", "5"))
+DEADLINE_CHECK_BATCH = int(os.getenv("SENTIMENT_DEADLINE_CHECK_BATCH", "32"))
+
+
+@app.middleware("http")
+async def attach_deadline(request: Request, call_next):
+    try:
+        timeout_s = parse_timeout(request.headers.get(TIMEOUT_HEADER), request.query_params.get("timeout_s"))
+    except ValueError as ve:
+        return JSONResponse(status_code=400, content={"error": str(ve)})
+    # La variable de contexto se hereda en la tarea del endpoint y en los hilos de inferencia
+    with deadline_scope(Deadline(timeout_s)):
+        return await call_next(request)
+
+
+async def run_until_deadline(request, coroutine):
+    # Ejecuta el trabajo de la petición y lo cancela si el cliente se desconecta o el plazo vence sin respuesta
+    deadline = current_deadline()
+    task = asyncio.ensure_future(coroutine)
+    watcher = asyncio.create_task(watch_disconnect(request, deadline, task, grace_seconds=DEADLINE_GRACE_S))
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if deadline.cancelled:
+            raise DeadlineExceeded(deadline.describe())
+        raise
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+
+
+def deadline_error_response(error):
+    # 499 (petición cerrada por el cliente) si se ha desconectado; 504 si ha vencido el plazo
+    deadline = current_deadline()
+    disconnected = deadline is not None and deadline.reason == "client_disconnected"
+    logger.warning(f"Petición abandonada: {error}")
+    return JSONResponse(status_code=499 if disconnected else 504, content={"error": str(error)})
+
+
+def scrape_budget():
+    # Tiempo para el scraping: lo que queda del plazo menos la reserva para analizar lo extraído
+    deadline = current_deadline()
+    if deadline is None:
+        return None
+    return deadline.remaining(min(DEADLINE_INFERENCE_RESERVE_S, deadline.timeout_s / 4))
+
+
+# Conexión a la base de datos SQLite: pool de conexiones, una por petición
+db_manager = SqliteDatabaseManager('sentiment_database.db', pool_size=int(os.getenv("SENTIMENT_DB_POOL_SIZE", "8")))
+
+
+# Los recuentos de emociones se acumulan en memoria y se vuelcan en lotes a la base de datos
+emotion_counter = EmotionCountAccumulator(
+    db_manager,
+    flush_interval_ms=int(os.getenv("SENTIMENT_COUNTER_FLUSH_MS", "500")),
+    flush_max_events=int(os.getenv("SENTIMENT_COUNTER_FLUSH_EVENTS", "100")),
+    read_your_writes=os.getenv("SENTIMENT_COUNTER_READ_YOUR_WRITES", "1") == "1",
+)
+
+# Los paneles leen los recuentos materializados en memoria, actualizados con cada incremento del acumulador
+dashboard_store = DashboardStore(
+    emotion_counter,
+    db_manager,
+    resync_seconds=float(os.getenv("SENTIMENT_DASHBOARD_RESYNC_S", "5")),
+)
+
+
+@app.on_event("startup")
+def initialize_database():
+    # El esquema se crea una sola vez al arrancar, no en cada petición
+    db_manager.initialize()
+    emotion_counter.start()
+    dashboard_store.start()
+
+
+@app.on_event("shutdown")
+def close_database():
+    dashboard_store.stop()
+    emotion_counter.stop()
+    db_manager.close_all()
+
+# Modelos de NLP: se cargan una única vez por proceso a través del registro (ver inference.py)
+# La inferencia bloqueante se ejecuta en un pool acotado para no congelar el bucle de eventos
+inference_executor = InferenceExecutor(
+    max_workers=int(os.getenv("SENTIMENT_INFERENCE_WORKERS", "2")),
+    max_queue=int(os.getenv("SENTIMENT_INFERENCE_QUEUE", "8")),
+)
+
+# Pool de navegadores compartido por todos los scrapings
+browser_pool = BrowserPool(
+    max_pages=int(os.getenv("SENTIMENT_BROWSER_MAX_PAGES", "4")),
+    max_uses=int(os.getenv("SENTIMENT_BROWSER_MAX_USES", "50")),
+)
+
+# Caché de reseñas extraídas por listado, con ventana de frescura configurable
+scrape_cache = ScrapeCache(db_manager, freshness_seconds=float(os.getenv("SENTIMENT_SCRAPE_CACHE_TTL", "3600")))
+
+# Ritmo máximo de navegaciones por dominio (cubo de tokens) en lugar de esperas aleatorias fijas
+domain_rate_limiter = DomainRateLimiter(
+    rate_per_second=float(os.getenv("SENTIMENT_DOMAIN_RATE", "0.5")),
+    burst=int(os.getenv("SENTIMENT_DOMAIN_BURST", "2")),
+    jitter_seconds=float(os.getenv("SENTIMENT_NAVIGATION_JITTER_S", "0")),
+)
+
+
+@app.on_event("startup")
+async def start_browser_pool():
+    try:
+        await browser_pool.start()
+    except Exception as e:
+        # Sin navegador la API sigue sirviendo texto crudo; el pool se reintenta en el primer scraping
+        logger.error(f"No se pudo iniciar el pool de navegadores: {e}")
+
+
+@app.on_event("shutdown")
+async def stop_browser_pool():
+    await browser_pool.shutdown()
+
+
+# Carga de modelos: en segundo plano al arrancar (por defecto), bloqueando el arranque o bajo demanda (WARM_UP_MODELS=0)
+WARM_UP_MODELS = os.getenv("SENTIMENT_WARM_UP_MODELS", "1") == "1"
+WARM_UP_BLOCKING = os.getenv("SENTIMENT_WARM_UP_BLOCKING", "0") == "1"
+
+# Con un servidor que precarga la aplicación (gunicorn --preload, ver gunicorn.conf.py) los modelos se cargan una vez
+# en el proceso padre y los workers creados con fork comparten los pesos en copia en escritura
+if os.getenv("SENTIMENT_PRELOAD_MODELS", "0") == "1":
+    model_registry.warm_up()
+
+
+@app.on_event("startup")
+def warm_up_models():
+    # Precargar los modelos para que la primera petición no pague el coste de carga, sin retrasar la escucha
+    if WARM_UP_MODELS:
+        if WARM_UP_BLOCKING:
+            model_registry.warm_up()
+        else:
+            model_registry.warm_up_in_background()
+    inference_executor.start()
+    sentiment_batcher.start()
+    emotion_batcher.start()
+    fast_emotion_batcher.start()
+
 
-# Modelos de NLP
-model_name = "mrcaelumn/yelp_restaurant_review_sentiment_analysis"
-sentiment_pipeline = pipeline("text-classification", model=model_name)
-classifier_pipeline = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
+@app.on_event("shutdown")
+def stop_batchers():
+    sentiment_batcher.stop()
+    emotion_batcher.stop()
+    fast_emotion_batcher.stop()
+    inference_executor.shutdown(wait=False)
 
 
 
@@ -133,29 +333,48 @@ def contar_apariciones_emociones(emociones):
 def update_sentiment_counts(result, db_manager):
     try:        
         # Actualizar el recuento del sentimiento en la base de datos
-        with db_manager:
-            db_manager.update_emotion_count(result)
+        emotion_counter.add(None, result)
         logger.info(f"Recuento de sentimiento actualizado para '{result}'.")
     except Exception as e:
         logger.error(f"Error al actualizar el recuento de sentimiento en la base de datos: {e}")
 
 
-def analyze_emotions(review_text: str):
+def store_review_results(project_name, source, source_url, results):
+    # Guardar el resultado de cada reseña; un fallo al guardar no invalida el análisis ya realizado
+    if not project_name or not results:
+        return
+    try:
+        with db_manager.session() as db:
+            db.insert_review_results(project_name, source, source_url, results)
+    except Exception as e:
+        logger.error(f"Error al guardar los resultados por reseña: {e}")
+
+
+def check_emotion_mode(emotion_mode):
+    if emotion_mode is not None and emotion_mode not in EMOTION_MODES:
+        raise HTTPException(status_code=400, detail=f"El modo de emociones debe ser uno de: {', '.join(EMOTION_MODES)}.")
+    return emotion_mode
+
+
+def check_cache_mode(cache_mode):
+    if cache_mode not in CACHE_MODES:
+        raise HTTPException(status_code=400, detail=f"El modo de caché debe ser uno de: {', '.join(CACHE_MODES)}.")
+    return cache_mode
+
+
+def analyze_emotions(review_text: str, emotion_mode=None):
     if review_text is None:
         logger.error("Texto de revisión no proporcionado.")
         return {"error": "Texto de revisión no proporcionado."}
     
-    logger.info(f"Texto para analizar la emocion: {review_text}")
+    log_review("Texto para analizar la emocion: %s", review_text)
     
-    # Ejecutar el modelo zero-shot-classification
-    classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
-    result = classifier(
-        review_text,
-        candidate_labels=["happy", "sad", "angry"]
-    )
+    # Ejecutar el modelo zero-shot-classification compartido, agrupado con las peticiones concurrentes
+    batcher = fast_emotion_batcher if resolve_emotion_mode(emotion_mode) == "fast" else emotion_batcher
+    result = batcher.submit(review_text).result(timeout=remaining_seconds())
     
     # Verificar la salida del modelo
-    if 'labels' in result and 'scores' in result:
+    if result is not None and 'labels' in result and 'scores' in result:
         result.get('labels', [])[0]
         
         return result
@@ -164,183 +383,292 @@ def analyze_emotions(review_text: str):
         return {"error": "La salida del modelo no es válida."}
     
 
-async def analyze_emotions_severalReviews(reviews: list):
-    emotions = [review for review in reviews]
-    scores = {'happy': [], 'sad': [], 'angry': []}
-    labels = []
-    
-    for review_text in emotions:
-        try:
-            emotion_result = analyze_emotions(review_text)
-            predominant_emotion = emotion_result["labels"][0]
-            scores[predominant_emotion].append(emotion_result["scores"][0])
-            labels.append(predominant_emotion)
-        except Exception as e:
-            logger.error(f"Error al analizar emociones de la reseña: {e}")
-
-    overall_emotion_score = sum(sum(scores.values(), [])) / sum(len(v) for v in scores.values())
-    overall_emotion_label = contar_apariciones_emociones(labels)
-    
-    logger.info("Scores totales: %s", scores)
-    logger.info("Labels totales: %s", labels)
-    logger.info("Average Score: %s", overall_emotion_score)
-    logger.info("Overall Emotion Label: %s", overall_emotion_label)
-    
-    return overall_emotion_score, overall_emotion_label
-        
-
 def get_db_manager():
     return db_manager
 
     
 @app.get("/sentiment_counts")
-async def get_sentiment_counts(db_manager=Depends(get_db_manager)):
+def get_sentiment_counts(request: Request):
     try:
-        with db_manager:
-            sentiment_counts = db_manager.get_global_emotion_counts()
-            return sentiment_counts
+        sentiment_counts, etag = dashboard_store.snapshot(GLOBAL_SCOPE)
+        return dashboard_response(request, sentiment_counts, etag)
     except Exception as e:
         logger.error(f"Error al obtener recuentos de sentimiento: {e}")
         return JSONResponse(status_code=500, content={"error": "Error al obtener recuentos de sentimiento"})
 
 
+# Recibir las diferencias de los recuentos globales a medida que se producen (Server-Sent Events).
+@app.get("/sentiment_counts/stream")
+async def stream_sentiment_counts(request: Request):
+    return dashboard_stream(request, GLOBAL_SCOPE)
+
+
+
+# --------------------- Paneles: lecturas condicionales y suscripciones --------------------- #
+DASHBOARD_PUSH_INTERVAL_S = float(os.getenv("SENTIMENT_DASHBOARD_PUSH_MS", "250")) / 1000
+DASHBOARD_KEEPALIVE_S = float(os.getenv("SENTIMENT_DASHBOARD_KEEPALIVE_S", "15"))
+
+
+def dashboard_response(request, content, etag):
+    # Si el cliente ya tiene esta versión se responde 304 sin cuerpo
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=content, headers=headers)
+
+
+def dashboard_body(scope, counts):
+    return counts if scope is GLOBAL_SCOPE else {"project": scope, "emotions": counts}
+
+
+def format_dashboard_event(event_type, data, event_id):
+    return f"event: {event_type}\nid: {event_id}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def project_scope(project_name):
+    # Un proyecto creado en otro worker puede no estar aún en memoria: se resincroniza antes de responder 404
+    if dashboard_store.snapshot(project_name) is None:
+        dashboard_store.resync()
+    return dashboard_store.snapshot(project_name) is not None
+
+
+def dashboard_stream(request, scope):
+    subscription, counts = dashboard_store.subscribe(scope)
+
+    async def events():
+        try:
+            # Primero la foto completa (salvo si el cliente se reconecta con la misma versión) y después solo diferencias
+            if request.headers.get("last-event-id") != dashboard_store.etag(subscription.version):
+                yield format_dashboard_event("snapshot", dashboard_body(scope, counts), dashboard_store.etag(subscription.version))
+            while not await request.is_disconnected():
+                update = await subscription.next(DASHBOARD_KEEPALIVE_S)
+                if update is None:
+                    yield ": keepalive\n\n"
+                    continue
+                deltas, version = update
+                if deltas:
+                    data = {"deltas": deltas} if scope is GLOBAL_SCOPE else {"project": scope, "deltas": deltas}
+                    yield format_dashboard_event("delta", data, dashboard_store.etag(version))
+                # Los incrementos que lleguen mientras tanto se envían juntos en la siguiente entrega
+                await asyncio.sleep(DASHBOARD_PUSH_INTERVAL_S)
+        finally:
+            dashboard_store.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 
 # --------------------- Funciones para el análisis de sentimientos --------------------- #
 def analyze_sentiment(review_text: str):
-    logger.info(f"Texto para analizar el sentimiento: {review_text}")
-    predictions = sentiment_pipeline(review_text)
+    log_review("Texto para analizar el sentimiento: %s", review_text)
+    predictions = sentiment_batcher.submit(review_text).result(timeout=remaining_seconds())
+    if predictions is None:
+        raise Exception("Error al analizar el sentimiento")
     mapped_predictions = [{'label': map_label(prediction['label']), 'score': prediction['score']} for prediction in predictions]
     return {'predictions': mapped_predictions}
 
-async def analyze_sentiment_severalReviews(reviews: list):
-    predictions = [review for review in reviews]
-    scores = []
-    labels = []
-    
-    for review_text in predictions:
-        try:
-            logger.info(f"Texto para analizar el sentimiento: {review_text}")
-            prediction = sentiment_pipeline(review_text)
-            scores.extend([p['score'] for p in prediction])
-            mapped_labels = [map_label(p['label']) for p in prediction]
-            labels.extend(mapped_labels)
-            logger.info("Scores de la reseña: %s", [p['score'] for p in prediction])
-            logger.info("Labels de la reseña: %s", mapped_labels)
-        except Exception as e:
-            logger.error(f"Error al analizar sentimiento de la reseña: {e}")
 
-    overall_average_score = sum(scores) / len(scores)
-    overall_sentiment_label = contar_apariciones(labels)
-    
-    logger.info("Scores totales: %s", scores)
-    logger.info("Labels totales: %s", labels)
-    logger.info("Average Score: %s", overall_average_score)
-    logger.info("Overall Sentiment Label: %s", overall_sentiment_label)
-    
-    return overall_average_score, overall_sentiment_label
+
+# --------------------- Análisis por reseña y agregados incrementales --------------------- #
+def analyze_reviews_batch(reviews: list, keep_failed=False, emotion_mode=None):
+    # Resultado por reseña con las mismas claves que la respuesta de los endpoints
+    # keep_failed conserva un None por cada reseña fallida para mantener la alineación con la entrada
+    # Los textos se normalizan y las reseñas repetidas o casi idénticas se analizan una sola vez (mismo resultado)
+    texts, owners = prepare_reviews(reviews)
+    # Con plazo se analiza por tandas y, al vencer, las reseñas restantes se dejan sin analizar (resultado parcial)
+    step = DEADLINE_CHECK_BATCH if current_deadline() is not None else max(len(texts), 1)
+    sentiment_results, emotion_results = [], []
+    for start in range(0, len(texts), step):
+        if deadline_expired():
+            break
+        group = texts[start:start + step]
+        sentiment_results.extend(predict_sentiment_batch(group))
+        emotion_results.extend(predict_emotion_batch(group, mode=emotion_mode))
+    if len(sentiment_results) < len(texts):
+        logger.warning(f"Plazo vencido: {len(texts) - len(sentiment_results)} reseñas sin analizar.")
+    analyzed = []
+    for review_text, owner in zip(reviews, owners):
+        if owner >= len(sentiment_results):
+            if keep_failed:
+                analyzed.append(None)
+            continue
+        sentiment, emotion = sentiment_results[owner], emotion_results[owner]
+        if not sentiment or not emotion:
+            logger.error("Error al analizar la reseña, se descarta del resultado.")
+            if keep_failed:
+                analyzed.append(None)
+            continue
+        analyzed.append({
+            "Review Text": review_text,
+            "Analisis Label": map_label(sentiment[0]['label']),
+            "Score": sentiment[0]['score'],
+            "Emotion Label": emotion['labels'][0],
+            "Emotion Score": emotion['scores'][0],
+        })
+    return analyzed
+
+
+class ReviewAggregate:
+    # Agregado en curso de los resultados por reseña: media de las puntuaciones y etiqueta predominante
+    def __init__(self):
+        self.sentiment_scores = []
+        self.sentiment_labels = []
+        self.emotion_scores = []
+        self.emotion_labels = []
+        self.first_reviews = []
+
+    def add(self, result):
+        self.sentiment_scores.append(result["Score"])
+        self.sentiment_labels.append(result["Analisis Label"])
+        self.emotion_scores.append(result["Emotion Score"])
+        self.emotion_labels.append(result["Emotion Label"])
+        if len(self.first_reviews) < 2:
+            self.first_reviews.append(result["Review Text"])
+
+    def __len__(self):
+        return len(self.sentiment_scores)
+
+    def summary(self):
+        return {
+            "Analisis Label": contar_apariciones(self.sentiment_labels),
+            "Score": sum(self.sentiment_scores) / len(self.sentiment_scores),
+            "Emotion Label": contar_apariciones_emociones(self.emotion_labels),
+            "Emotion Score": sum(self.emotion_scores) / len(self.emotion_scores),
+            "Reviews": len(self),
+        }
 
 
 
 # --------------------- Funciones para el raspado de información (scraping) --------------------- #
 # Funciones para extraer reseñas de diferentes sitios web
-async def extract_google_reviews(page):
+# Cada extractor es un generador asíncrono que entrega las reseñas por tandas según se cargan más en la página
+MAX_REVIEWS = int(os.getenv("SENTIMENT_MAX_REVIEWS", "50"))
+MAX_REVIEWS_LIMIT = int(os.getenv("SENTIMENT_MAX_REVIEWS_LIMIT", "500"))
+
+async def iter_google_reviews(page, max_reviews=MAX_REVIEWS):
     try:
         logger.info("Esperando a que aparezcan las reseñas de Google...")
         await page.wait_for_selector('.MyEned', timeout=10000)
         logger.info("Las reseñas de Google están disponibles. Extrayendo...")
-        html = await page.inner_html('body')
-        soup = BeautifulSoup(html, 'html.parser')
-        review_elements = soup.select('.MyEned')
-        reviews_text = [review.text.strip() for review in review_elements]
-        logger.info(f"Se han extraído {len(reviews_text)} reseñas de Google.")
-        return reviews_text
     except Exception as e:
         logger.error(f"Error en la extracción de Google Reviews: {e}")
         await captura_pantalla(page)
         raise
+    # Google carga más reseñas al desplazar el panel lateral
+    async for reviews_text in paginate_reviews(page, '.MyEned', scroll_reviews, max_reviews):
+        yield reviews_text
 
-async def extract_tripadvisor_reviews(page):
+async def iter_tripadvisor_reviews(page, max_reviews=MAX_REVIEWS):
     try:
         logger.info("Esperando a que aparezcan las reseñas de TripAdvisor...")
         #await captura_pantalla(page, "tripAdvisor_error.png")
         await page.wait_for_selector('.JguWG', timeout=10000)
         logger.info("Las reseñas de TripAdvisor están disponibles. Extrayendo...")
-        html = await page.inner_html('body')
-        soup = BeautifulSoup(html, 'html.parser')
-        review_elements = soup.select('.JguWG')
-        reviews_text = [review.text.strip() for review in review_elements]
-        logger.info(f"Se han extraído {len(reviews_text)} reseñas de TripAdvisor.")
-        return reviews_text
     except Exception as e:
         logger.error(f"Error en la extracción de TripAdvisor: {e}")
-        await captura_pantalla(page, "TripAdvisor")
+        await captura_pantalla(page)
         raise
+    async for reviews_text in paginate_reviews(page, '.JguWG', click_next_page, max_reviews,
+                                               next_selector='a[aria-label="Next page"]'):
+        yield reviews_text
 
-async def extract_yelp_reviews(page):
+async def iter_yelp_reviews(page, max_reviews=MAX_REVIEWS):
     try:
         logger.info("Esperando a que aparezcan las reseñas de Yelp...")
         await page.wait_for_selector('.comment__09f24__D0cxf.y-css-h9c2fl', timeout=10000)
         await asyncio.sleep(randint(1, 5))
         logger.info("Las reseñas de Yelp están disponibles. Extrayendo...")
-        html = await page.inner_html('body')
-        soup = BeautifulSoup(html, 'html.parser')
-        review_elements = soup.select('.comment__09f24__D0cxf.y-css-h9c2fl')
-        reviews_text = [review.text.strip() for review in review_elements]
-        logger.info(f"Se han extraído {len(reviews_text)} reseñas de Yelp.")
-        return reviews_text
     except Exception as e:
             logger.error(f"Error en la extracción de Yelp: {e}")
             await captura_pantalla(page)
             raise
+    async for reviews_text in paginate_reviews(page, '.comment__09f24__D0cxf.y-css-h9c2fl', click_next_page, max_reviews,
+                                               next_selector='a[aria-label="Next"], button[aria-label="Next"]'):
+        yield reviews_text
+
+review_iterators = {
+    "GoogleReview": iter_google_reviews,
+    "TripAdvisor": iter_tripadvisor_reviews,
+    "Yelp": iter_yelp_reviews,
+}
+
+async def open_listing(page, url, opcion, waited=0.0):
+    logger.info(f"Navegando a la URL: {url} (espera por dominio: {waited:.2f} s)")
+    await page.goto(url)
+    await page.wait_for_timeout(1000)
+
+    if opcion == "GoogleReview":
+        logger.info("Aceptando cookies GoogleReviews...")
+        cookie_dialog_selector = 'text="Aceptar todo"'
+    elif opcion == "TripAdvisor":
+        logger.info("Aceptando cookies TripAdvisor...")
+        cookie_dialog_selector = 'text="Acepto"'
+    elif opcion == "Yelp":
+        logger.info("Aceptando cookies Yelp...")
+        cookie_dialog_selector = 'text="Permitir todas las cookies"'   #Aceptar solo las cookies necesarias
+    
+    if await page.is_visible(cookie_dialog_selector):
+        logger.info("Aceptando cookies...")
+        await page.click(cookie_dialog_selector)
 
-async def scrape_with_retry(url, opcion):
+async def scrape_stream(url, opcion, max_reviews=MAX_REVIEWS):
+    # Entrega tandas de reseñas según se extraen; solo se reintenta si todavía no se ha entregado ninguna
+    max_reviews = max(1, min(max_reviews, MAX_REVIEWS_LIMIT))
     attempt = 0
     while attempt < 3:
+        yielded = False
+        attempt_start = time.perf_counter()
+        attempt_label = str(attempt + 1)
+        outcome = "cancelled"
         try:
             logger.info(f"Iniciando intento de scraping ({attempt + 1})...")
-            async with async_playwright() as pw:
-                browser = await pw.chromium.launch(headless=True)
-                context = await browser.new_context(user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.150 Safari/537.36')
-                page = await context.new_page() 
-                await asyncio.sleep(random.uniform(1, 3))
-                logger.info(f"Navegando a la URL: {url}")
-                await asyncio.sleep(randint(1,5))
-                await page.goto(url)
-                await page.wait_for_timeout(1000)
-
-                if opcion == "GoogleReview":
-                    logger.info("Aceptando cookies GoogleReviews...")
-                    cookie_dialog_selector = 'text="Aceptar todo"'
-                elif opcion == "TripAdvisor":
-                    logger.info("Aceptando cookies TripAdvisor...")
-                    cookie_dialog_selector = 'text="Acepto"'
-                elif opcion == "Yelp":
-                    logger.info("Aceptando cookies Yelp...")
-                    cookie_dialog_selector = 'text="Permitir todas las cookies"'   #Aceptar solo las cookies necesarias
-                
-                if await page.is_visible(cookie_dialog_selector):
-                    logger.info("Aceptando cookies...")
-                    await page.click(cookie_dialog_selector)
-                    
-                if opcion == "GoogleReview":
-                    reviews = await extract_google_reviews(page)
-                elif opcion == "TripAdvisor":
-                    reviews = await extract_tripadvisor_reviews(page)
-                elif opcion == "Yelp":
-                    reviews = await extract_yelp_reviews(page)
-                
-                logger.info("Cerrando el navegador...")
-                await browser.close()
-                logger.info("Extracción completada con éxito.")
-                first_review_lines = '\n'.join(reviews[:2])
-                return reviews, first_review_lines
+            # El token del dominio se reserva antes de pedir una página: un dominio limitado no ocupa una página del
+            # pool mientras espera y no retrasa a los demás dominios
+            waited = await domain_rate_limiter.acquire(url)
+            # El contexto se cierra siempre al salir, también si el intento falla
+            async with browser_pool.page() as page:
+                await open_listing(page, url, opcion, waited)
+                async for review_batch in review_iterators[opcion](page, max_reviews):
+                    yielded = True
+                    SCRAPED_REVIEWS.inc(len(review_batch), site=opcion)
+                    yield review_batch
+            logger.info("Extracción completada con éxito.")
+            outcome = "ok"
+            return
         except Exception as e:
+            outcome = "error"
+            if yielded:
+                raise
             logger.error(f"Error en el intento {attempt + 1}: {e}")
-            attempt += 1
-            logger.info(f"Reintentando en {1.5 ** attempt} segundos...")
-            await asyncio.sleep(1.5 ** attempt)  # Backoff exponencial
+        finally:
+            # En streaming el tiempo incluye también las pausas del consumidor entre tandas
+            SCRAPE_SECONDS.observe(time.perf_counter() - attempt_start, site=opcion, attempt=attempt_label, outcome=outcome)
+        attempt += 1
+        logger.info(f"Reintentando en {1.5 ** attempt} segundos...")
+        await asyncio.sleep(1.5 ** attempt)  # Backoff exponencial
     raise Exception("The extraction could not be completed after several attempts.")
 
+async def collect_reviews(url, opcion, max_reviews=MAX_REVIEWS):
+    # Reseñas extraídas y si la extracción ha terminado; con plazo se detiene a tiempo de analizar lo ya extraído
+    reviews = []
+    stream = scrape_stream(url, opcion, max_reviews)
+    try:
+        while True:
+            try:
+                review_batch = await asyncio.wait_for(stream.__anext__(), scrape_budget())
+            except StopAsyncIteration:
+                return reviews, True
+            except asyncio.TimeoutError:
+                if len(reviews) < DEADLINE_MIN_REVIEWS:
+                    raise DeadlineExceeded(current_deadline().describe())
+                logger.warning(f"Plazo de scraping agotado: se analizan las {len(reviews)} reseñas extraídas.")
+                return reviews, False
+            reviews.extend(review_batch)
+    finally:
+        await stream.aclose()
+
 
 async def validate_url_and_option(url, opcion):
     logger.info(f"Validando URL {url}") 
@@ -365,12 +693,14 @@ async def validate_url_and_option(url, opcion):
 
 # --------------------- Funciones principales del análisis de sentimientos --------------------- #
 @app.post("/predict_reviews_from_raw_text")
-def predict_reviews_raw(item: Review, project_name: ProjectName, db_manager=Depends(get_db_manager)):
-    logger.info(f"Recibida solicitud para procesar texto crudo: {item.Review}") 
+def predict_reviews_raw(item: Review, project_name: ProjectName, emotion_mode: str = None, db_manager=Depends(get_db_manager)):
+    check_emotion_mode(emotion_mode)
+    log_review("Recibida solicitud para procesar texto crudo: %s", item.Review)
     logger.info("Nombre del proyecto recibido: %s", project_name.ProjectName)
     try:
         # Realizar análisis de emociones
-        result1 = analyze_emotions(item.Review)  
+        review_text = normalize_review(item.Review)
+        result1 = analyze_emotions(review_text, emotion_mode)
         if result1 is None:
             raise Exception("Error al analizar emociones")
         
@@ -380,11 +710,10 @@ def predict_reviews_raw(item: Review, project_name: ProjectName, db_manager=Depe
         logger.info("Clasificación de emociones completada.")
         
         # Actualizar la base de datos con la emoción y el proyecto correspondiente si se proporciona un proyecto
-        with db_manager:
-            db_manager.update_emotion_count(project_name.ProjectName, predominant_emotion)
+        emotion_counter.add(project_name.ProjectName, predominant_emotion)
         
         # Realizar análisis de sentimiento
-        result2 = analyze_sentiment(item.Review) 
+        result2 = analyze_sentiment(review_text) 
         logger.info("Análisis de sentimiento completado.")
         
         # Crear el resultado final combinando ambas análisis
@@ -395,6 +724,7 @@ def predict_reviews_raw(item: Review, project_name: ProjectName, db_manager=Depe
             "Emotion Score": predominant_emotion_score
         }
         logger.info("Resultado final: %s", final_result)
+        store_review_results(project_name.ProjectName, "RawText", None, [dict(final_result, **{"Review Text": item.Review})])
         return JSONResponse(content=final_result, headers={"Content-Type": "application/json; charset=utf-8"})  
     except Exception as e:
         logger.error(f"Error al procesar texto crudo: {e}")
@@ -402,34 +732,37 @@ def predict_reviews_raw(item: Review, project_name: ProjectName, db_manager=Depe
 
 
 @app.post("/predict_reviews_from_url")
-async def predict_reviews_url(url: Url, opcion: OpcionEnum, project_name: ProjectName, db_manager=Depends(get_db_manager)):
+async def predict_reviews_url(url: Url, opcion: OpcionEnum, project_name: ProjectName, request: Request, max_reviews: int = MAX_REVIEWS,
+                              emotion_mode: str = None, cache_mode: str = "auto", max_age: float = None, db_manager=Depends(get_db_manager)):
+    check_emotion_mode(emotion_mode)
+    check_cache_mode(cache_mode)
     logger.info(f"Iniciando scraping de reseñas ({opcion.OpcionEnum})...")
     try:
-        # Realizar análisis de emociones
         await validate_url_and_option(url.Url, opcion.OpcionEnum)
-        reviews, first_review_lines = await scrape_with_retry(url.Url, opcion.OpcionEnum)
-        overall_average_score, overall_sentiment_label = await analyze_sentiment_severalReviews(reviews)
-        logger.info("Análisis de sentimiento completado.")
-    
-        # Realizar análisis de sentimiento
-        overall_emotion_score, overall_emotion_label = await analyze_emotions_severalReviews(reviews)
-        logger.info("Clasificación de emociones completada.")
-
-        # Actualizar la base de datos con la emoción y el proyecto correspondiente si se proporciona un proyecto
-        with db_manager:
-            db_manager.update_emotion_count(project_name.ProjectName, overall_emotion_label)
+        results, summary, first_review_lines, cache_info, partial = await run_until_deadline(request, analyze_listing(
+            url.Url, opcion.OpcionEnum, project_name.ProjectName, max_reviews, emotion_mode, cache_mode=cache_mode, max_age=max_age))
 
         # Crear el resultado final combinando ambos análisis
         final_result = {
-            "Analisis Label": overall_sentiment_label,  
-            "Score": overall_average_score,           
-            "Emotion Label": overall_emotion_label,
-            "Emotion Score": overall_emotion_score,
-            "Review Text": first_review_lines
+            "Analisis Label": summary["Analisis Label"],  
+            "Score": summary["Score"],           
+            "Emotion Label": summary["Emotion Label"],
+            "Emotion Score": summary["Emotion Score"],
+            "Review Text": first_review_lines,
+            "Duplicates": summary["Duplicates"],
+            "Cache": cache_info,
+            "Partial": partial,
         }
+        if partial:
+            final_result["Deadline"] = current_deadline().info()
         logger.info("Resultado final: %s", final_result)
 
         return JSONResponse(content=final_result, headers={"Content-Type": "application/json; charset=utf-8"}) 
+    except ExecutorSaturado as es:
+        logger.error(f"Pool de inferencia saturado: {es}")
+        return JSONResponse(status_code=429, content={"error": str(es)}, headers={"Retry-After": "5"})
+    except DeadlineExceeded as de:
+        return deadline_error_response(de)
     except ValueError as ve:
         error_message = f"The provided URL does not seem to be from {opcion.OpcionEnum}." 
         logger.error(f"Error de validación: {error_message}")
@@ -440,6 +773,320 @@ async def predict_reviews_url(url: Url, opcion: OpcionEnum, project_name: Projec
 
 
 
+async def analyze_listing(url, opcion, project_name, max_reviews=MAX_REVIEWS, emotion_mode=None, wait_if_saturated=False,
+                          cache_mode="auto", max_age=None):
+    # Scraping y análisis de un listado: resultados por reseña, agregado, primeras líneas, metadatos de la caché y si
+    # el resultado es parcial (plazo vencido antes de extraer o analizar todas las reseñas)
+    max_reviews = max(1, min(max_reviews, MAX_REVIEWS_LIMIT))
+    partial = False
+    duplicates = 0
+    listing = await asyncio.to_thread(scrape_cache.lookup, url, opcion) if cache_mode != "refresh" else None
+
+    if cache_mode == "auto" and scrape_cache.is_fresh(listing, max_reviews, max_age):
+        # Listado extraído hace poco: se responde desde la caché sin abrir el navegador
+        results = listing["latest"][:max_reviews]
+        new_results = []
+        outcome = "hits"
+    else:
+        reviews, complete = await collect_reviews(url, opcion, max_reviews)
+        # La misma reseña capturada dos veces (o con y sin traducción) solo se analiza y cuenta una vez
+        reviews, duplicates = await asyncio.to_thread(drop_duplicates, reviews)
+        if duplicates:
+            logger.info(f"Reseñas duplicadas descartadas antes de la inferencia: {duplicates}.")
+        known = listing["known"] if listing is not None else {}
+        pending = [review for review in reviews if review_hash(review) not in known]
+
+        # Solo se analizan las reseñas que no se habían visto antes en este listado
+        analyzed = {}
+        if pending:
+            while True:
+                try:
+                    batch_results = await inference_executor.run(analyze_reviews_batch, pending, keep_failed=True, emotion_mode=emotion_mode)
+                    break
+                except ExecutorSaturado:
+                    if not wait_if_saturated:
+                        raise
+                    await asyncio.sleep(0.5)
+            analyzed = {review: result for review, result in zip(pending, batch_results) if result is not None}
+        results = []
+        for review in reviews:
+            result = known.get(review_hash(review)) or analyzed.get(review)
+            if result is not None:
+                results.append(dict(result, **{"Review Text": review}))
+        new_results = list(analyzed.values())
+        outcome = "refreshes" if cache_mode == "refresh" else ("incremental" if listing is not None else "misses")
+        partial = not complete or (len(results) < len(reviews) and deadline_expired())
+        if results:
+            # Un resultado parcial se guarda como si el listado no tuviera más reseñas que las analizadas, para que
+            # la siguiente petición no lo considere completo y solo analice las que faltan
+            stored_max_reviews = len(results) if partial else max_reviews
+            await asyncio.to_thread(scrape_cache.store, url, opcion, stored_max_reviews, results, cache_mode == "refresh")
+    scrape_cache.record(outcome, reused_reviews=len(results) - len(new_results), new_reviews=len(new_results))
+
+    if not results:
+        if deadline_expired():
+            raise DeadlineExceeded(current_deadline().describe())
+        raise Exception("No se ha podido analizar ninguna reseña.")
+    aggregate = ReviewAggregate()
+    for result in results:
+        aggregate.add(result)
+    summary = dict(aggregate.summary(), Duplicates=duplicates)
+    logger.info("Análisis de sentimiento y clasificación de emociones completados.")
+
+    # Si el cliente ya no espera la respuesta no se actualizan los recuentos (la caché de scraping sí se conserva)
+    deadline = current_deadline()
+    if deadline is not None and deadline.cancelled:
+        raise DeadlineExceeded(deadline.describe())
+
+    # Actualizar la base de datos con la emoción y el proyecto correspondiente si se proporciona un proyecto
+    # (fuera del bucle de eventos: la primera vez se comprueba en la base de datos que el proyecto existe)
+    await asyncio.to_thread(emotion_counter.add, project_name, summary["Emotion Label"])
+    # El histórico por reseña solo recibe las reseñas analizadas en esta petición
+    if new_results:
+        await asyncio.to_thread(store_review_results, project_name, opcion, url, new_results)
+    cache_info = {
+        "hit": outcome == "hits",
+        "mode": {"hits": "cached", "incremental": "incremental", "refreshes": "refresh", "misses": "miss"}[outcome],
+        "age_seconds": round(listing["age_seconds"], 1) if outcome == "hits" else 0.0,
+        "cached_reviews": len(results) - len(new_results),
+        "new_reviews": len(new_results),
+        "hit_rate": round(scrape_cache.hit_rate(), 4),
+    }
+    return results, summary, '\n'.join(result["Review Text"] for result in results[:2]), cache_info, partial
+
+
+
+# --------------------- Análisis concurrente de varias URLs --------------------- #
+MAX_LISTINGS_PER_REQUEST = int(os.getenv("SENTIMENT_MAX_LISTINGS", "20"))
+
+
+@app.post("/predict_reviews_from_urls")
+async def predict_reviews_urls(listings: Listings, project_name: ProjectName, request: Request, max_reviews: int = MAX_REVIEWS,
+                               emotion_mode: str = None, cache_mode: str = "auto", max_age: float = None):
+    check_emotion_mode(emotion_mode)
+    check_cache_mode(cache_mode)
+    if not listings.Listings:
+        raise HTTPException(status_code=400, detail="No se ha proporcionado ningún listado.")
+    if len(listings.Listings) > MAX_LISTINGS_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"Se admiten como máximo {MAX_LISTINGS_PER_REQUEST} listados por petición.")
+    logger.info(f"Iniciando scraping concurrente de {len(listings.Listings)} listados...")
+    start = time.perf_counter()
+
+    # Los listados se procesan a la vez: el pool de navegadores limita las páginas abiertas (max_pages)
+    # y el limitador por dominio espacia las navegaciones a un mismo sitio
+    async def run_listing(listing):
+        listing_start = time.perf_counter()
+        entry = {"Url": listing.Url, "OpcionEnum": listing.OpcionEnum}
+        try:
+            await validate_url_and_option(listing.Url, listing.OpcionEnum)
+            results, summary, first_review_lines, cache_info, partial = await analyze_listing(
+                listing.Url, listing.OpcionEnum, project_name.ProjectName, max_reviews, emotion_mode,
+                wait_if_saturated=True, cache_mode=cache_mode, max_age=max_age)
+            entry.update(summary, **{"Review Text": first_review_lines, "Cache": cache_info, "Partial": partial})
+        except DeadlineExceeded as de:
+            results = []
+            entry["error"] = str(de)
+        except ValueError:
+            results = []
+            entry["error"] = f"The provided URL does not seem to be from {listing.OpcionEnum}."
+        except Exception as e:
+            results = []
+            logger.error(f"Error durante el scraping de {listing.Url}: {e}")
+            entry["error"] = str(e)
+        entry["Seconds"] = round(time.perf_counter() - listing_start, 3)
+        return entry, results
+
+    try:
+        outcomes = await run_until_deadline(request, asyncio.gather(*(run_listing(listing) for listing in listings.Listings)))
+    except DeadlineExceeded as de:
+        return deadline_error_response(de)
+
+    # Agregado combinado con todas las reseñas analizadas de todos los listados
+    aggregate = ReviewAggregate()
+    for _, results in outcomes:
+        for result in results:
+            aggregate.add(result)
+    final_result = {
+        "Listings": [entry for entry, _ in outcomes],
+        "Aggregate": aggregate.summary() if aggregate else None,
+        "Partial": any(entry.get("Partial") for entry, _ in outcomes),
+        "Seconds": round(time.perf_counter() - start, 3),
+    }
+    logger.info("Resultado final combinado: %s", final_result["Aggregate"])
+    return JSONResponse(content=final_result, headers={"Content-Type": "application/json; charset=utf-8"})
+
+
+
+# --------------------- Análisis en streaming de las reseñas de una URL --------------------- #
+STREAM_BATCH_SIZE = int(os.getenv("SENTIMENT_STREAM_BATCH_SIZE", "4"))
+
+
+def format_stream_event(event, stream_format):
+    data = json.dumps(event, ensure_ascii=False)
+    if stream_format == "sse":
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+async def stream_review_analysis(url, opcion, project_name, stream_format, max_reviews=MAX_REVIEWS, emotion_mode=None):
+    # El scraping alimenta una cola mientras el consumidor analiza las reseñas en lotes pequeños
+    review_queue = asyncio.Queue()
+    end_of_stream = object()
+
+    async def produce_reviews():
+        try:
+            async for review_batch in scrape_stream(url, opcion, max_reviews):
+                for review in review_batch:
+                    await review_queue.put(review)
+            await review_queue.put(end_of_stream)
+        except Exception as e:
+            await review_queue.put(e)
+
+    producer = asyncio.create_task(produce_reviews())
+    deadline = current_deadline()
+    deduplicator = ReviewDeduplicator()
+    duplicates = 0
+    aggregate = ReviewAggregate()
+    index = 0
+    finished = False
+    partial = False
+    try:
+        while not finished:
+            try:
+                pending = [await asyncio.wait_for(review_queue.get(), scrape_budget())]
+            except asyncio.TimeoutError:
+                # Plazo de scraping agotado: se cierra el flujo con lo analizado hasta ahora
+                logger.warning("Plazo de scraping agotado en streaming: se devuelve el resultado parcial.")
+                producer.cancel()
+                finished = partial = True
+                if not aggregate:
+                    raise DeadlineExceeded(deadline.describe())
+                continue
+            while len(pending) < STREAM_BATCH_SIZE and not review_queue.empty():
+                pending.append(review_queue.get_nowait())
+            if isinstance(pending[-1], Exception):
+                raise pending[-1]
+            if pending[-1] is end_of_stream:
+                finished = True
+                pending.pop()
+            # Las reseñas ya vistas en este flujo (exactas o casi idénticas) no se analizan ni se emiten
+            pending, dropped = drop_duplicates(pending, deduplicator, stage="stream")
+            duplicates += dropped
+            if not pending:
+                continue
+
+            results = await inference_executor.run(analyze_reviews_batch, pending, emotion_mode=emotion_mode)
+            partial = partial or (len(results) < len(pending) and deadline_expired())
+            await asyncio.to_thread(store_review_results, project_name, opcion, url, results)
+            for result in results:
+                aggregate.add(result)
+                yield format_stream_event(dict(result, type="review", index=index), stream_format)
+                index += 1
+            if aggregate:
+                yield format_stream_event(dict(aggregate.summary(), type="aggregate"), stream_format)
+
+        if not aggregate:
+            raise Exception("No se ha podido analizar ninguna reseña.")
+
+        summary = aggregate.summary()
+        await asyncio.to_thread(emotion_counter.add, project_name, summary["Emotion Label"])
+        final_result = dict(summary, type="final", Duplicates=duplicates, Partial=partial)
+        final_result["Review Text"] = '\n'.join(aggregate.first_reviews)
+        if partial:
+            final_result["Deadline"] = deadline.info()
+        logger.info("Resultado final: %s", final_result)
+        yield format_stream_event(final_result, stream_format)
+    except Exception as e:
+        logger.error(f"Error durante el análisis en streaming: {e}")
+        yield format_stream_event({"type": "error", "error": str(e)}, stream_format)
+    finally:
+        # Si el cliente se desconecta se detiene también el scraping y la inferencia pendiente
+        producer.cancel()
+        if deadline is not None and not finished:
+            deadline.cancel()
+
+
+@app.post("/predict_reviews_from_url/stream")
+async def predict_reviews_url_stream(url: Url, opcion: OpcionEnum, project_name: ProjectName, format: str = "ndjson", max_reviews: int = MAX_REVIEWS, emotion_mode: str = None):
+    check_emotion_mode(emotion_mode)
+    logger.info(f"Iniciando scraping en streaming de reseñas ({opcion.OpcionEnum})...")
+    try:
+        await validate_url_and_option(url.Url, opcion.OpcionEnum)
+    except ValueError:
+        error_message = f"The provided URL does not seem to be from {opcion.OpcionEnum}."
+        logger.error(f"Error de validación: {error_message}")
+        return JSONResponse(content={"error": error_message}, headers={"Content-Type": "application/json; charset=utf-8"})
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_review_analysis(url.Url, opcion.OpcionEnum, project_name.ProjectName, format, max_reviews, emotion_mode),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+
+# --------------------- Análisis masivo de reseñas (CSV/JSONL) --------------------- #
+bulk_job_runner = BulkJobRunner(
+    db_manager,
+    jobs_dir=os.getenv("SENTIMENT_BULK_JOBS_DIR", "bulk_jobs"),
+    analyze_batch=analyze_reviews_batch,
+    executor=inference_executor,
+    store_results=store_review_results,
+    batch_size=int(os.getenv("SENTIMENT_BULK_BATCH_SIZE", "64")),
+)
+
+
+@app.on_event("startup")
+async def start_bulk_jobs():
+    await bulk_job_runner.start()
+
+
+@app.on_event("shutdown")
+async def stop_bulk_jobs():
+    await bulk_job_runner.shutdown()
+
+
+# Subir un fichero CSV o JSONL de reseñas y crear un trabajo en segundo plano.
+@app.post("/bulk_jobs")
+async def create_bulk_job(file: UploadFile = File(...), project_name: str = Form(None), text_field: str = Form(None)):
+    if project_name:
+        with db_manager.session() as db:
+            if not db.project_exists(project_name):
+                raise HTTPException(status_code=404, detail=f"El proyecto '{project_name}' no existe.")
+    job_id = await bulk_job_runner.submit(file, project_name, text_field)
+    logger.info(f"Trabajo masivo {job_id} creado para el fichero '{file.filename}'.")
+    return {"job_id": job_id, "status": "queued"}
+
+
+# Listar los trabajos masivos.
+@app.get("/bulk_jobs")
+def list_bulk_jobs():
+    with db_manager.session() as db:
+        jobs = db.get_bulk_jobs()
+    return {"jobs": [bulk_job_runner.status(job["job_id"]) for job in jobs]}
+
+
+# Obtener el estado, el progreso y el rendimiento de un trabajo masivo.
+@app.get("/bulk_jobs/{job_id}")
+def get_bulk_job(job_id: str):
+    status = bulk_job_runner.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"El trabajo '{job_id}' no existe.")
+    return status
+
+
+# Descargar los resultados (JSONL) de un trabajo masivo, completos o parciales.
+@app.get("/bulk_jobs/{job_id}/results")
+def get_bulk_job_results(job_id: str):
+    with db_manager.session() as db:
+        job = db.get_bulk_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"El trabajo '{job_id}' no existe.")
+    return FileResponse(job["results_path"], media_type="application/x-ndjson", filename=f"{job_id}.results.jsonl")
+
+
+
 # --------------------- Workspace y proyectos --------------------- #
 # Crear un nuevo proyecto en el workspace.
 @app.post("/workspace/projects")
@@ -449,9 +1096,10 @@ async def create_project(request: Request):
     if not project_name:
         raise HTTPException(status_code=400, detail="El nombre del proyecto no fue proporcionado en el cuerpo de la solicitud.")
     
-    with db_manager:
-        created_project = db_manager.create_project(project_name)
+    with db_manager.session() as db:
+        created_project = db.create_project(project_name)
         if created_project:
+            dashboard_store.add_project(created_project)
             return {"message": f"Proyecto '{created_project}' creado correctamente"}
         else:
             raise HTTPException(status_code=400, detail="El proyecto ya existe")
@@ -459,28 +1107,185 @@ async def create_project(request: Request):
 
 # Obtener información sobre los proyectos existentes en el workspace.
 @app.get("/workspace/projects")
-async def get_projects():
-    with db_manager:
-        projects = db_manager.get_projects()
+def get_projects():
+    with db_manager.session() as db:
+        projects = db.get_projects()
         return {"projects": projects}
 
 
 # Obtener información sobre las emociones asociadas a un proyecto específico en el workspace.
 @app.get("/workspace/projects/{project_name}/emotions")
-async def get_project_emotions(project_name: str):
+def get_project_emotions(project_name: str, request: Request):
     try:
-        with db_manager:
-            emotions = db_manager.get_emotion_counts_for_project(project_name)
-        if emotions is None:
-            return JSONResponse(status_code=404, content={"error": f"No existen emociones para el proyecto '{project_name}'."})
-        else:
-            return {"project": project_name, "emotions": emotions}
-    except ValueError as ve:
-        return JSONResponse(status_code=404, content={"error": f"El proyecto '{project_name}' no existe."})
+        if not project_scope(project_name):
+            return JSONResponse(status_code=404, content={"error": f"El proyecto '{project_name}' no existe."})
+        emotions, etag = dashboard_store.snapshot(project_name)
+        return dashboard_response(request, dashboard_body(project_name, emotions), etag)
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": f"Error al obtener emociones del proyecto '{project_name}': {e}"})
 
 
+# Recibir las diferencias de las emociones de un proyecto a medida que se producen (Server-Sent Events).
+@app.get("/workspace/projects/{project_name}/emotions/stream")
+async def stream_project_emotions(project_name: str, request: Request):
+    if not await asyncio.to_thread(project_scope, project_name):
+        return JSONResponse(status_code=404, content={"error": f"El proyecto '{project_name}' no existe."})
+    return dashboard_stream(request, project_name)
+
+
+
+# --------------------- Gestión de modelos --------------------- #
+# Obtener el tiempo de carga y la memoria ocupada por cada modelo.
+@app.get("/models")
+async def get_models():
+    return await asyncio.to_thread(model_registry.stats)
+
+
+# Obtener la profundidad de cola, el histograma de tamaños de lote y los tiempos de espera de la agrupación.
+@app.get("/inference/batching")
+async def get_batching_stats():
+    return {"sentiment": sentiment_batcher.stats(), "emotion": emotion_batcher.stats(),
+            "emotion_fast": fast_emotion_batcher.stats(), "executor": inference_executor.stats()}
+
+
+# Exponer las métricas en el formato de texto de Prometheus.
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _cache_counters(stats):
+    if stats is None:
+        return {}
+    return {(name,): stats[name] for name in ("hits", "disk_hits", "misses", "evictions", "expirations", "incremental", "refreshes")
+            if name in stats}
+
+
+# Valores que ya mantienen las cachés, colas y pools, leídos al exponer /metrics
+metrics_registry.callback("sentiment_inference_cache_events", "Eventos de la caché de inferencia",
+                          lambda: _cache_counters(inference_cache.stats() if inference_cache else None), ("event",), kind="counter")
+metrics_registry.callback("sentiment_inference_cache_hit_ratio", "Tasa de aciertos de la caché de inferencia",
+                          lambda: {(): inference_cache.stats()["hit_rate"]} if inference_cache else {})
+metrics_registry.callback("sentiment_scrape_cache_events", "Eventos de la caché de scraping",
+                          lambda: _cache_counters(scrape_cache.stats()), ("event",), kind="counter")
+metrics_registry.callback("sentiment_scrape_cache_hit_ratio", "Tasa de aciertos de la caché de scraping",
+                          lambda: {(): scrape_cache.hit_rate()})
+metrics_registry.callback("sentiment_microbatch_queue_depth", "Peticiones esperando en cada micro-batcher",
+                          lambda: {(batcher.name,): batcher.stats()["queue_depth"]
+                                   for batcher in (sentiment_batcher, emotion_batcher, fast_emotion_batcher)}, ("batcher",))
+metrics_registry.callback("sentiment_inference_executor_in_flight", "Tareas en el pool de inferencia",
+                          lambda: {(): inference_executor.stats()["in_flight"]})
+metrics_registry.callback("sentiment_inference_executor_rejected", "Tareas rechazadas por el pool de inferencia saturado",
+                          lambda: {(): inference_executor.stats()["rejected"]}, kind="counter")
+metrics_registry.callback("sentiment_browser_active_pages", "Páginas abiertas en el pool de navegadores",
+                          lambda: {(): browser_pool.stats()["active_pages"]})
+metrics_registry.callback("sentiment_emotion_counter_pending", "Incrementos de emociones pendientes de volcar",
+                          lambda: {(): emotion_counter.stats()["pending_events"]})
+metrics_registry.callback("sentiment_dashboard_subscribers", "Clientes suscritos a los cambios de los paneles",
+                          lambda: {(): dashboard_store.stats()["subscribers"]})
+
+
+@app.get("/scraping/cache")
+async def get_scrape_cache_stats():
+    return scrape_cache.stats()
+
+
+@app.get("/scraping/rate_limits")
+async def get_rate_limit_stats():
+    return domain_rate_limiter.stats()
+
+
+# Obtener el estado del pool de navegadores.
+@app.get("/scraping/browser_pool")
+async def get_browser_pool_stats():
+    return browser_pool.stats()
+
+
+# Obtener los aciertos, fallos y desalojos de la caché de resultados de inferencia.
+@app.get("/inference/cache")
+async def get_inference_cache_stats():
+    if inference_cache is None:
+        return {"enabled": False}
+    return dict(inference_cache.stats(), enabled=True)
+
+
+# Vaciar la caché de resultados de inferencia (memoria y disco).
+@app.delete("/inference/cache")
+def clear_inference_cache():
+    if inference_cache is not None:
+        inference_cache.clear()
+    return {"message": "Caché de inferencia vaciada"}
+
+
+# Descargar un modelo de memoria; se volverá a cargar en la siguiente petición que lo necesite.
+@app.post("/models/{name}/unload")
+def unload_model(name: str):
+    try:
+        unloaded = model_registry.unload(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"El modelo '{name}' no existe.")
+    return {"model": name, "unloaded": unloaded}
+
+
+# Recargar un modelo desde cero.
+@app.post("/models/{name}/reload")
+def reload_model(name: str):
+    try:
+        model_registry.reload(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"El modelo '{name}' no existe.")
+    return {"model": name, "stats": model_registry.stats()["models"][name]}
+
+
+
+# Obtener la evolución temporal (por hora o por día) de las reseñas analizadas en un proyecto.
+@app.get("/workspace/projects/{project_name}/trends")
+def get_project_trends(project_name: str, bucket: str = "day", since: float = None, until: float = None):
+    if bucket not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="El intervalo debe ser 'hour' o 'day'.")
+    with db_manager.session() as db:
+        if not db.project_exists(project_name):
+            return JSONResponse(status_code=404, content={"error": f"El proyecto '{project_name}' no existe."})
+        trends = db.get_review_trends(project_name, bucket, since, until)
+    return {"project": project_name, "bucket": bucket, "trends": trends}
+
+
+# Obtener la distribución de puntuaciones de sentimiento o de emoción de un proyecto.
+@app.get("/workspace/projects/{project_name}/score_distribution")
+def get_project_score_distribution(project_name: str, model: str = "sentiment"):
+    if model not in ("sentiment", "emotion"):
+        raise HTTPException(status_code=400, detail="El modelo debe ser 'sentiment' o 'emotion'.")
+    with db_manager.session() as db:
+        if not db.project_exists(project_name):
+            return JSONResponse(status_code=404, content={"error": f"El proyecto '{project_name}' no existe."})
+        distribution = db.get_score_distribution(project_name, model)
+    return {"project": project_name, "model": model, "distribution": distribution}
+
+
+# Obtener los resultados individuales más recientes de un proyecto.
+@app.get("/workspace/projects/{project_name}/reviews")
+def get_project_reviews(project_name: str, since: float = None, limit: int = 100):
+    with db_manager.session() as db:
+        if not db.project_exists(project_name):
+            return JSONResponse(status_code=404, content={"error": f"El proyecto '{project_name}' no existe."})
+        reviews = db.get_review_results(project_name, since, min(max(limit, 1), 1000))
+    return {"project": project_name, "reviews": reviews}
+
+
+
+# --------------------- Estado del servicio --------------------- #
+@app.get("/healthz")
+async def healthz():
+    # El proceso está vivo y atiende peticiones, aunque los modelos todavía se estén cargando
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    # Listo para recibir tráfico de inferencia: modelos cargados (o carga bajo demanda configurada)
+    readiness = await asyncio.to_thread(model_registry.readiness, None if WARM_UP_MODELS else [])
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
 
 # ----------------------------------------------------------------- #
 @app.get('/')
@@ -0,0 +1,226 @@
+"""
+Normalización de reseñas y supresión de duplicados
+Autor: Jaime Sánchez Cotta
+Última actualización: 18/10/2026
+
+Este archivo contiene la etapa de preprocesado que se aplica a las reseñas antes de agruparlas en lotes para los
+modelos. Cada texto se normaliza (Unicode, espacios, el botón "Más" que Google añade al expandir una reseña y las
+marcas "(Translated by Google)" / "(Original)" de las reseñas traducidas, de las que se conserva una sola parte) y
+las reseñas repetidas se detectan con la clase ReviewDeduplicator: las idénticas por su texto completo (sin distinguir
+mayúsculas ni espacios, pero con signos y emojis) y las casi idénticas (la misma reseña capturada dos veces con pequeñas
+diferencias) buscando candidatas por la distancia de Hamming entre sus huellas SimHash y confirmándolas con la similitud
+de Jaccard de sus pares de palabras. La similitud no basta para distinguir reseñas de polaridad opuesta ("was great" /
+"was not great", "10/10" / "1/10"), así que además lo que cambia no puede incluir negaciones, números ni emojis y,
+salvo erratas, solo se admiten unas pocas palabras en proporción a la longitud de la reseña.
+Las duplicadas no se envían a los modelos ni cuentan dos veces en el agregado de un listado.
+"""
+
+import hashlib
+import os
+import re
+import unicodedata
+from collections import Counter
+from difflib import SequenceMatcher
+
+from metrics import DUPLICATE_REVIEWS
+
+TEXT_NORMALIZATION = os.getenv("SENTIMENT_TEXT_NORMALIZATION", "1") == "1"
+DEDUPLICATION = os.getenv("SENTIMENT_DEDUPLICATION", "1") == "1"
+# Bits distintos como máximo entre dos huellas de 64 bits para comparar dos reseñas (-1 desactiva las casi idénticas)
+DEDUP_MAX_DISTANCE = int(os.getenv("SENTIMENT_DEDUP_MAX_DISTANCE", "10"))
+# Similitud de Jaccard mínima entre los pares de palabras de dos candidatas
+DEDUP_MIN_SIMILARITY = float(os.getenv("SENTIMENT_DEDUP_MIN_SIMILARITY", "0.8"))
+# Palabras añadidas o quitadas (sin contar las erratas) que se admiten por cada palabra de la reseña
+DEDUP_MAX_CHANGED_RATIO = float(os.getenv("SENTIMENT_DEDUP_MAX_CHANGED_RATIO", "0.05"))
+# Similitud mínima entre una palabra quitada y una añadida para tratarlas como una errata
+DEDUP_TYPO_SIMILARITY = 0.75
+# Las reseñas más cortas solo se comparan de forma exacta: en textos cortos una palabra cambia el sentido
+DEDUP_MIN_TOKENS = int(os.getenv("SENTIMENT_DEDUP_MIN_TOKENS", "8"))
+# Parte que se conserva de una reseña traducida por Google: translation u original
+TRANSLATED_REVIEW_PART = os.getenv("SENTIMENT_TRANSLATED_REVIEW_PART", "translation")
+
+SIMHASH_BITS = 64
+
+_TRANSLATED_REVIEW = re.compile(r"^\s*\((?:Translated by Google|Traducido por Google)\)\s*(.*?)\s*\(Original\)\s*(.*)$",
+                                re.IGNORECASE | re.DOTALL)
+_TRANSLATION_MARKER = re.compile(r"\((?:Translated by Google|Traducido por Google|Original)\)", re.IGNORECASE)
+# El botón de expandir solo se elimina tras puntos suspensivos o en su propia línea, no al final de una frase cualquiera
+_MORE_BUTTON = re.compile(r"(?:(?:…|\.\.\.)\s*|\n\s*)(?:More|Más|Read more|Leer más|Ver más|Show more|Mostrar más)\s*$",
+                          re.IGNORECASE)
+_INVISIBLE = dict.fromkeys(map(ord, "​‌‍⁠﻿"))
+# Palabras y caracteres sueltos que no son palabra ni espacio; de estos solo se conservan los símbolos (emojis, signos)
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+# Una negación añadida o quitada invierte el sentido de la reseña: nunca son duplicadas ("t" es la de "don't")
+NEGATIONS = frozenset("""
+    not no never nothing nobody none nor neither without cannot t
+    dont didnt doesnt isnt wasnt arent werent cant couldnt wont wouldnt shouldnt havent hasnt hadnt aint
+    nunca jamás jamas nada nadie ni tampoco sin ningún ningun ninguno ninguna
+""".split())
+
+
+# --------------------- Normalización --------------------- #
+def normalize_review(text):
+    if not TEXT_NORMALIZATION or not isinstance(text, str):
+        return text
+    text = unicodedata.normalize("NFKC", text).translate(_INVISIBLE)
+    translated = _TRANSLATED_REVIEW.match(text)
+    if translated:
+        translation, original = translated.groups()
+        text = original if TRANSLATED_REVIEW_PART == "original" and original.strip() else translation
+    text = _MORE_BUTTON.sub("", _TRANSLATION_MARKER.sub(" ", text))
+    return " ".join(text.split())
+
+
+def is_symbol(token):
+    return len(token) == 1 and unicodedata.category(token).startswith("S")
+
+
+def review_tokens(text):
+    # Palabras y símbolos en minúsculas, sin signos de puntuación
+    return [token for token in _TOKEN.findall(text.casefold()) if token[0].isalnum() or token[0] == "_" or is_symbol(token)]
+
+
+def exact_key(text):
+    # Clave de las duplicadas exactas: el texto completo sin distinguir mayúsculas ni espacios; la puntuación y los
+    # emojis cuentan, porque "Great 👍" y "Great 👎" no son la misma reseña
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def shingles(tokens):
+    # Pares de palabras consecutivas (la palabra suelta si solo hay una)
+    return set(zip(tokens, tokens[1:])) or set(tokens)
+
+
+def changed_words(tokens, other_tokens):
+    # Palabras quitadas y añadidas entre dos reseñas, contando las repeticiones
+    counts, other_counts = Counter(tokens), Counter(other_tokens)
+    return list((counts - other_counts).elements()), list((other_counts - counts).elements())
+
+
+def changes_meaning(token):
+    # Negaciones, números (puntuaciones como "1/10") y emojis: si cambian, cambia el sentido de la reseña
+    return token in NEGATIONS or is_symbol(token) or any(char.isdigit() for char in token)
+
+
+def same_meaning(tokens, other_tokens, max_changed_ratio=DEDUP_MAX_CHANGED_RATIO):
+    # Dos reseñas parecidas solo son la misma si no cambia ninguna negación, número ni emoji y las demás diferencias
+    # son erratas o unas pocas palabras en proporción a la longitud
+    removed, added = changed_words(tokens, other_tokens)
+    if any(changes_meaning(token) for token in removed + added):
+        return False
+    unmatched = 0
+    for word in removed:
+        typo = next((candidate for candidate in added
+                     if SequenceMatcher(None, word, candidate).ratio() >= DEDUP_TYPO_SIMILARITY), None)
+        if typo is None:
+            unmatched += 1
+        else:
+            added.remove(typo)
+    unmatched += len(added)
+    return unmatched <= int(max(len(tokens), len(other_tokens)) * max_changed_ratio)
+
+
+def simhash(tokens):
+    # Huella de 64 bits de las palabras: cada bit es el voto mayoritario de ese bit en los hashes de las palabras
+    rows = [format(int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big"), "064b")
+            for token in tokens]
+    threshold = len(rows) / 2
+    return int("".join("1" if column.count("1") > threshold else "0" for column in zip(*rows)), 2)
+
+
+# --------------------- Detección de duplicados --------------------- #
+class ReviewDeduplicator:
+    # Representantes vistos hasta ahora; add() indica a qué representante corresponde cada texto normalizado
+    def __init__(self, max_distance=DEDUP_MAX_DISTANCE, min_similarity=DEDUP_MIN_SIMILARITY, min_tokens=DEDUP_MIN_TOKENS):
+        self.max_distance = max_distance
+        self.min_similarity = min_similarity
+        self.min_tokens = min_tokens
+        self.texts = []
+        self.duplicates = {"exact": 0, "near": 0}
+        self._exact = {}
+        self._fingerprints = []
+        self._shingles = []
+        self._tokens = []
+        # Con d bits distintos como máximo, dos huellas coinciden por completo en al menos una de d + 1 bandas
+        self._band_count = max_distance + 1 if max_distance >= 0 else 0
+        self._band_bits = SIMHASH_BITS // self._band_count if self._band_count else 0
+        self._bands = [{} for _ in range(self._band_count)]
+
+    def _band_keys(self, fingerprint):
+        mask = (1 << self._band_bits) - 1
+        return [fingerprint >> (band * self._band_bits) & mask for band in range(self._band_count)]
+
+    def _near(self, fingerprint, band_keys, text_shingles, tokens):
+        checked = set()
+        for band, key in zip(self._bands, band_keys):
+            for index in band.get(key, ()):
+                if index in checked:
+                    continue
+                checked.add(index)
+                if bin(fingerprint ^ self._fingerprints[index]).count("1") > self.max_distance:
+                    continue
+                other = self._shingles[index]
+                if (len(text_shingles & other) >= self.min_similarity * len(text_shingles | other)
+                        and same_meaning(tokens, self._tokens[index])):
+                    return index
+        return None
+
+    def add(self, text):
+        # (índice del representante, si el texto es nuevo)
+        tokens = review_tokens(text)
+        text_key = exact_key(text)
+        index = self._exact.get(text_key)
+        if index is not None:
+            self.duplicates["exact"] += 1
+            return index, False
+
+        fingerprint = band_keys = text_shingles = None
+        if self._band_count and len(tokens) >= self.min_tokens:
+            fingerprint = simhash(tokens)
+            band_keys = self._band_keys(fingerprint)
+            text_shingles = shingles(tokens)
+            index = self._near(fingerprint, band_keys, text_shingles, tokens)
+            if index is not None:
+                self._exact[text_key] = index
+                self.duplicates["near"] += 1
+                return index, False
+
+        index = len(self.texts)
+        self.texts.append(text)
+        self._exact[text_key] = index
+        self._fingerprints.append(fingerprint)
+        self._shingles.append(text_shingles)
+        self._tokens.append(tokens if fingerprint is not None else None)
+        if fingerprint is not None:
+            for band, key in zip(self._bands, band_keys):
+                band.setdefault(key, []).append(index)
+        return index, True
+
+    def record(self, stage):
+        # Suma a las métricas los duplicados detectados desde la última llamada
+        for kind, count in self.duplicates.items():
+            if count:
+                DUPLICATE_REVIEWS.inc(count, kind=kind, stage=stage)
+        self.duplicates = {"exact": 0, "near": 0}
+
+
+def prepare_reviews(reviews, stage="batch"):
+    # Textos normalizados sin repetir y, para cada reseña de la entrada, el índice de su texto en esa lista
+    texts = [normalize_review(review) for review in reviews]
+    if not DEDUPLICATION:
+        return texts, list(range(len(texts)))
+    deduplicator = ReviewDeduplicator()
+    owners = [deduplicator.add(text)[0] for text in texts]
+    deduplicator.record(stage)
+    return deduplicator.texts, owners
+
+
+def drop_duplicates(reviews, deduplicator=None, stage="listing"):
+    # Reseñas originales sin las repetidas (se conserva la primera aparición) y número de descartadas
+    if not DEDUPLICATION:
+        return list(reviews), 0
+    deduplicator = deduplicator if deduplicator is not None else ReviewDeduplicator()
+    kept = [review for review in reviews if deduplicator.add(normalize_review(review))[1]]
+    deduplicator.record(stage)
+    return kept, len(reviews) - len(kept)
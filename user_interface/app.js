@@ -1,7 +1,7 @@
 /*
 Aplicación JavaScript
 Autor: Jaime Sánchez Cotta
-Última actualización: 25/06/2024
+Última actualización: 18/10/2026
 
 Este archivo contiene el código JavaScript necesario para el funcionamiento de la aplicación web. 
 Se encarga de manejar la lógica del lado del cliente, incluyendo la interacción con el DOM, 
@@ -16,6 +16,9 @@ Además, se incluyen funciones para cargar proyectos, manejar la creación de nu
 //const BASE_URL = "http://127.0.0.1:8000"; // IP Local
 const BASE_URL = window.location.origin;
 
+// Plazo máximo (segundos) que el servidor dedica al análisis de una URL antes de devolver el resultado parcial
+const REQUEST_TIMEOUT_S = 90;
+
 // Declaración global de variables para no volver a consultar la emocion previa
 let lastEmotionsData = null;
 let lastProjectName = '';
@@ -43,14 +46,13 @@ document.getElementById("urlForm").addEventListener("submit", async function(eve
     console.log("Valor de opcionInput:", opcionInput);
     console.log("Valor de projectName:", projectName);
     
-    let timeoutId; // Variable para almacenar el identificador del temporizador
-
     try {
-        // Realizar una solicitud POST para predecir las reseñas desde la URL
-        const responseQ = fetch(`${BASE_URL}/predict_reviews_from_url`, {
+        // Realizar una solicitud POST al endpoint en streaming: los resultados llegan reseña a reseña (NDJSON)
+        const response = await fetch(`${BASE_URL}/predict_reviews_from_url/stream`, {
             method: "POST",
             headers: {
-                "Content-Type": "application/json; charset=utf-8"
+                "Content-Type": "application/json; charset=utf-8",
+                "X-Request-Timeout": String(REQUEST_TIMEOUT_S)
             },
             body: JSON.stringify({
                 "url": {
@@ -65,33 +67,56 @@ document.getElementById("urlForm").addEventListener("submit", async function(eve
             })
         });
 
-        // Establecer el tiempo de espera para mostrar el mensaje de retrying
-        timeoutId = setTimeout(() => {
-            if (!document.getElementById("reviewTextContainer").innerText) {
-                document.getElementById("reviewTextContainer").innerText = "Something went wrong, retrying...";
-            }
-        }, 25000);
-
-        // Esperar la respuesta
-        const response = await responseQ;
-        clearTimeout(timeoutId); // Limpiar el temporizador si la respuesta llega antes del tiempo de espera
+        // Los errores de validación se devuelven como un JSON normal, sin streaming
+        if (!(response.headers.get("Content-Type") || "").includes("ndjson")) {
+            const data = await response.json();
+            document.getElementById("progressBar").style.width = "0";
+            document.getElementById("resultado").innerText = "Error: " + data.error;
+            return;
+        }
 
-        const data = await response.json();
+        document.getElementById("reviewTextContainer").innerText = "Analyzing reviews...";
+
+        // Leer el flujo línea a línea y mostrar el agregado en curso
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder("utf-8");
+        let buffer = '';
+        let finalData = null;
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split("\n");
+            buffer = lines.pop();
+            for (const line of lines) {
+                if (!line.trim()) {
+                    continue;
+                }
+                const event = JSON.parse(line);
+                if (event.type === "aggregate") {
+                    document.getElementById("resultado").innerText = `${formatAnalysis(event)}\nReviews analyzed: ${event.Reviews}`;
+                } else if (event.type === "final" || event.type === "error") {
+                    finalData = event;
+                }
+            }
+        }
 
         // Ocultar la barra de carga
         document.getElementById("progressBar").style.width = "0";
 
         // Comprobar si hay un error en la respuesta
-        if (data.error) {
+        if (!finalData || finalData.error) {
             // Mostrar el error al usuario
-            document.getElementById("resultado").innerText = "Error: " + data.error;
+            document.getElementById("reviewTextContainer").innerText = '';
+            document.getElementById("resultado").innerText = "Error: " + (finalData ? finalData.error : "Connection closed before the analysis finished");
         } else {
             // Construir el mensaje a mostrar
-            const message = `Sentiment Label: ${data["Analisis Label"]}\nScore: ${data.Score.toFixed(4)}\nEmotion Label: ${data["Emotion Label"]}\nEmotion Score: ${data["Emotion Score"].toFixed(4)}`;
-            document.getElementById("resultado").innerText = message;
+            document.getElementById("resultado").innerText = formatAnalysis(finalData);
             // Mostrar el texto de la reseña
-            if (data["Review Text"]) {
-                document.getElementById("reviewTextContainer").innerText = `Review Text:\n${data["Review Text"]}`;
+            if (finalData["Review Text"]) {
+                document.getElementById("reviewTextContainer").innerText = `Review Text:\n${finalData["Review Text"]}`;
             }
             // Actualizar las emociones para el proyecto seleccionado
             const projectName = document.getElementById("projectSelect").value;
@@ -100,14 +125,18 @@ document.getElementById("urlForm").addEventListener("submit", async function(eve
         }
     } catch (error) {
         console.error("Error fetching data:", error);
+        document.getElementById("progressBar").style.width = "0";
         if (!document.getElementById("resultado").innerText) {
-            document.getElementById("resultado").innerText = "Something went wrong, retrying...";
+            document.getElementById("resultado").innerText = "Something went wrong, please try again.";
         }
-    } finally {
-        clearTimeout(timeoutId); // Limpiar el temporizador en caso de cualquier excepción
     }
 });
 
+// Formatear el resultado de un análisis (agregado en curso o final)
+function formatAnalysis(data) {
+    return `Sentiment Label: ${data["Analisis Label"]}\nScore: ${data.Score.toFixed(4)}\nEmotion Label: ${data["Emotion Label"]}\nEmotion Score: ${data["Emotion Score"].toFixed(4)}`;
+}
+
 
 
 // --------------------- Código para el formulario de texto raw --------------------- //